@@ -0,0 +1,235 @@
+"""
+Benchmarks the stages of the brep_to_h5m pipeline on synthetic Brep files.
+
+Each Brep file is an n x n x n grid of cubes with a sphere cut into the
+middle of every cube. The cubes are fragmented so neighbouring cubes share
+their faces, like the merged Brep files exported by the Paramak. Every
+stage runs in a new process so that the peak memory of one stage does not
+carry over to the next. The surface mesh is passed from the meshing stage
+to the writing stages in a .npz file. As well as the peak memory of the
+process, each stage records how much the peak grew during the stage, which
+leaves out the imports and the loading of the surface mesh.
+
+Example usage:
+    python benchmarks/benchmark_brep_to_h5m.py --grid-sizes 1 2 3 --mesh-sizes 2 1 --output results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+
+def make_brep_file(brep_filename: str, grid_size: int, cube_size: float = 10):
+    """Makes a Brep file of a grid of cubes that share faces, each with a
+    spherical void cut out of it and a sphere filling the void.
+
+    Args:
+        brep_filename: the filename of the Brep file to write
+        grid_size: the number of cubes along each axis
+        cube_size: the edge length of each cube
+    """
+
+    import gmsh
+
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.model.add("benchmark")
+
+    shapes = []
+    for i in range(grid_size):
+        for j in range(grid_size):
+            for k in range(grid_size):
+                x, y, z = i * cube_size, j * cube_size, k * cube_size
+                box = gmsh.model.occ.addBox(x, y, z, cube_size, cube_size, cube_size)
+                sphere = gmsh.model.occ.addSphere(
+                    x + cube_size / 2,
+                    y + cube_size / 2,
+                    z + cube_size / 2,
+                    cube_size / 4,
+                )
+                shapes += [(3, box), (3, sphere)]
+
+    # fragmenting imprints and merges the shared faces between the volumes
+    gmsh.model.occ.fragment(shapes[:1], shapes[1:])
+    gmsh.model.occ.synchronize()
+    gmsh.write(brep_filename)
+    gmsh.finalize()
+
+
+def run_stage(
+    stage: str, brep_filename: str, mesh_size: float, output_dir: str
+) -> dict:
+    """Runs one stage of the pipeline, which should be done in a new process
+    so the peak memory is that of the stage. The mesh_brep stage saves the
+    surface mesh to the output_dir for the writing stages to load.
+
+    Args:
+        stage: the name of the brep_to_h5m function to run
+        brep_filename: the filename of the Brep file to convert
+        mesh_size: used as both the min_mesh_size and max_mesh_size
+        output_dir: the folder to write the surface mesh and h5m files to
+
+    Returns:
+        The time taken, the peak memory and the increase in the peak memory
+        during the stage, and the size of the output
+    """
+
+    import brep_to_h5m
+    from brep_to_h5m import SurfaceMesh
+    from brep_to_h5m.instrumentation import peak_rss_mb
+
+    function = getattr(brep_to_h5m, stage)
+    mesh_filename = Path(output_dir) / "surface_mesh.npz"
+    h5m_filename = str(Path(output_dir) / f"{stage}.h5m")
+
+    if stage == "mesh_brep":
+        kwargs = dict(
+            brep_filename=brep_filename,
+            min_mesh_size=mesh_size,
+            max_mesh_size=mesh_size,
+        )
+    else:
+        # the writing backends are imported before the stage so that their
+        # memory is not counted in it
+        import trimesh
+        from brep_to_h5m import h5m
+
+        surface_mesh = SurfaceMesh.load(mesh_filename)
+        kwargs = dict(
+            surface_mesh=surface_mesh,
+            material_tags=[f"mat_{n}" for n in range(1, len(surface_mesh.volumes) + 1)],
+            h5m_filename=h5m_filename,
+        )
+
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    returned = function(**kwargs)
+    wall_time = time.perf_counter() - start
+    peak_after = peak_rss_mb()
+
+    if stage == "mesh_brep":
+        returned.save(mesh_filename)
+        output_filename = mesh_filename
+    else:
+        output_filename = h5m_filename
+
+    return {
+        "stage": stage,
+        "wall_time_s": wall_time,
+        "peak_rss_mb": peak_after,
+        "peak_rss_increase_mb": (
+            None if peak_before is None else peak_after - peak_before
+        ),
+        "output_size_bytes": Path(output_filename).stat().st_size,
+    }
+
+
+def run_case(brep_filename: str, mesh_size: float, output_dir: str) -> dict:
+    """Runs every stage of the pipeline on a Brep file, each in a new
+    process.
+
+    Args:
+        brep_filename: the filename of the Brep file to convert
+        mesh_size: used as both the min_mesh_size and max_mesh_size
+        output_dir: the folder to write the surface mesh and h5m files to
+
+    Returns:
+        The results for each stage
+    """
+
+    from brep_to_h5m import SurfaceMesh
+
+    # spawn gives every stage a fresh process so the peak memory is per stage
+    context = multiprocessing.get_context("spawn")
+
+    stages = []
+    for stage in [
+        "mesh_brep",
+        "mesh_to_h5m_in_memory_method",
+        "mesh_to_h5m_stl_method",
+    ]:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            stages.append(
+                pool.apply(run_stage, (stage, brep_filename, mesh_size, output_dir))
+            )
+
+    surface_mesh = SurfaceMesh.load(Path(output_dir) / "surface_mesh.npz")
+    for stage in stages:
+        stage["triangles"] = surface_mesh.number_of_triangles
+        stage["vertices"] = len(surface_mesh.vertices)
+
+    return {
+        "volumes": len(surface_mesh.volumes),
+        "surfaces": len(surface_mesh.surface_triangles),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--grid-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 2, 3],
+        help="number of cubes along each axis, each cube makes two volumes",
+    )
+    parser.add_argument(
+        "--mesh-sizes",
+        type=float,
+        nargs="+",
+        default=[4, 2, 1],
+        help="mesh sizes to use as both the min and max mesh size",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        help="the filename of the JSON results file",
+    )
+    args = parser.parse_args()
+
+    import gmsh
+
+    import brep_to_h5m
+
+    results = {
+        "brep_to_h5m_version": brep_to_h5m.__version__,
+        "gmsh_version": gmsh.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": [],
+    }
+
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for grid_size in args.grid_sizes:
+            brep_filename = str(Path(tmp_dir) / f"grid_{grid_size}.brep")
+            with context.Pool(1) as pool:
+                pool.apply(make_brep_file, (brep_filename, grid_size))
+
+            for mesh_size in args.mesh_sizes:
+                case = run_case(brep_filename, mesh_size, tmp_dir)
+                case.update({"grid_size": grid_size, "mesh_size": mesh_size})
+                results["cases"].append(case)
+
+                summary = ", ".join(
+                    f"{s['stage']} {s['wall_time_s']:.2f}s" for s in case["stages"]
+                )
+                print(
+                    f"grid {grid_size} mesh size {mesh_size}: {case['volumes']} "
+                    f"volumes, {case['stages'][0]['triangles']} triangles, {summary}"
+                )
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,62 @@
-try:
-    from importlib.metadata import version, PackageNotFoundError
-except (ModuleNotFoundError, ImportError):
-    from importlib_metadata import version, PackageNotFoundError
-try:
-    __version__ = version("brep_to_h5m")
-except PackageNotFoundError:
-    from setuptools_scm import get_version
+"""
+The submodules are imported when one of their functions is first used, so
+importing brep_to_h5m does not import Gmsh, trimesh or PyMOAB. Tools that
+only use the cache or write an existing SurfaceMesh never import Gmsh.
+"""
 
-    __version__ = get_version(root="..", relative_to=__file__)
+import importlib
 
-__all__ = ["__version__"]
+# the module each public name is imported from when it is first used
+_LAZY_ATTRIBUTES = {
+    "brep_to_h5m": "core",
+    "brep_to_h5m_async": "asynchronous",
+    "mesh_brep": "core",
+    "mesh_brep_in_parallel": "core",
+    "mesh_brep_incremental": "core",
+    "mesh_to_h5m_in_memory_method": "core",
+    "mesh_to_h5m_streaming_method": "core",
+    "mesh_to_h5m_stl_method": "core",
+    "transport_particles_on_h5m_geometry": "transport",
+    "transport_particles_on_h5m_geometries": "transport",
+    "gmsh_session": "core",
+    "ConversionPool": "pool",
+    "SurfaceMesh": "surface_mesh",
+}
 
-from .core import *
+# the submodules that were available as attributes before the lazy imports
+_LAZY_SUBMODULES = ["core"]
+
+__all__ = ["__version__", *_LAZY_ATTRIBUTES]
+
+
+def _get_version() -> str:
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except (ModuleNotFoundError, ImportError):
+        from importlib_metadata import version, PackageNotFoundError
+    try:
+        return version("brep_to_h5m")
+    except PackageNotFoundError:
+        from setuptools_scm import get_version
+
+        return get_version(root="..", relative_to=__file__)
+
+
+def __getattr__(name: str):
+    if name == "__version__":
+        value = _get_version()
+    elif name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        value = getattr(module, name)
+    elif name in _LAZY_SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # later lookups find the attribute without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_LAZY_SUBMODULES))
@@ -0,0 +1,194 @@
+"""
+An asyncio API that runs each conversion in a worker process so the event
+loop of a service is not blocked while a Brep file is meshed and written.
+The worker is started with
+
+    python -m brep_to_h5m.asynchronous
+
+and reads the arguments of brep_to_h5m as JSON from stdin. It writes one
+JSON message per line to stdout: the progress events followed by the
+filename of the h5m file or the error raised.
+"""
+
+import asyncio
+import collections
+import inspect
+import json
+import os
+import sys
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Union
+
+# the time a cancelled worker is given to exit before it is killed
+_TERMINATE_TIMEOUT_S = 5
+
+
+async def brep_to_h5m_async(
+    brep_filename: str,
+    material_tags: Union[Iterable[str], Dict[str, Union[dict, List[dict]]]],
+    h5m_filename: str = "dagmc.h5m",
+    progress_callback: Callable[[dict], None] = None,
+    semaphore: asyncio.Semaphore = None,
+    **kwargs,
+) -> str:
+    """Converts a Brep file into a DAGMC h5m file with brep_to_h5m in a
+    worker process. Cancelling the task stops the worker, which stops Gmsh
+    part way through meshing, and removes the partly written h5m file.
+
+    Args:
+        brep_filename: the filename of the Brep file to convert
+        material_tags: A list of material tags to tag the DAGMC volumes with.
+            Should be in the same order as the volumes. Alternatively a
+            dictionary of the expected properties of the parts with each
+            material, which are matched to the volumes, see brep_to_h5m.
+        h5m_filename: the filename of the DAGMC h5m file to write
+        progress_callback: a function, or coroutine function, called with
+            each progress event of the worker, see brep_to_h5m
+        semaphore: if set, the conversion waits for the semaphore before
+            starting the worker, which limits the number of conversions
+            running at the same time
+        kwargs: the other arguments of brep_to_h5m, which must be JSON
+            serializable
+
+    Returns:
+        The filename of the h5m file produced
+    """
+
+    job = dict(
+        kwargs,
+        brep_filename=str(brep_filename),
+        material_tags=(
+            material_tags if isinstance(material_tags, dict) else list(material_tags)
+        ),
+        h5m_filename=str(h5m_filename),
+    )
+
+    if semaphore is None:
+        return await _run_worker(job, progress_callback)
+    async with semaphore:
+        return await _run_worker(job, progress_callback)
+
+
+async def _run_worker(job: dict, progress_callback: Callable[[dict], None]) -> str:
+    """Runs a conversion in a worker process and passes on its events"""
+
+    h5m_filename = Path(job["h5m_filename"])
+    existed = h5m_filename.exists()
+
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "brep_to_h5m.asynchronous",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        # events listing every volume can be longer than the default limit
+        limit=2**24,
+    )
+    # the end of the Gmsh output is kept for the error message
+    stderr_tail = collections.deque(maxlen=20)
+    stderr_task = asyncio.ensure_future(_read_lines(process.stderr, stderr_tail))
+
+    result = {}
+    try:
+        process.stdin.write(json.dumps(job, default=str).encode() + b"\n")
+        await process.stdin.drain()
+        process.stdin.close()
+
+        async for line in process.stdout:
+            message = json.loads(line)
+            if "event" not in message:
+                result = message
+            elif progress_callback is not None:
+                returned = progress_callback(message["event"])
+                if inspect.isawaitable(returned):
+                    await returned
+
+        await process.wait()
+        await stderr_task
+    except BaseException:
+        # includes asyncio.CancelledError
+        await _stop(process)
+        stderr_task.cancel()
+        if not existed and h5m_filename.exists():
+            h5m_filename.unlink()
+        raise
+
+    if "error" in result:
+        raise RuntimeError(f"{result['error']}\n{result['traceback']}")
+    if "h5m_filename" not in result:
+        msg = (
+            f"the worker process exited with code {process.returncode} "
+            "without converting the Brep file:\n" + "".join(stderr_tail)
+        )
+        raise RuntimeError(msg)
+
+    return result["h5m_filename"]
+
+
+async def _read_lines(stream: asyncio.StreamReader, lines: collections.deque):
+    """Reads a stream to the end, keeping the last lines"""
+
+    async for line in stream:
+        lines.append(line.decode(errors="replace"))
+
+
+async def _stop(process: asyncio.subprocess.Process):
+    """Terminates a worker process, killing it if it does not exit in time"""
+
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), _TERMINATE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def _worker() -> int:
+    """Converts the Brep file of the job read from stdin, writing the
+    progress events and result to stdout as JSON lines"""
+
+    messages = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    # Gmsh prints to stdout, which is moved to stderr so that the messages
+    # are the only output on the pipe
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message: dict):
+        messages.write(json.dumps(message, default=_to_json) + "\n")
+        messages.flush()
+
+    job = json.loads(sys.stdin.readline())
+
+    try:
+        from brep_to_h5m import brep_to_h5m
+
+        h5m_filename = brep_to_h5m(
+            **job, progress_callback=lambda event: send({"event": event})
+        )
+    except Exception as error:
+        send(
+            {
+                "error": f"{type(error).__name__}: {error}",
+                "traceback": traceback.format_exc(),
+            }
+        )
+        return 1
+
+    send({"h5m_filename": str(h5m_filename)})
+    return 0
+
+
+def _to_json(value):
+    """Converts the numpy values in progress events to JSON types"""
+
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+if __name__ == "__main__":
+    sys.exit(_worker())
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .surface_mesh import SurfaceMesh
+
+# increment when the layout of the cached files changes
+CACHE_FORMAT_VERSION = 3
+
+
+def mesh_cache_key(
+    brep_filename: str,
+    min_mesh_size: float,
+    max_mesh_size: float,
+    mesh_algorithm: int,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+) -> str:
+    """Creates a key that identifies the surface mesh of a Brep file. The key
+    is made from the content of the Brep file, the meshing parameters and the
+    Gmsh version so that renamed files still hit the cache while edited files
+    or different meshing settings miss it.
+
+    Args:
+        brep_filename: the filename of the Brep file
+        min_mesh_size: the minimum mesh element size used in Gmsh
+        max_mesh_size: the maximum mesh element size used in Gmsh
+        mesh_algorithm: The Gmsh mesh algorithm number used
+        volume_mesh_sizes: the mesh element sizes of some of the volumes,
+            keyed by gmsh volume tag
+        tolerance: the maximum deviation from the CAD surfaces used
+
+    Returns:
+        The hex digest to use as the cache key
+    """
+
+    file_hash = hashlib.sha256()
+    with open(brep_filename, "rb") as brep_file:
+        for chunk in iter(lambda: brep_file.read(1 << 20), b""):
+            file_hash.update(chunk)
+
+    parameters = {
+        "brep_sha256": file_hash.hexdigest(),
+        "min_mesh_size": float(min_mesh_size),
+        "max_mesh_size": float(max_mesh_size),
+        "mesh_algorithm": int(mesh_algorithm),
+    }
+    # only added when set so the keys of meshes without them do not change
+    if volume_mesh_sizes:
+        parameters["volume_mesh_sizes"] = sorted(
+            [int(vol_id), float(size)] for vol_id, size in volume_mesh_sizes.items()
+        )
+    if tolerance is not None:
+        parameters["tolerance"] = float(tolerance)
+
+    return _hash_parameters(parameters)
+
+
+def component_cache_key(
+    volume_fingerprints: Iterable[str],
+    min_mesh_size: float,
+    max_mesh_size: float,
+    mesh_algorithm: int,
+    volume_mesh_sizes: Iterable[Optional[float]] = None,
+    tolerance: float = None,
+) -> str:
+    """Creates a key that identifies the surface mesh of a group of volumes
+    connected by shared surfaces. The key is made from the geometry of the
+    volumes rather than the Brep file, so the mesh of an unchanged group can
+    be reused when other parts of the Brep file change.
+
+    Args:
+        volume_fingerprints: the fingerprint of each volume in the group,
+            found with volume_fingerprint
+        min_mesh_size: the minimum mesh element size used in Gmsh
+        max_mesh_size: the maximum mesh element size used in Gmsh
+        mesh_algorithm: The Gmsh mesh algorithm number used
+        volume_mesh_sizes: the mesh element size of each volume in the same
+            order as the volume_fingerprints, None where it is not set
+        tolerance: the maximum deviation from the CAD surfaces used
+
+    Returns:
+        The hex digest to use as the cache key
+    """
+
+    volume_fingerprints = list(volume_fingerprints)
+    if volume_mesh_sizes is None:
+        volume_mesh_sizes = [None] * len(volume_fingerprints)
+
+    return _hash_parameters(
+        {
+            "volume_fingerprints": sorted(
+                zip(volume_fingerprints, volume_mesh_sizes), key=lambda v: v[0]
+            ),
+            "min_mesh_size": float(min_mesh_size),
+            "max_mesh_size": float(max_mesh_size),
+            "mesh_algorithm": int(mesh_algorithm),
+            "tolerance": tolerance,
+        }
+    )
+
+
+def _hash_parameters(parameters: dict) -> str:
+    """Hashes the parameters together with the Gmsh and cache format versions"""
+
+    parameters = dict(
+        parameters,
+        gmsh_version=_gmsh_version(),
+        cache_format_version=CACHE_FORMAT_VERSION,
+    )
+
+    return hashlib.sha256(
+        json.dumps(parameters, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _gmsh_version() -> str:
+    """Finds the Gmsh version from the package metadata, which avoids
+    importing Gmsh when only looking up a cached mesh"""
+
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except (ModuleNotFoundError, ImportError):
+        from importlib_metadata import version, PackageNotFoundError
+    try:
+        return version("gmsh")
+    except PackageNotFoundError:
+        import gmsh
+
+        return gmsh.__version__
+
+
+def entity_fingerprint(dim: int, tag: int) -> str:
+    """Describes the geometry of an OCC entity in the current Gmsh model by
+    its type, mass (volume or area), centre of mass and bounding box. The
+    fingerprint does not depend on the tag so it matches the same entity in
+    an edited Brep file.
+
+    Args:
+        dim: the dimension of the entity, 2 for surfaces and 3 for volumes
+        tag: the tag of the entity
+
+    Returns:
+        The fingerprint of the entity
+    """
+
+    import gmsh
+
+    values = [
+        gmsh.model.occ.getMass(dim, tag),
+        *gmsh.model.occ.getCenterOfMass(dim, tag),
+        *gmsh.model.occ.getBoundingBox(dim, tag),
+    ]
+    # rounded so that floating point noise does not change the fingerprint
+    return gmsh.model.getType(dim, tag) + ":" + ",".join(f"{v:.9g}" for v in values)
+
+
+def volume_fingerprint(vol_id: int, surfaces: Iterable[int]) -> str:
+    """Describes a volume and the surfaces bounding it, see entity_fingerprint.
+
+    Args:
+        vol_id: the tag of the gmsh volume
+        surfaces: the tags of the surfaces bounding the volume
+
+    Returns:
+        The fingerprint of the volume
+    """
+
+    surface_fingerprints = sorted(entity_fingerprint(2, s) for s in surfaces)
+    return "|".join([entity_fingerprint(3, vol_id)] + surface_fingerprints)
+
+
+def load_cached_mesh(cache_dir: str, key: str) -> Optional[SurfaceMesh]:
+    """Loads a surface mesh from the cache.
+
+    Args:
+        cache_dir: the folder the cached meshes are saved in
+        key: the cache key of the mesh, found with mesh_cache_key
+
+    Returns:
+        The cached surface mesh or None if the mesh is not in the cache
+    """
+
+    filename = Path(cache_dir) / f"{key}.npz"
+    if not filename.is_file():
+        return None
+
+    surface_mesh = SurfaceMesh.load(filename)
+
+    # marks the file as recently used for the least recently used eviction
+    os.utime(filename)
+
+    return surface_mesh
+
+
+def save_cached_mesh(
+    cache_dir: str,
+    key: str,
+    surface_mesh: SurfaceMesh,
+    max_cache_size: float = 10e9,
+) -> Path:
+    """Saves a surface mesh to the cache and then evicts the least recently
+    used meshes until the cache is smaller than max_cache_size.
+
+    Args:
+        cache_dir: the folder to save the cached meshes in
+        key: the cache key of the mesh, found with mesh_cache_key
+        surface_mesh: the surface mesh to save
+        max_cache_size: the maximum total size of the cached meshes in bytes
+
+    Returns:
+        The filename of the cached mesh
+    """
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    filename = cache_dir / f"{key}.npz"
+
+    # writes to a temporary file first so that concurrent readers never see
+    # a partially written mesh
+    file_handle, tmp_filename = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    with os.fdopen(file_handle, "wb") as tmp_file:
+        surface_mesh.save(tmp_file)
+    os.replace(tmp_filename, filename)
+
+    evict_cached_meshes(cache_dir, max_cache_size)
+
+    return filename
+
+
+def evict_cached_meshes(cache_dir: str, max_cache_size: float):
+    """Deletes the least recently used meshes in the cache until the total
+    size of the cache is no larger than max_cache_size.
+
+    Args:
+        cache_dir: the folder the cached meshes are saved in
+        max_cache_size: the maximum total size of the cached meshes in bytes
+    """
+
+    cached_files = []
+    for filename in Path(cache_dir).glob("*.npz"):
+        try:
+            stat = filename.stat()
+        except FileNotFoundError:  # removed by another process
+            continue
+        cached_files.append((stat.st_mtime, stat.st_size, filename))
+
+    total_size = sum(size for _, size, _ in cached_files)
+    for _, size, filename in sorted(cached_files):
+        if total_size <= max_cache_size:
+            break
+        try:
+            filename.unlink()
+        except FileNotFoundError:
+            pass
+        total_size -= size
@@ -0,0 +1,454 @@
+"""
+The brep-to-h5m command line tool. A single Brep file can be converted with
+
+    brep-to-h5m convert my_model.brep --material-tags steel water
+
+and many Brep files listed in a CSV, JSON or YAML manifest can be converted
+in a pool of worker processes with
+
+    brep-to-h5m batch manifest.csv --workers 8 --report summary.json
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Union
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _to_bool(value) -> bool:
+    """Converts a manifest value such as "true" or "0" to a bool"""
+
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def _to_material_tags(value) -> Union[List[str], Dict[str, Union[dict, List[dict]]]]:
+    """Converts a manifest value to a list of material tags. In CSV files the
+    tags are separated by semicolons. A dictionary of the expected properties
+    of the parts with each material, which brep_to_h5m matches to the
+    volumes, is kept as it is."""
+
+    if isinstance(value, str):
+        return [tag.strip() for tag in value.split(";") if tag.strip()]
+    if isinstance(value, dict):
+        return {str(tag): parts for tag, parts in value.items()}
+    return [str(tag) for tag in value]
+
+
+def _to_mesh_sizes(value) -> Dict[str, float]:
+    """Converts a manifest value to a dictionary of mesh sizes. In CSV files
+    the sizes are written as key=size pairs separated by semicolons"""
+
+    if isinstance(value, str):
+        value = value.replace(";", " ").split()
+    if isinstance(value, list):
+        value = dict(pair.split("=", 1) for pair in value)
+    return {str(key).strip(): float(size) for key, size in value.items()}
+
+
+# the arguments of brep_to_h5m that can be set for each job in a manifest
+JOB_FIELDS = {
+    "brep_filename": str,
+    "material_tags": _to_material_tags,
+    "h5m_filename": str,
+    "min_mesh_size": float,
+    "max_mesh_size": float,
+    "mesh_algorithm": int,
+    "num_threads": int,
+    "mesh_sizes": _to_mesh_sizes,
+    "tolerance": float,
+    "cache_dir": str,
+    "max_cache_size": float,
+    "incremental": _to_bool,
+    "decimate_tolerance": float,
+    "validate": _to_bool,
+    "shared_surfaces": _to_bool,
+    "fix_normals": str,
+    "streaming": _to_bool,
+}
+
+
+def load_manifest(manifest_filename: str) -> List[Dict]:
+    """Reads the conversion jobs from a manifest file. The manifest is a CSV
+    file with a header row, a JSON file containing a list of jobs or a YAML
+    file containing a list of jobs. Each job has a brep_filename and a list
+    of material_tags and can set any other argument of brep_to_h5m, such as
+    min_mesh_size. In CSV files the material tags are separated by
+    semicolons. Relative filenames are relative to the manifest.
+
+    Args:
+        manifest_filename: the filename of the manifest, ending in .csv,
+            .json, .yaml or .yml
+
+    Returns:
+        A list of jobs, each a dictionary of keyword arguments for brep_to_h5m
+    """
+
+    manifest_filename = Path(manifest_filename)
+    suffix = manifest_filename.suffix.lower()
+
+    with open(manifest_filename, newline="") as manifest_file:
+        if suffix == ".csv":
+            rows = list(csv.DictReader(manifest_file))
+        elif suffix == ".json":
+            rows = json.load(manifest_file)
+        elif suffix in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as error:
+                msg = "PyYAML is needed to read YAML manifests, install it with pip install pyyaml"
+                raise ImportError(msg) from error
+            rows = yaml.safe_load(manifest_file)
+        else:
+            msg = f"manifest_filename should end in .csv, .json, .yaml or .yml, not {suffix}"
+            raise ValueError(msg)
+
+    if isinstance(rows, dict):
+        rows = rows.get("jobs", [])
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        unknown_fields = set(row) - set(JOB_FIELDS)
+        if unknown_fields:
+            msg = f"job {number} in {manifest_filename} has unknown fields {sorted(unknown_fields)}"
+            raise ValueError(msg)
+
+        # empty CSV cells use the default value of the argument
+        job = {
+            field: JOB_FIELDS[field](value)
+            for field, value in row.items()
+            if value is not None and value != ""
+        }
+        if "brep_filename" not in job or "material_tags" not in job:
+            msg = f"job {number} in {manifest_filename} needs a brep_filename and material_tags"
+            raise ValueError(msg)
+
+        job["brep_filename"] = str(manifest_filename.parent / job["brep_filename"])
+        if "h5m_filename" in job:
+            job["h5m_filename"] = str(manifest_filename.parent / job["h5m_filename"])
+        else:
+            job["h5m_filename"] = str(Path(job["brep_filename"]).with_suffix(".h5m"))
+        if "cache_dir" in job:
+            job["cache_dir"] = str(manifest_filename.parent / job["cache_dir"])
+
+        jobs.append(job)
+
+    return jobs
+
+
+def convert_batch(
+    jobs: List[Dict],
+    workers: int = None,
+    retries: int = 1,
+    max_memory_per_worker: float = None,
+    report_filename: str = None,
+) -> List[Dict]:
+    """Converts many Brep files to DAGMC h5m files in a pool of worker
+    processes. Gmsh keeps global state so each worker process runs its own
+    Gmsh session and converts one Brep file at a time. Jobs that fail,
+    including jobs whose worker process crashes, are run again up to retries
+    times. A crashed worker breaks the whole pool, so the jobs it takes down
+    with it are run again one per process to find the job that crashed.
+
+    Args:
+        jobs: the conversion jobs, each a dictionary of keyword arguments for
+            brep_to_h5m, for example found with load_manifest
+        workers: the number of worker processes. If None the number of CPUs
+            is used.
+        retries: the number of times a failed job is run again
+        max_memory_per_worker: the maximum memory in bytes each worker
+            process can allocate. A job that needs more fails with a
+            MemoryError instead of running the machine out of memory. If None
+            the memory is not limited. Only supported on Linux and macOS.
+        report_filename: if set, a JSON summary of the jobs is written to
+            this file
+
+    Returns:
+        The result of each job in the order of the jobs. Each result has the
+        job, a status of "succeeded" or "failed", the number of attempts, the
+        time taken and the error of the last failed attempt.
+    """
+
+    if max_memory_per_worker is not None and resource is None:
+        msg = "max_memory_per_worker is not supported on this platform"
+        raise ValueError(msg)
+
+    results = [
+        {"job": job, "status": "pending", "attempts": 0, "elapsed_s": 0.0}
+        for job in jobs
+    ]
+
+    pending = list(range(len(jobs)))
+    for _ in range(retries + 1):
+        if not pending:
+            break
+        _run_jobs(jobs, pending, results, workers, max_memory_per_worker)
+        pending = [
+            n for n, result in enumerate(results) if result["status"] != "succeeded"
+        ]
+
+    for result in results:
+        if result["status"] != "succeeded":
+            result["status"] = "failed"
+
+    if report_filename is not None:
+        succeeded = sum(result["status"] == "succeeded" for result in results)
+        report = {
+            "jobs": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        }
+        with open(report_filename, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    return results
+
+
+def _run_jobs(
+    jobs: List[Dict],
+    indices: List[int],
+    results: List[Dict],
+    workers: int,
+    max_memory_per_worker: float,
+):
+    """Runs one attempt of each of the jobs at the indices and records the
+    outcome in the results. A worker that crashes breaks the pool and loses
+    the jobs that were running or queued in it, so those jobs are run again
+    one per process and only the job that crashed is failed."""
+
+    lost = _run_pool(jobs, indices, results, workers, max_memory_per_worker)
+    if len(indices) > 1:
+        lost = [
+            n for n in lost if _run_pool(jobs, [n], results, 1, max_memory_per_worker)
+        ]
+
+    for n in lost:
+        _record_attempt(results[n], error="the worker process running this job crashed")
+
+
+def _run_pool(
+    jobs: List[Dict],
+    indices: List[int],
+    results: List[Dict],
+    workers: int,
+    max_memory_per_worker: float,
+) -> List[int]:
+    """Runs the jobs at the indices in a new pool of worker processes and
+    records the outcome of each job that finished in the results.
+
+    Returns:
+        The indices of the jobs lost when a worker crashed, for example with
+        a segfault in Gmsh or by reaching the memory limit, which are not
+        counted as attempts as they may not have started
+    """
+
+    lost = []
+    # spawned workers do not inherit the Gmsh state of this process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(max_memory_per_worker,),
+    ) as executor:
+        futures = {executor.submit(_convert_job, jobs[n]): n for n in indices}
+        for future in as_completed(futures):
+            try:
+                elapsed_s = future.result()
+            except BrokenProcessPool:
+                lost.append(futures[future])
+            except Exception as error:
+                _record_attempt(results[futures[future]], error=str(error))
+            else:
+                _record_attempt(results[futures[future]], elapsed_s=elapsed_s)
+
+    return sorted(lost)
+
+
+def _record_attempt(result: Dict, elapsed_s: float = None, error: str = None):
+    """Records the outcome of one attempt of a job in its result"""
+
+    result["attempts"] += 1
+    if error is None:
+        result["elapsed_s"] = elapsed_s
+        result["status"] = "succeeded"
+        result.pop("error", None)
+        return
+
+    result["error"] = error
+    logging.getLogger("brep_to_h5m").warning(
+        "converting %s failed: %s", result["job"]["brep_filename"], error
+    )
+
+
+def _init_worker(max_memory_per_worker: float = None):
+    """Limits the memory a worker process can allocate"""
+
+    if max_memory_per_worker is not None:
+        limit = int(max_memory_per_worker)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _convert_job(job: Dict) -> float:
+    """Converts the Brep file of a job and returns the time taken"""
+
+    from brep_to_h5m import brep_to_h5m
+
+    start = time.perf_counter()
+    try:
+        brep_to_h5m(**job)
+    except Exception as error:
+        # the traceback is kept as the exception is pickled back to the
+        # parent process without it
+        msg = f"{type(error).__name__}: {error}\n{traceback.format_exc()}"
+        raise RuntimeError(msg) from None
+    return time.perf_counter() - start
+
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="brep-to-h5m",
+        description="Converts Brep CAD geometry files to DAGMC h5m files",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log the progress of each stage"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="convert a Brep file")
+    convert_parser.add_argument("brep_filename", help="the Brep file to convert")
+    convert_parser.add_argument(
+        "--material-tags",
+        nargs="+",
+        required=True,
+        help="the material tag of each volume, in the order of the volumes",
+    )
+    convert_parser.add_argument("--h5m-filename", default="dagmc.h5m")
+    convert_parser.add_argument("--min-mesh-size", type=float, default=30)
+    convert_parser.add_argument("--max-mesh-size", type=float, default=10)
+    convert_parser.add_argument("--mesh-algorithm", type=int, default=1)
+    convert_parser.add_argument("--num-threads", type=int)
+    convert_parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="the maximum distance between the triangles and the CAD surfaces",
+    )
+    convert_parser.add_argument(
+        "--mesh-sizes",
+        nargs="+",
+        help="mesh sizes of some volumes as material_tag=size or volume_tag=size",
+    )
+    convert_parser.add_argument("--processes", type=int)
+    convert_parser.add_argument("--cache-dir")
+    convert_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only mesh the groups of volumes that changed since they were cached",
+    )
+    convert_parser.add_argument(
+        "--decimate-tolerance",
+        type=float,
+        help="decimate the mesh keeping the vertices within this distance",
+    )
+    convert_parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="check the mesh is watertight and consistently oriented before writing",
+    )
+    convert_parser.add_argument("--shared-surfaces", action="store_true")
+    convert_parser.add_argument(
+        "--fix-normals", choices=["topology", "trimesh"], default="topology"
+    )
+    convert_parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="write each volume straight from Gmsh to reduce the peak memory",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="convert the Brep files listed in a manifest"
+    )
+    batch_parser.add_argument(
+        "manifest", help="a CSV, JSON or YAML file listing the conversion jobs"
+    )
+    batch_parser.add_argument(
+        "--workers", type=int, help="the number of worker processes"
+    )
+    batch_parser.add_argument(
+        "--retries", type=int, default=1, help="times a failed job is run again"
+    )
+    batch_parser.add_argument(
+        "--max-memory-per-worker",
+        type=float,
+        help="the maximum memory in GB each worker process can allocate",
+    )
+    batch_parser.add_argument(
+        "--report", help="the filename of the JSON summary report to write"
+    )
+
+    args = parser.parse_args(args)
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.command == "convert":
+        from brep_to_h5m import brep_to_h5m
+
+        brep_to_h5m(
+            brep_filename=args.brep_filename,
+            material_tags=args.material_tags,
+            h5m_filename=args.h5m_filename,
+            min_mesh_size=args.min_mesh_size,
+            max_mesh_size=args.max_mesh_size,
+            mesh_algorithm=args.mesh_algorithm,
+            num_threads=args.num_threads,
+            mesh_sizes=_to_mesh_sizes(args.mesh_sizes or []),
+            tolerance=args.tolerance,
+            processes=args.processes,
+            cache_dir=args.cache_dir,
+            incremental=args.incremental,
+            decimate_tolerance=args.decimate_tolerance,
+            validate=args.validate,
+            shared_surfaces=args.shared_surfaces,
+            fix_normals=args.fix_normals,
+            streaming=args.streaming,
+        )
+        print(f"written {args.h5m_filename}")
+        return 0
+
+    max_memory_per_worker = None
+    if args.max_memory_per_worker is not None:
+        max_memory_per_worker = args.max_memory_per_worker * 1e9
+
+    results = convert_batch(
+        jobs=load_manifest(args.manifest),
+        workers=args.workers,
+        retries=args.retries,
+        max_memory_per_worker=max_memory_per_worker,
+        report_filename=args.report,
+    )
+
+    failed = [result for result in results if result["status"] == "failed"]
+    print(f"{len(results) - len(failed)} of {len(results)} Brep files converted")
+    for result in failed:
+        print(f"failed {result['job']['brep_filename']}: {result['error']}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,66 @@
+import multiprocessing
 import os
-import tempfile
 import warnings
+from contextlib import contextmanager
 
 import gmsh
-import trimesh
+import numpy as np
 from pathlib import Path
-from stl_to_h5m import stl_to_h5m
-from vertices_to_h5m import vertices_to_h5m
-from typing import Tuple, Iterable
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .cache import (
+    component_cache_key,
+    entity_fingerprint,
+    load_cached_mesh,
+    mesh_cache_key,
+    save_cached_mesh,
+    volume_fingerprint,
+)
+from .decimate import decimate
+from .instrumentation import stage
+from .matching import match_material_tags, mesh_volume_properties, occ_volume_properties
+from .surface_mesh import SurfaceMesh, _signed_volume
+from .validate import summarise_report, validate_surface_mesh
+
+if TYPE_CHECKING:
+    from .h5m import _MoabWriter
+
+# the Gmsh options changed while meshing, which are put back to their
+# defaults between the conversions made in a gmsh_session
+_MESH_OPTIONS = [
+    "General.NumThreads",
+    "General.Terminal",
+    "Mesh.Algorithm",
+    "Mesh.MaxNumThreads2D",
+    "Mesh.MeshSizeFromCurvature",
+    "Mesh.MeshSizeMax",
+    "Mesh.MeshSizeMin",
+]
+
+# the default values of the _MESH_OPTIONS while a gmsh_session is open
+_session_defaults: Optional[Dict[str, float]] = None
 
 
 def brep_to_h5m(
     brep_filename: str,
-    material_tags: Iterable[str],
+    material_tags: Union[Iterable[str], Dict[str, Union[dict, List[dict]]]],
     h5m_filename: str = "dagmc.h5m",
     min_mesh_size: float = 30,
     max_mesh_size: float = 10,
     mesh_algorithm: int = 1,
+    num_threads: int = None,
+    mesh_sizes: Dict[Union[int, str], float] = None,
+    tolerance: float = None,
+    processes: int = None,
+    cache_dir: str = None,
+    max_cache_size: float = 10e9,
+    incremental: bool = False,
+    decimate_tolerance: float = None,
+    validate: bool = False,
+    shared_surfaces: bool = False,
+    fix_normals: str = "topology",
+    streaming: bool = False,
+    progress_callback: Callable[[dict], None] = None,
 ) -> str:
     """Converts a Brep file into a DAGMC h5m file. This makes use of Gmsh and
     will therefore need to have Gmsh installed to work.
@@ -24,7 +68,11 @@ def brep_to_h5m(
     Args:
         brep_filename: the filename of the Brep file to convert
         material_tags: A list of material tags to tag the DAGMC volumes with.
-            Should be in the same order as the volumes
+            Should be in the same order as the volumes. Alternatively a
+            dictionary with material tags as keys and the expected "center",
+            "bounding_box" and "volume" of the part, or a list of parts, with
+            that material as values, which are matched to the volumes with
+            match_material_tags after meshing.
         h5m_filename: the filename of the DAGMC h5m file to write
         min_mesh_size: the minimum mesh element size to use in Gmsh. Passed
             into gmsh.option.setNumber("Mesh.MeshSizeMin", min_mesh_size)
@@ -32,32 +80,227 @@ def brep_to_h5m(
             into gmsh.option.setNumber("Mesh.MeshSizeMax", max_mesh_size)
         mesh_algorithm: The Gmsh mesh algorithm number to use. Passed into
             gmsh.option.setNumber("Mesh.Algorithm", mesh_algorithm)
+        num_threads: the number of threads Gmsh uses when meshing. Passed into
+            gmsh.option.setNumber("General.NumThreads", num_threads) and
+            gmsh.option.setNumber("Mesh.MaxNumThreads2D", num_threads). If
+            None the Gmsh defaults are used.
+        mesh_sizes: a dictionary of mesh element sizes for some of the
+            volumes, overriding max_mesh_size for those volumes. The keys are
+            material tags, which set the size of every volume with that
+            material, or gmsh volume tags, which number the volumes from 1
+            in the order of the material_tags. A ValueError is raised for a
+            key that is neither.
+        tolerance: if set, the maximum distance between the triangles and
+            the CAD surfaces. The surfaces are meshed with Gmsh's curvature
+            based sizing, which is refined until the measured deviation is
+            below the tolerance. The deviation of each volume is reported in
+            the tolerance progress event, or the mesh_in_parallel event when
+            processes is set.
+        processes: if set, the groups of volumes that share surfaces are
+            meshed in this many separate processes with
+            mesh_brep_in_parallel. If None the whole Brep is meshed in the
+            current process.
+        cache_dir: if set, the surface mesh is saved in this folder and reused
+            by later conversions of the same Brep file with the same meshing
+            parameters, for example when only the material_tags change. If
+            None the Brep file is always meshed.
+        max_cache_size: the maximum total size in bytes of the meshes kept in
+            the cache_dir. The least recently used meshes are deleted first.
+        incremental: If True the groups of volumes connected by shared
+            surfaces are cached separately in the cache_dir, so when a Brep
+            file is edited only the groups whose geometry changed are meshed
+            again. See mesh_brep_incremental.
+        decimate_tolerance: if set, the surface mesh is decimated before it
+            is written by collapsing edges inside each surface while keeping
+            the original vertices within this distance of the triangles. The
+            vertices on the curves between surfaces are kept so the volumes
+            stay watertight. The triangle reduction and deviation are
+            reported in the decimate progress event.
+        validate: If True the surface mesh is checked with
+            validate_surface_mesh before it is written. The number of each
+            kind of problem is reported in the validate progress event and a
+            warning is raised if any are found.
+        shared_surfaces: If True each surface is written once as a DAGMC
+            surface with sense tags for the volumes on either side of it. If
+            False the triangles of every volume are written as a separate
+            surface so surfaces between volumes are duplicated.
+        fix_normals: how the triangles of each volume are made to point
+            outwards when shared_surfaces is False. "topology" flips the
+            surfaces using the orientation found by Gmsh and "trimesh" uses
+            trimesh.repair.fix_normals, which is much slower.
+        streaming: If True the mesh of each volume is written straight from
+            Gmsh with mesh_to_h5m_streaming_method instead of first being
+            gathered into a SurfaceMesh, which reduces the peak memory. Can
+            not be used with processes, cache_dir, incremental,
+            decimate_tolerance or validate and fix_normals must be
+            "topology".
+        progress_callback: a function called with a dictionary event at the
+            start and end of each stage, reporting the time taken, the peak
+            memory and the element counts. The events are also logged to the
+            "brep_to_h5m" logger.
     Returns:
         The filename of the h5m file produced
     """
 
-    gmsh, volumes = mesh_brep(
+    if isinstance(material_tags, dict):
+        # the order of the volumes is not known until they are matched
+        if any(key in material_tags for key in mesh_sizes or {}):
+            msg = "mesh_sizes can not use material tags when the material tags are matched to the volumes"
+            raise ValueError(msg)
+        volume_mesh_sizes = _volume_mesh_sizes(mesh_sizes, [])
+    else:
+        volume_mesh_sizes = _volume_mesh_sizes(mesh_sizes, material_tags)
+
+    if streaming:
+        if (
+            processes is not None
+            or cache_dir is not None
+            or incremental
+            or decimate_tolerance
+            or validate
+            or fix_normals != "topology"
+        ):
+            msg = 'streaming can not be used with processes, cache_dir, incremental, decimate_tolerance, validate or fix_normals other than "topology"'
+            raise ValueError(msg)
+        return mesh_to_h5m_streaming_method(
+            brep_filename=brep_filename,
+            material_tags=material_tags,
+            h5m_filename=h5m_filename,
+            min_mesh_size=min_mesh_size,
+            max_mesh_size=max_mesh_size,
+            mesh_algorithm=mesh_algorithm,
+            num_threads=num_threads,
+            volume_mesh_sizes=volume_mesh_sizes,
+            tolerance=tolerance,
+            shared_surfaces=shared_surfaces,
+            progress_callback=progress_callback,
+        )
+
+    surface_mesh, volume_properties = _mesh_brep(
         brep_filename=brep_filename,
         min_mesh_size=min_mesh_size,
         max_mesh_size=max_mesh_size,
         mesh_algorithm=mesh_algorithm,
+        num_threads=num_threads,
+        volume_mesh_sizes=volume_mesh_sizes,
+        tolerance=tolerance,
+        processes=processes,
+        cache_dir=cache_dir,
+        max_cache_size=max_cache_size,
+        incremental=incremental,
+        progress_callback=progress_callback,
+        with_volume_properties=isinstance(material_tags, dict),
     )
 
+    if isinstance(material_tags, dict):
+        with stage("match", progress_callback) as counts:
+            # the mesh properties are only used for meshes from the cache,
+            # for which the Brep file was not loaded
+            if volume_properties is None:
+                volume_properties = mesh_volume_properties(surface_mesh)
+            material_tags = match_material_tags(material_tags, volume_properties)
+            counts["volumes"] = len(material_tags)
+
+    if decimate_tolerance is not None:
+        with stage("decimate", progress_callback) as counts:
+            surface_mesh, report = decimate(surface_mesh, decimate_tolerance)
+            counts.update(report)
+
+    if validate:
+        with stage("validate", progress_callback) as counts:
+            report = validate_surface_mesh(surface_mesh)
+            counts.update(summarise_report(report))
+            counts["valid"] = report["valid"]
+        if not report["valid"]:
+            problems = ", ".join(
+                f"{count} {name.replace('_', ' ')}"
+                for name, count in summarise_report(report).items()
+                if count
+            )
+            warnings.warn(f"the surface mesh is not valid, found {problems}")
+
     h5m_filename = mesh_to_h5m_in_memory_method(
-        volumes=volumes,
+        surface_mesh=surface_mesh,
         material_tags=material_tags,
         h5m_filename=h5m_filename,
+        shared_surfaces=shared_surfaces,
+        fix_normals=fix_normals,
+        progress_callback=progress_callback,
     )
 
     return h5m_filename
 
 
+def _volume_mesh_sizes(
+    mesh_sizes: Dict[Union[int, str], float], material_tags: Iterable[str]
+) -> Dict[int, float]:
+    """Converts mesh sizes keyed by material tag or volume tag into mesh
+    sizes keyed by volume tag.
+
+    Args:
+        mesh_sizes: a dictionary with material tags or gmsh volume tags as
+            keys and mesh element sizes as values
+        material_tags: the material tag of each volume, in the order of the
+            volumes
+
+    Returns:
+        A dictionary with gmsh volume tags as keys and mesh element sizes as
+        values, or None if there are no mesh_sizes
+    """
+
+    if not mesh_sizes:
+        return None
+
+    volume_mesh_sizes = {}
+    for key, size in mesh_sizes.items():
+        vol_ids = [n for n, tag in enumerate(material_tags, 1) if tag == key]
+        if not vol_ids:
+            try:
+                vol_ids = [int(key)]
+            except ValueError:
+                msg = f"mesh_sizes key {key} is not a material tag or volume tag"
+                raise ValueError(msg) from None
+        for vol_id in vol_ids:
+            volume_mesh_sizes[vol_id] = float(size)
+
+    return volume_mesh_sizes
+
+
+def _check_volume_mesh_sizes(
+    volume_mesh_sizes: Dict[int, float], volumes: List[Tuple[int, int]]
+):
+    """Checks that the volume mesh sizes are for volumes in the model,
+    finalizing Gmsh before raising a ValueError naming the unknown volume
+    tags.
+
+    Args:
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values
+        volumes: the dimension and tag of each volume in the model
+    """
+
+    volume_tags = [dim_and_vol[1] for dim_and_vol in volumes]
+    unknown_tags = sorted(set(volume_mesh_sizes or {}) - set(volume_tags))
+    if unknown_tags:
+        _finalize_gmsh()
+        msg = f"mesh sizes were given for the volume tags {unknown_tags} which are not in the Brep file, the volume tags are {volume_tags}"
+        raise ValueError(msg)
+
+
 def mesh_brep(
     brep_filename: str,
     min_mesh_size: float = 30,
     max_mesh_size: float = 10,
     mesh_algorithm: int = 1,
-):
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    processes: int = None,
+    cache_dir: str = None,
+    max_cache_size: float = 10e9,
+    incremental: bool = False,
+    progress_callback: Callable[[dict], None] = None,
+) -> SurfaceMesh:
     """Creates a conformal surface meshes of the volumes in a Brep file using
     Gmsh.
 
@@ -69,281 +312,1372 @@ def mesh_brep(
             into gmsh.option.setNumber("Mesh.MeshSizeMax", max_mesh_size)
         mesh_algorithm: The Gmsh mesh algorithm number to use. Passed into
             gmsh.option.setNumber("Mesh.Algorithm", mesh_algorithm)
+        num_threads: the number of threads Gmsh uses when meshing. Passed into
+            gmsh.option.setNumber("General.NumThreads", num_threads) and
+            gmsh.option.setNumber("Mesh.MaxNumThreads2D", num_threads). If
+            None the Gmsh defaults are used.
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values, overriding max_mesh_size for those
+            volumes. A surface shared by two volumes uses the smaller size.
+        tolerance: if set, the maximum distance between the triangles and
+            the CAD surfaces. The surfaces are meshed with Gmsh's curvature
+            based sizing, which is refined until the measured deviation is
+            below the tolerance. The deviation of each volume is reported in
+            the tolerance progress event, or the mesh_in_parallel event when
+            processes is set.
+        processes: if set, the groups of volumes that share surfaces are
+            meshed in this many separate processes with
+            mesh_brep_in_parallel. If None the whole Brep is meshed in the
+            current process.
+        cache_dir: if set, the surface mesh is saved in this folder and reused
+            by later calls with the same Brep file and meshing parameters. If
+            None the Brep file is always meshed.
+        max_cache_size: the maximum total size in bytes of the meshes kept in
+            the cache_dir. The least recently used meshes are deleted first.
+        incremental: If True the groups of volumes connected by shared
+            surfaces are cached separately in the cache_dir, so when a Brep
+            file is edited only the groups whose geometry changed are meshed
+            again. See mesh_brep_incremental.
+        progress_callback: a function called with a dictionary event at the
+            start and end of each stage, reporting the time taken, the peak
+            memory and the element counts. The events are also logged to the
+            "brep_to_h5m" logger.
+
+    Returns:
+        The surface mesh of the volumes in Brep file
+    """
+
+    surface_mesh, _ = _mesh_brep(
+        brep_filename=brep_filename,
+        min_mesh_size=min_mesh_size,
+        max_mesh_size=max_mesh_size,
+        mesh_algorithm=mesh_algorithm,
+        num_threads=num_threads,
+        volume_mesh_sizes=volume_mesh_sizes,
+        tolerance=tolerance,
+        processes=processes,
+        cache_dir=cache_dir,
+        max_cache_size=max_cache_size,
+        incremental=incremental,
+        progress_callback=progress_callback,
+    )
+    return surface_mesh
+
+
+def _mesh_brep(
+    brep_filename: str,
+    min_mesh_size: float = 30,
+    max_mesh_size: float = 10,
+    mesh_algorithm: int = 1,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    processes: int = None,
+    cache_dir: str = None,
+    max_cache_size: float = 10e9,
+    incremental: bool = False,
+    progress_callback: Callable[[dict], None] = None,
+    with_volume_properties: bool = False,
+) -> Tuple[SurfaceMesh, Optional[Dict[str, np.ndarray]]]:
+    """Meshes a Brep file like mesh_brep. If with_volume_properties is True
+    the properties of the volumes from the OCC geometry, see
+    occ_volume_properties, are also returned, or None if the mesh came from
+    the cache and the Brep file was not loaded."""
+
+    if incremental:
+        if cache_dir is None or processes is not None:
+            msg = "incremental needs a cache_dir and can not be used with processes"
+            raise ValueError(msg)
+        return _mesh_brep_incremental(
+            brep_filename=brep_filename,
+            cache_dir=cache_dir,
+            min_mesh_size=min_mesh_size,
+            max_mesh_size=max_mesh_size,
+            mesh_algorithm=mesh_algorithm,
+            num_threads=num_threads,
+            volume_mesh_sizes=volume_mesh_sizes,
+            tolerance=tolerance,
+            max_cache_size=max_cache_size,
+            progress_callback=progress_callback,
+            with_volume_properties=with_volume_properties,
+        )
+
+    if cache_dir is not None:
+        with stage("cache_load", progress_callback) as counts:
+            key = mesh_cache_key(
+                brep_filename=brep_filename,
+                min_mesh_size=min_mesh_size,
+                max_mesh_size=max_mesh_size,
+                mesh_algorithm=mesh_algorithm,
+                volume_mesh_sizes=volume_mesh_sizes,
+                tolerance=tolerance,
+            )
+            surface_mesh = load_cached_mesh(cache_dir=cache_dir, key=key)
+            counts["hit"] = surface_mesh is not None
+        if surface_mesh is not None:
+            return surface_mesh, None
+
+    if processes is not None:
+        with stage("mesh_in_parallel", progress_callback) as counts:
+            (
+                surface_mesh,
+                volume_properties,
+                volume_deviations,
+            ) = _mesh_brep_in_parallel(
+                brep_filename=brep_filename,
+                min_mesh_size=min_mesh_size,
+                max_mesh_size=max_mesh_size,
+                mesh_algorithm=mesh_algorithm,
+                num_threads=num_threads,
+                volume_mesh_sizes=volume_mesh_sizes,
+                tolerance=tolerance,
+                processes=processes,
+                with_volume_properties=with_volume_properties,
+            )
+            counts.update(_count_elements(surface_mesh))
+            if volume_deviations is not None:
+                counts["max_deviation"] = max(volume_deviations.values(), default=0.0)
+                counts["volume_deviations"] = volume_deviations
+    else:
+        with stage("import", progress_callback) as counts:
+            volumes = _import_brep(brep_filename)
+            counts["volumes"] = len(volumes)
+        _check_volume_mesh_sizes(volume_mesh_sizes, volumes)
+        volume_properties = None
+        if with_volume_properties:
+            volume_properties = occ_volume_properties(
+                [dim_and_vol[1] for dim_and_vol in volumes]
+            )
+
+        _set_mesh_options(
+            min_mesh_size=min_mesh_size,
+            max_mesh_size=max_mesh_size,
+            mesh_algorithm=mesh_algorithm,
+            num_threads=num_threads,
+            volume_mesh_sizes=volume_mesh_sizes,
+            tolerance=tolerance,
+        )
+        _generate_mesh(tolerance, progress_callback=progress_callback)
+
+        with stage("extract", progress_callback) as counts:
+            surface_mesh = _get_surface_mesh(volumes)
+            counts.update(_count_elements(surface_mesh))
+
+        _finalize_gmsh()
+
+    if cache_dir is not None:
+        with stage("cache_save", progress_callback):
+            save_cached_mesh(
+                cache_dir=cache_dir,
+                key=key,
+                surface_mesh=surface_mesh,
+                max_cache_size=max_cache_size,
+            )
+
+    return surface_mesh, volume_properties
+
+
+def _count_elements(surface_mesh: SurfaceMesh) -> dict:
+    """Counts the entities in a surface mesh for the progress events"""
+
+    return {
+        "volumes": len(surface_mesh.volumes),
+        "surfaces": len(surface_mesh.surface_triangles),
+        "vertices": len(surface_mesh.vertices),
+        "triangles": surface_mesh.number_of_triangles,
+    }
+
+
+def mesh_brep_in_parallel(
+    brep_filename: str,
+    min_mesh_size: float = 30,
+    max_mesh_size: float = 10,
+    mesh_algorithm: int = 1,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    processes: int = None,
+) -> SurfaceMesh:
+    """Creates conformal surface meshes of the volumes in a Brep file by
+    meshing groups of volumes in separate Gmsh sessions. Volumes that share
+    surfaces are always meshed in the same session so the combined mesh is
+    conformal.
+
+    Args:
+        brep_filename: the filename of the Brep file to convert
+        min_mesh_size: the minimum mesh element size to use in Gmsh. Passed
+            into gmsh.option.setNumber("Mesh.MeshSizeMin", min_mesh_size)
+        max_mesh_size: the maximum mesh element size to use in Gmsh. Passed
+            into gmsh.option.setNumber("Mesh.MeshSizeMax", max_mesh_size)
+        mesh_algorithm: The Gmsh mesh algorithm number to use. Passed into
+            gmsh.option.setNumber("Mesh.Algorithm", mesh_algorithm)
+        num_threads: the number of threads each Gmsh session uses when
+            meshing. If None the Gmsh defaults are used.
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values, overriding max_mesh_size for those
+            volumes. A surface shared by two volumes uses the smaller size.
+        tolerance: if set, the maximum distance between the triangles and
+            the CAD surfaces. The surfaces are meshed with Gmsh's curvature
+            based sizing, which is refined until the measured deviation is
+            below the tolerance. A warning is raised if the tolerance is not
+            reached.
+        processes: the number of worker processes to mesh with. If None the
+            number of CPUs is used.
+
+    Returns:
+        The surface mesh of the volumes in Brep file
+    """
+
+    surface_mesh, _, _ = _mesh_brep_in_parallel(
+        brep_filename=brep_filename,
+        min_mesh_size=min_mesh_size,
+        max_mesh_size=max_mesh_size,
+        mesh_algorithm=mesh_algorithm,
+        num_threads=num_threads,
+        volume_mesh_sizes=volume_mesh_sizes,
+        tolerance=tolerance,
+        processes=processes,
+    )
+    return surface_mesh
+
+
+def _mesh_brep_in_parallel(
+    brep_filename: str,
+    min_mesh_size: float = 30,
+    max_mesh_size: float = 10,
+    mesh_algorithm: int = 1,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    processes: int = None,
+    with_volume_properties: bool = False,
+) -> Tuple[SurfaceMesh, Optional[Dict[str, np.ndarray]], Optional[Dict[int, float]]]:
+    """Meshes a Brep file like mesh_brep_in_parallel, also returning the
+    properties of the volumes from the OCC geometry if
+    with_volume_properties is True and the largest deviation of the
+    triangles of each volume if there is a tolerance"""
+
+    volumes = _import_brep(brep_filename)
+    _check_volume_mesh_sizes(volume_mesh_sizes, volumes)
+    volume_tags = [dim_and_vol[1] for dim_and_vol in volumes]
+    volume_surfaces, _ = _get_volume_boundaries(volume_tags)
+    groups = _group_connected_volumes(volume_surfaces)
+    volume_properties = None
+    if with_volume_properties:
+        volume_properties = occ_volume_properties(volume_tags)
+    _finalize_gmsh()
+
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(1, min(processes, len(groups)))
+
+    # balances the work by handing out the groups with the most surfaces
+    # first, each to the least loaded process
+    batches = [[] for _ in range(processes)]
+    loads = [0] * processes
+    for group, n_surfaces in sorted(groups, key=lambda g: g[1], reverse=True):
+        lightest = loads.index(min(loads))
+        batches[lightest] += group
+        loads[lightest] += n_surfaces
+
+    jobs = [
+        (
+            brep_filename,
+            batch,
+            min_mesh_size,
+            max_mesh_size,
+            mesh_algorithm,
+            num_threads,
+            volume_mesh_sizes,
+            tolerance,
+        )
+        for batch in batches
+    ]
+
+    # spawn is used as gmsh holds global state that is not safe to fork
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.starmap(_mesh_volume_group, jobs)
+
+    volume_deviations = None
+    if tolerance is not None:
+        volume_deviations = {}
+        for _, group_deviations in results:
+            volume_deviations.update(group_deviations)
+        # the warnings of the workers are not passed back to this process
+        if max(volume_deviations.values(), default=0) > tolerance:
+            msg = (
+                f"the deviation {max(volume_deviations.values())} is larger than "
+                f"the tolerance {tolerance}, the min_mesh_size may be too large "
+                "to reach the tolerance"
+            )
+            warnings.warn(msg)
+
+    surface_mesh = SurfaceMesh.merge(
+        [group_mesh for group_mesh, _ in results], volumes=volume_tags
+    )
+    return surface_mesh, volume_properties, volume_deviations
+
+
+def mesh_brep_incremental(
+    brep_filename: str,
+    cache_dir: str,
+    min_mesh_size: float = 30,
+    max_mesh_size: float = 10,
+    mesh_algorithm: int = 1,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    max_cache_size: float = 10e9,
+    progress_callback: Callable[[dict], None] = None,
+) -> SurfaceMesh:
+    """Creates a conformal surface mesh of the volumes in a Brep file,
+    reusing the cached meshes of the groups of volumes whose geometry has not
+    changed since an earlier call. Volumes are grouped when they share
+    surfaces, as the mesh of a shared surface has to match on both sides, and
+    each group is cached under a fingerprint of the type, size and position of
+    its volumes and surfaces. Only the groups with no cached mesh are meshed.
+
+    Args:
+        brep_filename: the filename of the Brep file to convert
+        cache_dir: the folder to save the cached meshes of the groups in
+        min_mesh_size: the minimum mesh element size to use in Gmsh. Passed
+            into gmsh.option.setNumber("Mesh.MeshSizeMin", min_mesh_size)
+        max_mesh_size: the maximum mesh element size to use in Gmsh. Passed
+            into gmsh.option.setNumber("Mesh.MeshSizeMax", max_mesh_size)
+        mesh_algorithm: The Gmsh mesh algorithm number to use. Passed into
+            gmsh.option.setNumber("Mesh.Algorithm", mesh_algorithm)
+        num_threads: the number of threads Gmsh uses when meshing. If None
+            the Gmsh defaults are used.
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values, overriding max_mesh_size for those
+            volumes. A surface shared by two volumes uses the smaller size.
+        tolerance: if set, the maximum distance between the triangles and
+            the CAD surfaces. The surfaces are meshed with Gmsh's curvature
+            based sizing, which is refined until the measured deviation is
+            below the tolerance. The deviation of each volume is reported in
+            the progress events.
+        max_cache_size: the maximum total size in bytes of the meshes kept in
+            the cache_dir. The least recently used meshes are deleted first.
+        progress_callback: a function called with a dictionary event at the
+            start and end of each stage, reporting the time taken, the peak
+            memory and the element counts. The events are also logged to the
+            "brep_to_h5m" logger.
+
+    Returns:
+        The surface mesh of the volumes in Brep file
+    """
+
+    surface_mesh, _ = _mesh_brep_incremental(
+        brep_filename=brep_filename,
+        cache_dir=cache_dir,
+        min_mesh_size=min_mesh_size,
+        max_mesh_size=max_mesh_size,
+        mesh_algorithm=mesh_algorithm,
+        num_threads=num_threads,
+        volume_mesh_sizes=volume_mesh_sizes,
+        tolerance=tolerance,
+        max_cache_size=max_cache_size,
+        progress_callback=progress_callback,
+    )
+    return surface_mesh
+
+
+def _mesh_brep_incremental(
+    brep_filename: str,
+    cache_dir: str,
+    min_mesh_size: float = 30,
+    max_mesh_size: float = 10,
+    mesh_algorithm: int = 1,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    max_cache_size: float = 10e9,
+    progress_callback: Callable[[dict], None] = None,
+    with_volume_properties: bool = False,
+) -> Tuple[SurfaceMesh, Optional[Dict[str, np.ndarray]]]:
+    """Meshes a Brep file like mesh_brep_incremental, also returning the
+    properties of the volumes from the OCC geometry if
+    with_volume_properties is True"""
+
+    with stage("import", progress_callback) as counts:
+        volumes = _import_brep(brep_filename)
+        counts["volumes"] = len(volumes)
+    _check_volume_mesh_sizes(volume_mesh_sizes, volumes)
+    volume_tags = [dim_and_vol[1] for dim_and_vol in volumes]
+    volume_properties = None
+    if with_volume_properties:
+        volume_properties = occ_volume_properties(volume_tags)
+
+    with stage("fingerprint", progress_callback) as counts:
+        volume_surfaces, _ = _get_volume_boundaries(volume_tags)
+        groups = [group for group, _ in _group_connected_volumes(volume_surfaces)]
+        volume_fingerprints = {
+            vol_id: volume_fingerprint(vol_id, surfaces)
+            for vol_id, surfaces in volume_surfaces.items()
+        }
+        surface_fingerprints = {
+            surface: entity_fingerprint(2, surface)
+            for surfaces in volume_surfaces.values()
+            for surface in surfaces
+        }
+        counts["groups"] = len(groups)
+
+    component_meshes = []
+    changed_groups = []
+    with stage("cache_load", progress_callback) as counts:
+        for group in groups:
+            key = component_cache_key(
+                [volume_fingerprints[vol_id] for vol_id in group],
+                min_mesh_size=min_mesh_size,
+                max_mesh_size=max_mesh_size,
+                mesh_algorithm=mesh_algorithm,
+                volume_mesh_sizes=[
+                    (volume_mesh_sizes or {}).get(vol_id) for vol_id in group
+                ],
+                tolerance=tolerance,
+            )
+            canonical_tags = _canonical_tags(
+                group, volume_surfaces, volume_fingerprints, surface_fingerprints
+            )
+            cached_mesh = None
+            if canonical_tags is not None:
+                cached_mesh = load_cached_mesh(cache_dir=cache_dir, key=key)
+            if cached_mesh is None:
+                changed_groups.append((group, key, canonical_tags))
+            else:
+                volume_map, surface_map = canonical_tags
+                component_meshes.append(
+                    cached_mesh.renumber(
+                        {new: old for old, new in volume_map.items()},
+                        {new: old for old, new in surface_map.items()},
+                    )
+                )
+        counts["hit"] = len(groups) - len(changed_groups)
+        counts["miss"] = len(changed_groups)
+
+    if changed_groups:
+        changed_volumes = [vol_id for group, _, _ in changed_groups for vol_id in group]
+        unchanged_volumes = [
+            (3, vol_id) for vol_id in volume_tags if vol_id not in changed_volumes
+        ]
+        if unchanged_volumes:
+            gmsh.model.occ.remove(unchanged_volumes, recursive=True)
+            gmsh.model.occ.synchronize()
+
+        _set_mesh_options(
+            min_mesh_size=min_mesh_size,
+            max_mesh_size=max_mesh_size,
+            mesh_algorithm=mesh_algorithm,
+            num_threads=num_threads,
+            volume_mesh_sizes=volume_mesh_sizes,
+            tolerance=tolerance,
+        )
+        _generate_mesh(tolerance, progress_callback=progress_callback)
+
+        with stage("extract", progress_callback) as counts:
+            changed_mesh = _get_surface_mesh(
+                [(3, vol_id) for vol_id in changed_volumes]
+            )
+            counts.update(_count_elements(changed_mesh))
+
+    _finalize_gmsh()
+
+    if changed_groups:
+        with stage("cache_save", progress_callback):
+            for group, key, canonical_tags in changed_groups:
+                component_mesh = changed_mesh.subset(group)
+                component_meshes.append(component_mesh)
+                # groups with indistinguishable volumes or surfaces are not
+                # cached as their tags could not be matched up when loaded
+                if canonical_tags is not None:
+                    save_cached_mesh(
+                        cache_dir=cache_dir,
+                        key=key,
+                        surface_mesh=component_mesh.renumber(*canonical_tags),
+                        max_cache_size=max_cache_size,
+                    )
+
+    return SurfaceMesh.merge(component_meshes, volumes=volume_tags), volume_properties
+
+
+def _canonical_tags(
+    volume_tags: List[int],
+    volume_surfaces: Dict[int, List[int]],
+    volume_fingerprints: Dict[int, str],
+    surface_fingerprints: Dict[int, str],
+) -> Optional[Tuple[Dict[int, int], Dict[int, int]]]:
+    """Numbers the volumes and surfaces of a group in the order of their
+    fingerprints, so the tags of a cached mesh can be matched to the tags of
+    the same geometry in another Brep file.
+
+    Args:
+        volume_tags: the tags of the volumes in the group
+        volume_surfaces: a dictionary with the gmsh volume tags as keys and
+            the tags of the surfaces bounding each volume as values
+        volume_fingerprints: the fingerprint of each volume
+        surface_fingerprints: the fingerprint of each surface
 
     Returns:
-        The gmsh object and volumes in Brep file
+        A dictionary with the volume tags as keys and the canonical numbers
+        as values and the same for the surfaces, or None if two volumes or
+        two surfaces have the same fingerprint
+    """
+
+    maps = []
+    for tags, fingerprints in [
+        (volume_tags, volume_fingerprints),
+        (
+            list(dict.fromkeys(s for v in volume_tags for s in volume_surfaces[v])),
+            surface_fingerprints,
+        ),
+    ]:
+        ordered = sorted(tags, key=lambda tag: fingerprints[tag])
+        if len({fingerprints[tag] for tag in tags}) != len(tags):
+            return None
+        maps.append({tag: number for number, tag in enumerate(ordered, 1)})
+
+    return tuple(maps)
+
+
+@contextmanager
+def gmsh_session(terminal: bool = True):
+    """Keeps Gmsh initialized for all the conversions made inside the
+    context. Each conversion clears the Gmsh model instead of starting and
+    finalizing Gmsh, which saves the start up time when many Brep files are
+    converted in one process. The meshing options are reset between
+    conversions so each gives the same mesh as it would on its own. Nested
+    sessions reuse the outer session.
+
+    Args:
+        terminal: If True Gmsh prints its messages to the terminal during
+            each conversion, as it does outside a session. Passed into
+            gmsh.option.setNumber("General.Terminal", terminal)
+
+    Example:
+        with gmsh_session():
+            for brep_filename in brep_filenames:
+                brep_to_h5m(brep_filename, material_tags)
+    """
+
+    global _session_defaults
+
+    if _session_defaults is not None:
+        yield
+        return
+
+    gmsh.initialize()
+    _session_defaults = {name: gmsh.option.getNumber(name) for name in _MESH_OPTIONS}
+    _session_defaults["General.Terminal"] = int(terminal)
+    try:
+        yield
+    finally:
+        _session_defaults = None
+        gmsh.finalize()
+
+
+def _finalize_gmsh():
+    """Finalizes Gmsh, or only clears the model to free its memory when a
+    gmsh_session is open"""
+
+    if _session_defaults is None:
+        gmsh.finalize()
+    else:
+        gmsh.clear()
+
+
+def _import_brep(brep_filename: str):
+    """Starts Gmsh, or clears the model of an open gmsh_session, and imports
+    the shapes in a Brep file into a new model.
+
+    Args:
+        brep_filename: the filename of the Brep file to import
+
+    Returns:
+        The volumes in Brep file
     """
 
     if not Path(brep_filename).is_file():
         msg = f"The specified brep ({brep_filename}) file was not found"
         raise FileNotFoundError(msg)
 
-    gmsh.initialize()
-    gmsh.option.setNumber("General.Terminal", 1)
+    if _session_defaults is None:
+        gmsh.initialize()
+        gmsh.option.setNumber("General.Terminal", 1)
+    else:
+        # the open session is reused with the options of a new session
+        gmsh.clear()
+        for name, value in _session_defaults.items():
+            gmsh.option.setNumber(name, value)
     gmsh.model.add("made_with_brep_to_h5m_package")
     volumes = gmsh.model.occ.importShapes(brep_filename)
     gmsh.model.occ.synchronize()
 
+    return volumes
+
+
+def _set_mesh_options(
+    min_mesh_size: float,
+    max_mesh_size: float,
+    mesh_algorithm: int,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+):
+    """Sets the Gmsh options used when generating the surface mesh.
+
+    Args:
+        min_mesh_size: the minimum mesh element size to use in Gmsh
+        max_mesh_size: the maximum mesh element size to use in Gmsh
+        mesh_algorithm: The Gmsh mesh algorithm number to use
+        num_threads: the number of threads Gmsh uses when meshing. If None
+            the Gmsh defaults are used.
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values, overriding max_mesh_size for those
+            volumes. A surface shared by two volumes uses the smaller size.
+        tolerance: if set, Gmsh's curvature based sizing is turned on with a
+            coarse number of elements per circle that _generate_mesh refines
+            until the deviation from the CAD surfaces is below the tolerance.
+            A min_mesh_size larger than the max_mesh_size, as with the
+            defaults, is then not used so it does not clip the curvature
+            based sizes.
+    """
+
+    # the global limits are widened so they do not clip the volume sizes
+    sizes = list((volume_mesh_sizes or {}).values())
+    min_size = min([min_mesh_size] + sizes)
+    max_size = max([max_mesh_size] + sizes)
+    if tolerance is not None and min_size > max_size:
+        # gmsh raises every size to MeshSizeMin before limiting it to
+        # MeshSizeMax, so curvature based sizes could never go below the max
+        min_size = 0
     gmsh.option.setNumber("Mesh.Algorithm", mesh_algorithm)
-    gmsh.option.setNumber("Mesh.MeshSizeMin", min_mesh_size)
-    gmsh.option.setNumber("Mesh.MeshSizeMax", max_mesh_size)
-    gmsh.model.mesh.generate(2)
+    gmsh.option.setNumber("Mesh.MeshSizeMin", min_size)
+    gmsh.option.setNumber("Mesh.MeshSizeMax", max_size)
+    if num_threads is not None:
+        gmsh.option.setNumber("General.NumThreads", num_threads)
+        gmsh.option.setNumber("Mesh.MaxNumThreads2D", num_threads)
+    if tolerance is not None:
+        gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", 6)
+
+    if not volume_mesh_sizes:
+        return
+
+    # each volume in the model gets a Constant field on its surfaces and
+    # curves, the volumes without a size set use max_mesh_size and the Min
+    # field gives shared surfaces the smaller of their volumes' sizes
+    fields = []
+    for _, vol_id in gmsh.model.getEntities(3):
+        surfaces = gmsh.model.getBoundary([(3, vol_id)], combined=False, oriented=False)
+        curves = gmsh.model.getBoundary(surfaces, combined=False, oriented=False)
+
+        field = gmsh.model.mesh.field.add("Constant")
+        gmsh.model.mesh.field.setNumber(
+            field, "VIn", volume_mesh_sizes.get(vol_id, max_mesh_size)
+        )
+        gmsh.model.mesh.field.setNumbers(
+            field, "SurfacesList", sorted({abs(tag) for _, tag in surfaces})
+        )
+        gmsh.model.mesh.field.setNumbers(
+            field, "CurvesList", sorted({abs(tag) for _, tag in curves})
+        )
+        fields.append(field)
+
+    min_field = gmsh.model.mesh.field.add("Min")
+    gmsh.model.mesh.field.setNumbers(min_field, "FieldsList", fields)
+    gmsh.model.mesh.field.setAsBackgroundMesh(min_field)
+
+
+def _generate_mesh(
+    tolerance: float = None,
+    max_iterations: int = 5,
+    progress_callback: Callable[[dict], None] = None,
+) -> Optional[Dict[int, float]]:
+    """Meshes the curves and surfaces of the current Gmsh model. If a
+    tolerance is set the deviation of the triangles from the CAD surfaces is
+    measured and the surfaces are meshed again with more elements per circle
+    until the largest deviation is below the tolerance. The deviation of a
+    chord scales with the inverse square of the number of elements per circle
+    so each iteration scales the number by the square root of the ratio of
+    the deviation to the tolerance.
+
+    Args:
+        tolerance: the maximum distance between the triangles and the CAD
+            surfaces. If None the mesh is generated once.
+        max_iterations: the maximum number of times the surfaces are meshed
+            again to reach the tolerance
+        progress_callback: a function called with a dictionary event at the
+            start and end of each stage
+
+    Returns:
+        A dictionary with the gmsh volume tags as keys and the largest
+        deviation of the triangles of each volume as values, or None if
+        there is no tolerance
+    """
+
+    # the curves and surfaces are meshed separately to time each dimension
+    for dimension in [1, 2]:
+        with stage(f"mesh_{dimension}d", progress_callback) as counts:
+            gmsh.model.mesh.generate(dimension)
+            counts["elements"] = sum(
+                len(tags) for tags in gmsh.model.mesh.getElements(dimension)[1]
+            )
+
+    if tolerance is None:
+        return None
+
+    with stage("tolerance", progress_callback) as counts:
+        volume_surfaces, surface_senses = _get_volume_boundaries(
+            [tag for _, tag in gmsh.model.getEntities(3)]
+        )
+        deviations = _surface_deviations(list(surface_senses))
+
+        iterations = 0
+        while max(deviations.values(), default=0) > tolerance:
+            if iterations >= max_iterations:
+                msg = (
+                    f"the deviation {max(deviations.values())} is larger than the "
+                    f"tolerance {tolerance} after {iterations} iterations, the "
+                    "min_mesh_size may be too large to reach the tolerance"
+                )
+                warnings.warn(msg)
+                break
+            elements_per_circle = gmsh.option.getNumber("Mesh.MeshSizeFromCurvature")
+            ratio = max(deviations.values()) / tolerance
+            # a 10% margin avoids stopping just short of the tolerance
+            gmsh.option.setNumber(
+                "Mesh.MeshSizeFromCurvature",
+                np.ceil(elements_per_circle * np.sqrt(ratio) * 1.1),
+            )
+            gmsh.model.mesh.clear()
+            gmsh.model.mesh.generate(2)
+            deviations = _surface_deviations(list(surface_senses))
+            iterations += 1
+
+        volume_deviations = {
+            vol_id: max((deviations[s] for s in surfaces), default=0.0)
+            for vol_id, surfaces in volume_surfaces.items()
+        }
+        counts["iterations"] = iterations
+        counts["elements_per_circle"] = gmsh.option.getNumber(
+            "Mesh.MeshSizeFromCurvature"
+        )
+        counts["max_deviation"] = max(volume_deviations.values(), default=0.0)
+        counts["volume_deviations"] = volume_deviations
+
+    return volume_deviations
+
+
+def _surface_deviations(surfaces: List[int]) -> Dict[int, float]:
+    """Measures how far the triangles of meshed surfaces are from the CAD
+    surfaces by finding the closest point on the surface to the centroid and
+    edge midpoints of every triangle.
+
+    Args:
+        surfaces: the tags of the gmsh surfaces
+
+    Returns:
+        A dictionary with the surface tags as keys and the largest distance
+        between the sample points and the surface as values
+    """
+
+    node_tags, coords, _ = gmsh.model.mesh.getNodes()
+    node_tags = np.asarray(node_tags, dtype=np.int64)
+    rows = np.zeros(node_tags.max(initial=0) + 1, dtype=np.int64)
+    rows[node_tags] = np.arange(len(node_tags))
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+
+    deviations = {}
+    for surface in surfaces:
+        corners = coords[rows[_get_surface_triangles(surface)]]
+        if len(corners) == 0:
+            deviations[surface] = 0.0
+            continue
+        samples = np.concatenate(
+            [
+                corners.mean(axis=1),
+                (corners[:, 0] + corners[:, 1]) / 2,
+                (corners[:, 1] + corners[:, 2]) / 2,
+                (corners[:, 2] + corners[:, 0]) / 2,
+            ]
+        )
+        closest, _ = gmsh.model.getClosestPoint(2, surface, samples.flatten())
+        distances = np.linalg.norm(samples - np.asarray(closest).reshape(-1, 3), axis=1)
+        deviations[surface] = float(distances.max())
+
+    return deviations
+
+
+def _group_connected_volumes(
+    volume_surfaces: Dict[int, List[int]],
+) -> List[Tuple[List[int], int]]:
+    """Finds the groups of volumes that are connected by shared surfaces.
+
+    Args:
+        volume_surfaces: a dictionary with the gmsh volume tags as keys and
+            the tags of the surfaces bounding each volume as values
+
+    Returns:
+        A list of groups, each with the volume tags in the group and the
+        number of surfaces bounding those volumes
+    """
+
+    # union find over the volumes, joined whenever a surface is shared
+    parents = {vol_id: vol_id for vol_id in volume_surfaces}
+
+    def find(vol_id):
+        while parents[vol_id] != vol_id:
+            parents[vol_id] = parents[parents[vol_id]]
+            vol_id = parents[vol_id]
+        return vol_id
+
+    surface_owners = {}
+    for vol_id, surfaces in volume_surfaces.items():
+        for surface in surfaces:
+            if surface in surface_owners:
+                parents[find(vol_id)] = find(surface_owners[surface])
+            else:
+                surface_owners[surface] = vol_id
+
+    groups = {}
+    for vol_id in volume_surfaces:
+        groups.setdefault(find(vol_id), []).append(vol_id)
+
+    n_surfaces = {}
+    for surface, vol_id in surface_owners.items():
+        root = find(vol_id)
+        n_surfaces[root] = n_surfaces.get(root, 0) + 1
+
+    return [(group, n_surfaces.get(root, 0)) for root, group in groups.items()]
+
+
+def _mesh_volume_group(
+    brep_filename: str,
+    volume_tags: List[int],
+    min_mesh_size: float,
+    max_mesh_size: float,
+    mesh_algorithm: int,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+) -> Tuple[SurfaceMesh, Optional[Dict[int, float]]]:
+    """Meshes a subset of the volumes in a Brep file in a new Gmsh session.
+    Used as the worker function of mesh_brep_in_parallel.
+
+    Args:
+        brep_filename: the filename of the Brep file to mesh
+        volume_tags: the tags of the gmsh volumes to keep and mesh
+        min_mesh_size: the minimum mesh element size to use in Gmsh
+        max_mesh_size: the maximum mesh element size to use in Gmsh
+        mesh_algorithm: The Gmsh mesh algorithm number to use
+        num_threads: the number of threads Gmsh uses when meshing
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values, overriding max_mesh_size for those
+            volumes. A surface shared by two volumes uses the smaller size.
+        tolerance: if set, the maximum distance between the triangles and
+            the CAD surfaces. The surfaces are meshed with Gmsh's curvature
+            based sizing, which is refined until the measured deviation is
+            below the tolerance. A warning is raised if the tolerance is not
+            reached.
+
+    Returns:
+        The surface mesh of the volume_tags and a dictionary with the largest
+        deviation of the triangles of each volume, or None if there is no
+        tolerance
+    """
+
+    volumes = _import_brep(brep_filename)
+    gmsh.option.setNumber("General.Terminal", 0)
+
+    unwanted_volumes = [
+        dim_and_vol for dim_and_vol in volumes if dim_and_vol[1] not in volume_tags
+    ]
+    if unwanted_volumes:
+        gmsh.model.occ.remove(unwanted_volumes, recursive=True)
+        gmsh.model.occ.synchronize()
+
+    _set_mesh_options(
+        min_mesh_size=min_mesh_size,
+        max_mesh_size=max_mesh_size,
+        mesh_algorithm=mesh_algorithm,
+        num_threads=num_threads,
+        volume_mesh_sizes=volume_mesh_sizes,
+        tolerance=tolerance,
+    )
+    volume_deviations = _generate_mesh(tolerance=tolerance)
+
+    surface_mesh = _get_surface_mesh([(3, vol_id) for vol_id in volume_tags])
+
+    _finalize_gmsh()
 
-    return gmsh, volumes
+    return surface_mesh, volume_deviations
 
 
 def mesh_to_h5m_in_memory_method(
-    volumes,
+    surface_mesh: SurfaceMesh,
     material_tags: Iterable[str],
     h5m_filename: str = "dagmc.h5m",
+    shared_surfaces: bool = False,
+    fix_normals: str = "topology",
+    progress_callback: Callable[[dict], None] = None,
 ) -> str:
-    """Converts gmsh volumes into a DAGMC h5m file.
+    """Converts a surface mesh into a DAGMC h5m file.
 
     Args:
-        volumes: the volumes in the gmsh file, found with gmsh.model.occ.importShapes
+        surface_mesh: the surface mesh of the volumes, found with mesh_brep
         material_tags: A list of material tags to tag the DAGMC volumes with.
             Should be in the same order as the volumes
         h5m_filename: the filename of the DAGMC h5m file to write
+        shared_surfaces: If True each surface is written once as a DAGMC
+            surface with sense tags for the volumes on either side of it. If
+            False the triangles of every volume are written as a separate
+            surface so surfaces between volumes are duplicated.
+        fix_normals: how the triangles of each volume are made to point
+            outwards when shared_surfaces is False. "topology" flips the
+            surfaces using the orientation found by Gmsh and "trimesh" uses
+            trimesh.repair.fix_normals, which is much slower.
+        progress_callback: a function called with a dictionary event at the
+            start and end of each stage, reporting the time taken, the peak
+            memory and the element counts. The events are also logged to the
+            "brep_to_h5m" logger.
+
+    Returns:
+        The filename of the h5m file produced
+    """
+
+    return surface_mesh.write_h5m(
+        material_tags=material_tags,
+        h5m_filename=h5m_filename,
+        shared_surfaces=shared_surfaces,
+        fix_normals=fix_normals,
+        progress_callback=progress_callback,
+    )
+
+
+def mesh_to_h5m_streaming_method(
+    brep_filename: str,
+    material_tags: Union[Iterable[str], Dict[str, Union[dict, List[dict]]]],
+    h5m_filename: str = "dagmc.h5m",
+    min_mesh_size: float = 30,
+    max_mesh_size: float = 10,
+    mesh_algorithm: int = 1,
+    num_threads: int = None,
+    volume_mesh_sizes: Dict[int, float] = None,
+    tolerance: float = None,
+    shared_surfaces: bool = False,
+    progress_callback: Callable[[dict], None] = None,
+) -> str:
+    """Meshes a Brep file and writes it to a DAGMC h5m file one volume at a
+    time. The triangles and nodes of each volume are pulled from Gmsh and
+    added to the MOAB Core, so unlike mesh_brep the whole mesh is never
+    gathered into Python arrays. The Gmsh mesh of each surface is cleared as
+    soon as every volume it bounds has been added, so the Gmsh mesh shrinks
+    as the MOAB mesh grows.
+
+    The peak memory is therefore not bounded by the largest volume. The MOAB
+    Core holds every volume added so far until the whole mesh is written to
+    the single h5m file, and Gmsh holds the surfaces not yet added, so
+    together they hold about one copy of the whole mesh rather than the two
+    copies of mesh_to_h5m_in_memory_method. On top of that the Python arrays
+    are those of the volume being added, plus an 8 byte MOAB handle for
+    every Gmsh node.
+
+    Args:
+        brep_filename: the filename of the Brep file to convert
+        material_tags: A list of material tags to tag the DAGMC volumes with.
+            Should be in the same order as the volumes. Alternatively a
+            dictionary of the expected properties of the parts, see
+            brep_to_h5m, which are matched to the volumes using their OCC
+            geometry in the same Gmsh session.
+        h5m_filename: the filename of the DAGMC h5m file to write
+        min_mesh_size: the minimum mesh element size to use in Gmsh. Passed
+            into gmsh.option.setNumber("Mesh.MeshSizeMin", min_mesh_size)
+        max_mesh_size: the maximum mesh element size to use in Gmsh. Passed
+            into gmsh.option.setNumber("Mesh.MeshSizeMax", max_mesh_size)
+        mesh_algorithm: The Gmsh mesh algorithm number to use. Passed into
+            gmsh.option.setNumber("Mesh.Algorithm", mesh_algorithm)
+        num_threads: the number of threads Gmsh uses when meshing. If None
+            the Gmsh defaults are used.
+        volume_mesh_sizes: a dictionary with gmsh volume tags as keys and
+            mesh element sizes as values, overriding max_mesh_size for those
+            volumes. A surface shared by two volumes uses the smaller size.
+        tolerance: if set, the maximum distance between the triangles and
+            the CAD surfaces. The surfaces are meshed with Gmsh's curvature
+            based sizing, which is refined until the measured deviation is
+            below the tolerance. The deviation of each volume is reported in
+            the progress events.
+        shared_surfaces: If True each surface is written once as a DAGMC
+            surface with sense tags for the volumes on either side of it. If
+            False the triangles of every volume are written as a separate
+            surface so surfaces between volumes are duplicated.
+        progress_callback: a function called with a dictionary event at the
+            start and end of each stage, reporting the time taken, the peak
+            memory and the element counts. The events are also logged to the
+            "brep_to_h5m" logger.
 
     Returns:
         The filename of the h5m file produced
     """
 
+    from .h5m import _MoabWriter
+
     if isinstance(material_tags, str):
         msg = f"material_tags should be a list of strings, not a single string."
         raise ValueError(msg)
 
+    with stage("import", progress_callback) as counts:
+        volumes = _import_brep(brep_filename)
+        counts["volumes"] = len(volumes)
+
+    if isinstance(material_tags, dict):
+        with stage("match", progress_callback) as counts:
+            try:
+                material_tags = match_material_tags(
+                    material_tags,
+                    occ_volume_properties([dim_and_vol[1] for dim_and_vol in volumes]),
+                )
+            except ValueError:
+                _finalize_gmsh()
+                raise
+            counts["volumes"] = len(material_tags)
+
     if len(volumes) != len(material_tags):
+        _finalize_gmsh()
         msg = f"{len(volumes)} volumes found in Brep file is not equal to the number of material_tags {len(material_tags)} provided."
         raise ValueError(msg)
 
-    n = 3  # number of verts in a triangles
-    nodes_in_each_pg = []
-    for dim_and_vol in volumes:
+    _check_volume_mesh_sizes(volume_mesh_sizes, volumes)
+
+    _set_mesh_options(
+        min_mesh_size=min_mesh_size,
+        max_mesh_size=max_mesh_size,
+        mesh_algorithm=mesh_algorithm,
+        num_threads=num_threads,
+        volume_mesh_sizes=volume_mesh_sizes,
+        tolerance=tolerance,
+    )
+    _generate_mesh(tolerance, progress_callback=progress_callback)
+
+    with stage("stream_write", progress_callback) as counts:
+        volume_surfaces, surface_senses = _get_volume_boundaries(
+            [dim_and_vol[1] for dim_and_vol in volumes]
+        )
+        writer = _MoabWriter()
+        for vol_id, material_tag in zip(volume_surfaces, material_tags):
+            writer.add_volume(vol_id, material_tag)
+
+        # the MOAB handle of each gmsh node, 0 until the node is first used
+        vertex_handles = np.zeros(gmsh.model.mesh.getMaxNodeTag() + 1, np.uint64)
+
+        counts["triangles"] = 0
+        if shared_surfaces:
+            for surface, (forward, reverse) in surface_senses.items():
+                triangles, _ = _stream_surface(writer, vertex_handles, surface)
+                writer.add_surface(surface, triangles, forward, reverse)
+                counts["triangles"] += len(triangles)
+                gmsh.model.mesh.clear([(2, surface)])
+        else:
+            # the number of volumes still to be added that each surface bounds
+            unwritten_volumes = {surface: 0 for surface in surface_senses}
+            for surfaces in volume_surfaces.values():
+                for surface in surfaces:
+                    unwritten_volumes[surface] += 1
+
+            for vol_id, surfaces in volume_surfaces.items():
+                triangles_in_each_surface = []
+                signed_volume = 0.0
+                for surface in surfaces:
+                    triangles, surface_signed_volume = _stream_surface(
+                        writer, vertex_handles, surface
+                    )
+                    if surface_senses[surface][0] != vol_id:
+                        triangles = triangles[:, ::-1]
+                        surface_signed_volume = -surface_signed_volume
+                    triangles_in_each_surface.append(triangles)
+                    signed_volume += surface_signed_volume
+
+                triangles = np.concatenate(triangles_in_each_surface, axis=0)
+                if signed_volume < 0:
+                    triangles = triangles[:, ::-1]
+                writer.add_surface(vol_id, triangles, vol_id, 0)
+                counts["triangles"] += len(triangles)
+                del triangles, triangles_in_each_surface
+
+                # surfaces are only cleared once all their volumes are added
+                for surface in surfaces:
+                    unwritten_volumes[surface] -= 1
+                finished = [s for s in surfaces if unwritten_volumes[s] == 0]
+                if finished:
+                    gmsh.model.mesh.clear([(2, surface) for surface in finished])
+
+        counts["vertices"] = int(np.count_nonzero(vertex_handles))
+
+        _finalize_gmsh()
+
+        writer.write(h5m_filename)
 
-        # removes all groups so that the following getEntitiesForPhysicalGroup
-        # command only finds surfaces for the volume
-        gmsh.model.removePhysicalGroups()
+    return h5m_filename
 
-        vol_id = dim_and_vol[1]
-        entities_in_volume = gmsh.model.getAdjacencies(3, vol_id)
-        surfaces_in_volume = entities_in_volume[1]
-        ps = gmsh.model.addPhysicalGroup(2, surfaces_in_volume)
-        gmsh.model.setPhysicalName(2, ps, f"surfaces_on_volume_{vol_id}")
 
-        groups = gmsh.model.getPhysicalGroups()
-        group = groups[0]
-        # for group in groups:
-        dim = group[0]
-        tag = group[1]
+def _stream_surface(
+    writer: "_MoabWriter", vertex_handles: np.ndarray, surface: int
+) -> Tuple[np.ndarray, float]:
+    """Adds the nodes of a meshed gmsh surface that are not already in the
+    MOAB Core and gets the triangles of the surface.
 
-        surfaces = gmsh.model.getEntitiesForPhysicalGroup(dim, tag)
+    Args:
+        writer: the MOAB writer to add the nodes to
+        vertex_handles: the MOAB handle of each gmsh node tag, 0 for nodes
+            not yet added. Updated with the handles of the new nodes.
+        surface: the tag of the gmsh surface
 
-        nodes_in_all_surfaces = []
-        for surface in surfaces:
-            _, _, nodeTags = gmsh.model.mesh.getElements(2, surface)
-            nodeTags = nodeTags[0].tolist()
-            shifted_node_tags = []
-            for nodeTag in nodeTags:
-                shifted_node_tags.append(nodeTag - 1)
-            grouped_node_tags = [
-                shifted_node_tags[i : i + n]
-                for i in range(0, len(shifted_node_tags), n)
-            ]
-            nodes_in_all_surfaces += grouped_node_tags
-        nodes_in_each_pg.append(nodes_in_all_surfaces)
+    Returns:
+        An (M, 3) array of the MOAB vertex handles of the triangles and six
+        times the signed volume of the triangles
+    """
 
-    _, all_coords, _ = gmsh.model.mesh.getNodes()
+    triangles = _get_surface_triangles(surface)
 
-    GroupedCoords = [
-        all_coords[i : i + n].tolist() for i in range(0, len(all_coords), n)
-    ]
+    node_tags, coords, _ = gmsh.model.mesh.getNodes(2, surface, includeBoundary=True)
+    node_tags, rows = np.unique(np.asarray(node_tags, np.int64), return_index=True)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)[rows]
 
-    gmsh.finalize()
+    new_nodes = vertex_handles[node_tags] == 0
+    if new_nodes.any():
+        vertex_handles[node_tags[new_nodes]] = writer.add_vertices(coords[new_nodes])
 
-    # checks and fixes triangle fix_normals within vertices_to_h5m
-    vertices_to_h5m(
-        vertices=GroupedCoords,
-        triangles=nodes_in_each_pg,
-        material_tags=material_tags,
-        h5m_filename=h5m_filename,
-    )
+    local_triangles = np.searchsorted(node_tags, triangles)
+    signed_volume = _signed_volume(coords, local_triangles)
 
-    return h5m_filename
+    return vertex_handles[triangles], signed_volume
 
 
-def mesh_to_h5m_stl_method(
-    volumes,
-    material_tags: Iterable[str],
-    h5m_filename: str = "dagmc.h5m",
-    write_stl_files_to_temp: bool = True,
-    delete_intermediate_stl_files: bool = True,
-) -> str:
-    """Converts gmsh volumes into a DAGMC h5m file.
+def _get_surface_mesh(volumes) -> SurfaceMesh:
+    """Gets the surface mesh of each volume from the current Gmsh model.
 
     Args:
         volumes: the volumes in the gmsh file, found with gmsh.model.occ.importShapes
-        material_tags: A list of material tags to tag the DAGMC volumes with.
-            Should be in the same order as the volumes
-        h5m_filename: the filename of the DAGMC h5m file to write
-        write_stl_files_to_temp: If set to True the intermediate STL files
-            required will be written to the operating systems temporary file
-            folder. If set to False the STL files will be written to the
-            current working directory.
-        delete_intermediate_stl_files: If set to True the intermediate STL
-            files produced will be deleted. If set the False the intermediate
-            STL files will be left intact.
 
     Returns:
-        The filename of the h5m file produced
+        The surface mesh of the volumes
     """
 
-    stl_filenames = []
-    for dim_and_vol in volumes:
-        vol_id = dim_and_vol[1]
-        entities_in_volume = gmsh.model.getAdjacencies(3, vol_id)
-        surfaces_in_volume = entities_in_volume[1]
-        ps = gmsh.model.addPhysicalGroup(2, surfaces_in_volume)
-        gmsh.model.setPhysicalName(2, ps, f"surfaces_on_volume_{vol_id}")
-        if write_stl_files_to_temp:
-            tmp_filename = tempfile.mkstemp(suffix=".stl", prefix=f"volume_{vol_id}")[1]
-        else:
-            tmp_filename = f"volume_{vol_id}.stl"
-        gmsh.write(tmp_filename)
-        stl_filenames.append((vol_id, tmp_filename))
-        gmsh.model.removePhysicalGroups([])  # removes all groups
-    gmsh.finalize()
-
-    files_with_tags = []
-    for filename_vol_id in stl_filenames:
-        filename = filename_vol_id[1]
-        vol_id = filename_vol_id[0]
-        # if vol_id in volumes_with_tags.keys():
-        mesh = trimesh.load_mesh(filename, file_type="stl")
-        if mesh.is_watertight is False:
-            msg = f"file {filename} is watertight"
+    volume_surfaces, surface_senses = _get_volume_boundaries(
+        [dim_and_vol[1] for dim_and_vol in volumes]
+    )
+
+    # each surface is pulled once even when it is shared by two volumes
+    surface_triangles = {
+        surface: _get_surface_triangles(surface) for surface in surface_senses
+    }
+
+    node_tags, all_coords, _ = gmsh.model.mesh.getNodes()
+
+    vertices, triangles_in_each_surface = _compact_nodes(
+        node_tags=node_tags,
+        coords=all_coords,
+        triangles_in_each_surface=list(surface_triangles.values()),
+    )
+
+    return SurfaceMesh(
+        vertices=vertices,
+        surface_triangles=dict(zip(surface_triangles, triangles_in_each_surface)),
+        volume_surfaces=volume_surfaces,
+        surface_senses=surface_senses,
+    )
+
+
+def _get_volume_boundaries(
+    volume_tags: List[int],
+) -> Tuple[Dict[int, List[int]], Dict[int, Tuple[int, int]]]:
+    """Finds the surfaces bounding each volume and the volumes on the forward
+    and reverse side of each surface with one oriented boundary query per
+    volume. The mesh of a surface follows the orientation of the surface, so
+    the triangle normals point out of the forward volume and into the reverse
+    volume.
+
+    Args:
+        volume_tags: the tags of the gmsh volumes
+
+    Returns:
+        A dictionary with the volume tags as keys and the tags of the surfaces
+        bounding each volume as values and a dictionary with the surface tags
+        as keys and a tuple of the forward and reverse volume tags as values,
+        with 0 where there is no volume
+    """
+
+    volume_surfaces = {}
+    parents = {}
+    for vol_id in volume_tags:
+        signed_surfaces = [
+            tag
+            for _, tag in gmsh.model.getBoundary(
+                [(3, vol_id)], combined=False, oriented=True
+            )
+        ]
+        volume_surfaces[vol_id] = [abs(tag) for tag in signed_surfaces]
+        for signed_surface in signed_surfaces:
+            parents.setdefault(abs(signed_surface), []).append(
+                (vol_id, np.sign(signed_surface))
+            )
+
+    surface_senses = {}
+    for surface, vols_and_signs in parents.items():
+        forward = [vol_id for vol_id, sign in vols_and_signs if sign > 0]
+        reverse = [vol_id for vol_id, sign in vols_and_signs if sign < 0]
+        if len(forward) > 1 or len(reverse) > 1:
+            msg = (
+                f"surface {surface} has the same orientation in volumes "
+                f"{[vol_id for vol_id, _ in vols_and_signs]}"
+            )
             warnings.warn(msg)
-        trimesh.repair.fix_normals(
-            mesh
-        )  # reqired as gmsh stl export from brep can get the inside outside mixed up
-        new_filename = filename[:-4] + "_with_corrected_face_normals.stl"
-        mesh.export(new_filename)
-
-        if delete_intermediate_stl_files:
-            os.remove(filename)  # deletes tmp stl file
-        tag_name = material_tags[vol_id - 1]
-        if not tag_name.startswith("mat:"):
-            # TODO check if graveyard or mat_graveyard should be excluded
-            # and tag_name.lower!='graveyard':
-            tag_name = f"mat:{tag_name}"
-        files_with_tags.append((new_filename, tag_name))
-
-    stl_to_h5m(files_with_tags=files_with_tags, h5m_filename=h5m_filename)
-
-    # deletes the stl with corrected faces file from the tmp dir
-    if delete_intermediate_stl_files:
-        for file_to_del in files_with_tags:
-            os.remove(file_to_del[0])
+            forward, reverse = forward + reverse, reverse + forward
+        surface_senses[surface] = (
+            forward[0] if forward else 0,
+            reverse[-1] if reverse else 0,
+        )
 
-    return h5m_filename
+    return volume_surfaces, surface_senses
 
 
-def transport_particles_on_h5m_geometry(
-    h5m_filename: str,
-    material_tags: list,
-    nuclides: list = None,
-    cross_sections_xml: str = None,
-):
-    """A function for testing the geometry file with particle transport in
-    DAGMC OpenMC. Requires openmc and either the cross_sections_xml to be
-    specified or openmc_data_downloader installed. Returns the flux on each
-    volume
+def _get_surface_triangles(surface: int) -> np.ndarray:
+    """Gets the triangles on a meshed gmsh surface as an array of gmsh node
+    tags.
 
-    Arg:
-        h5m_filename: The name of the DAGMC h5m file to test
-        material_tags: The
-        nuclides:
-        cross_sections_xml:
+    Args:
+        surface: the tag of the gmsh surface
 
+    Returns:
+        An (M, 3) array of node tags, one row per triangle
     """
 
-    import openmc
-    from openmc.data import NATURAL_ABUNDANCE
+    _, _, node_tags = gmsh.model.mesh.getElements(2, surface)
+    if len(node_tags) == 0:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.asarray(node_tags[0], dtype=np.int64).reshape(-1, 3)
 
-    if nuclides is None:
-        nuclides = list(NATURAL_ABUNDANCE.keys())
 
-    materials = openmc.Materials()
-    for i, material_tag in enumerate(material_tags):
+def _compact_nodes(
+    node_tags: Iterable[int],
+    coords: Iterable[float],
+    triangles_in_each_surface: List[np.ndarray],
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Renumbers the nodes so that only the nodes used by the triangles are
+    kept and the triangles index into the compacted vertices. Gmsh node tags
+    are not guaranteed to be contiguous or to start at 1 and getNodes also
+    returns the nodes on curves, points and volumes.
 
-        # simplified material definitions have been used to keen this example minimal
-        mat_dag_material_tag = openmc.Material(name=material_tag)
-        mat_dag_material_tag.add_nuclide(nuclides[i], 1, "ao")
-        mat_dag_material_tag.set_density("g/cm3", 0.1)
+    Args:
+        node_tags: the node tags returned by gmsh.model.mesh.getNodes
+        coords: the flat node coordinates returned by gmsh.model.mesh.getNodes
+        triangles_in_each_surface: (M, 3) arrays of node tags, one per surface
 
-        materials.append(mat_dag_material_tag)
+    Returns:
+        The (N, 3) array of used vertices and the triangles of each surface as
+        (M, 3) arrays of zero based indices into those vertices
+    """
 
-    if cross_sections_xml:
-        materials.cross_sections = cross_sections_xml
-    else:
-        # downloads the nuclear data and sets the openmc_cross_sections environmental variable
-        import openmc_data_downloader as odd
+    node_tags = np.asarray(node_tags, dtype=np.int64)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
 
-        odd.just_in_time_library_generator(
-            libraries="ENDFB-7.1-NNDC", materials=materials
-        )
+    if len(triangles_in_each_surface) == 0:
+        return np.empty((0, 3), dtype=np.float64), []
 
-    dag_univ = openmc.DAGMCUniverse(filename=h5m_filename)
-    bound_dag_univ = dag_univ.bounded_universe()
-    geometry = openmc.Geometry(root=bound_dag_univ)
+    all_triangles = np.concatenate(triangles_in_each_surface, axis=0)
+    used_tags = np.unique(all_triangles)
 
-    # initializes a new source object
-    my_source = openmc.Source()
+    # surfaces with no triangles use no nodes
+    if len(used_tags) == 0:
+        return np.empty((0, 3), dtype=np.float64), [
+            np.empty((0, 3), dtype=np.int64) for _ in triangles_in_each_surface
+        ]
 
-    center_of_geometry = (
-        (dag_univ.bounding_box[0][0] + dag_univ.bounding_box[1][0]) / 2,
-        (dag_univ.bounding_box[0][1] + dag_univ.bounding_box[1][1]) / 2,
-        (dag_univ.bounding_box[0][2] + dag_univ.bounding_box[1][2]) / 2,
-    )
-    # sets the location of the source which is not on a vertex
-    center_of_geometry_nudged = (
-        center_of_geometry[0] + 0.1,
-        center_of_geometry[1] + 0.1,
-        center_of_geometry[2] + 0.1,
+    # maps every gmsh node tag to its row in the coords array
+    tag_to_row = np.full(
+        max(node_tags.max(initial=0), used_tags.max()) + 1, -1, np.int64
     )
+    tag_to_row[node_tags] = np.arange(len(node_tags))
+    used_rows = tag_to_row[used_tags]
+    if np.any(used_rows < 0):
+        msg = "Some triangles reference nodes that were not returned by gmsh"
+        raise ValueError(msg)
+
+    # maps every used gmsh node tag to its index in the compacted vertices
+    tag_to_index = np.full(len(tag_to_row), -1, np.int64)
+    tag_to_index[used_tags] = np.arange(len(used_tags))
+
+    vertices = coords[used_rows]
+    renumbered = tag_to_index[all_triangles]
+
+    offsets = np.cumsum([len(triangles) for triangles in triangles_in_each_surface])
+    return vertices, np.split(renumbered, offsets[:-1])
+
+
+def mesh_to_h5m_stl_method(
+    surface_mesh: SurfaceMesh,
+    material_tags: Iterable[str],
+    h5m_filename: str = "dagmc.h5m",
+    fix_normals: str = "topology",
+) -> str:
+    """Converts a surface mesh into a DAGMC h5m file by way of a separate
+    trimesh.Trimesh for each volume. This used to be done with intermediate
+    STL files but the meshes are now kept in memory.
+
+    Args:
+        surface_mesh: the surface mesh of the volumes, found with mesh_brep
+        material_tags: A list of material tags to tag the DAGMC volumes with.
+            Should be in the same order as the volumes
+        h5m_filename: the filename of the DAGMC h5m file to write
+        fix_normals: how the triangles of each volume are made to point
+            outwards. "topology" flips the surfaces using the orientation
+            found by Gmsh and "trimesh" uses trimesh.repair.fix_normals,
+            which is much slower.
+
+    Returns:
+        The filename of the h5m file produced
+    """
+
+    if fix_normals not in ("topology", "trimesh"):
+        msg = f'fix_normals should be "topology" or "trimesh", not {fix_normals}'
+        raise ValueError(msg)
 
-    my_source.space = openmc.stats.Point(center_of_geometry_nudged)
-    # sets the direction to isotropic
-    my_source.angle = openmc.stats.Isotropic()
-    # sets the energy distribution to 100% 14MeV neutrons
-    my_source.energy = openmc.stats.Discrete([14e6], [1])
-
-    # specifies the simulation computational intensity
-    settings = openmc.Settings()
-    settings.batches = 10
-    settings.particles = 10000
-    settings.inactive = 0
-    settings.run_mode = "fixed source"
-    settings.source = my_source
-
-    # adds a tally to record the heat deposited in entire geometry
-    cell_tally = openmc.Tally(name="flux")
-    cell_tally.scores = ["flux"]
-
-    # groups the two tallies
-    tallies = openmc.Tallies([cell_tally])
-
-    # builds the openmc model
-    my_model = openmc.Model(
-        materials=materials, geometry=geometry, settings=settings, tallies=tallies
+    import trimesh
+
+    from .h5m import write_trimeshes_h5m
+
+    surface_mesh.check_material_tags(material_tags)
+
+    report = validate_surface_mesh(surface_mesh)
+    leaky_volumes = set(report["open_edges"]) | set(report["non_manifold_edges"])
+
+    meshes = []
+    for vol_id in surface_mesh.volumes:
+        mesh = surface_mesh.volume_trimesh(vol_id, oriented=fix_normals == "topology")
+        if vol_id in leaky_volumes:
+            msg = f"volume {vol_id} is not watertight"
+            warnings.warn(msg)
+        if fix_normals == "trimesh":
+            trimesh.repair.fix_normals(mesh)
+        meshes.append(mesh)
+
+    write_trimeshes_h5m(
+        meshes=meshes,
+        material_tags=material_tags,
+        h5m_filename=h5m_filename,
     )
 
-    # starts the simulation
-    output_file = my_model.run()
+    return h5m_filename
 
-    # loads up the output file from the simulation
-    statepoint = openmc.StatePoint(output_file)
 
-    my_flux_cell_tally = statepoint.get_tally(name="flux")
+def __getattr__(name: str):
+    # transport_particles_on_h5m_geometry moved to the transport module, it
+    # is still found here so imports from brep_to_h5m.core keep working
+    if name == "transport_particles_on_h5m_geometry":
+        msg = (
+            "importing transport_particles_on_h5m_geometry from brep_to_h5m.core "
+            "is deprecated, import it from brep_to_h5m instead"
+        )
+        warnings.warn(msg, DeprecationWarning, stacklevel=2)
+        from .transport import transport_particles_on_h5m_geometry
 
-    return my_flux_cell_tally.mean.flatten()[0]
+        return transport_particles_on_h5m_geometry
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,528 @@
+from typing import Tuple
+
+import numpy as np
+
+from .surface_mesh import SurfaceMesh, _concatenate, _split
+
+
+def decimate(surface_mesh: SurfaceMesh, tolerance: float) -> Tuple[SurfaceMesh, dict]:
+    """Reduces the number of triangles in a surface mesh by collapsing edges
+    inside each surface. The vertices on the curves between surfaces are
+    never moved or removed, so the surfaces shared between volumes stay
+    conformal and every volume stays watertight. A collapse is only made if
+    the original vertices it affects, and the centroids and edge midpoints of
+    their original triangles, stay within the tolerance of the new
+    triangles. The collapses are made in rounds with numpy, each round making
+    the collapses with the lowest quadric error in their neighbourhood, so
+    the collapses of a round do not touch the same triangles. Most of the
+    time is spent measuring the sampled points against the new triangles,
+    around half a minute for two hundred thousand triangles.
+
+    Args:
+        surface_mesh: the surface mesh to decimate
+        tolerance: the maximum distance between the original surface and the
+            decimated triangles
+
+    Returns:
+        The decimated surface mesh and a dictionary reporting the number of
+        triangles before and after, the fraction of triangles removed and the
+        largest and mean distance of the points sampled from the original
+        surface from the decimated triangles
+    """
+
+    vertices = surface_mesh.vertices
+
+    # vertices used by more than one surface lie on the curves between them
+    surfaces_per_vertex = np.zeros(len(vertices), dtype=np.int64)
+    for triangles in surface_mesh.surface_triangles.values():
+        surfaces_per_vertex[np.unique(triangles)] += 1
+    locked = surfaces_per_vertex > 1
+
+    # each surface gets its own copy of its vertices, so all the surfaces are
+    # decimated at once without a collapse joining two surfaces
+    originals, local_triangles, lengths = [], [], []
+    n_local = 0
+    for triangles in surface_mesh.surface_triangles.values():
+        used, local = np.unique(triangles, return_inverse=True)
+        local_triangles.append(local.reshape(-1, 3) + n_local)
+        originals.append(used)
+        lengths.append(len(triangles))
+        n_local += len(used)
+    originals = _concatenate(originals, (0,))
+    triangles, alive, deviations = _decimate_triangles(
+        vertices[originals],
+        _concatenate(local_triangles, (0, 3)),
+        locked[originals],
+        tolerance,
+    )
+
+    # the triangles of each surface are still in the order of the surfaces
+    surface_of_each_triangle = np.repeat(np.arange(len(lengths)), lengths)
+    kept_lengths = np.bincount(surface_of_each_triangle[alive], minlength=len(lengths))
+    surface_triangles = dict(
+        zip(
+            surface_mesh.surface_triangles,
+            _split(originals[triangles[alive]], kept_lengths),
+        )
+    )
+
+    decimated = SurfaceMesh(
+        vertices=vertices,
+        surface_triangles=surface_triangles,
+        volume_surfaces=surface_mesh.volume_surfaces,
+        surface_senses=surface_mesh.surface_senses,
+    )
+    # removes the vertices that are no longer used by any triangle
+    decimated = decimated.subset(decimated.volumes)
+
+    triangles_before = surface_mesh.number_of_triangles
+    triangles_after = decimated.number_of_triangles
+    report = {
+        "triangles_before": triangles_before,
+        "triangles_after": triangles_after,
+        "reduction": (
+            1 - triangles_after / triangles_before if triangles_before else 0.0
+        ),
+        "max_deviation": float(deviations.max(initial=0.0)),
+        "mean_deviation": float(deviations.mean()) if len(deviations) else 0.0,
+    }
+
+    return decimated, report
+
+
+def _decimate_triangles(
+    vertices: np.ndarray, triangles: np.ndarray, locked: np.ndarray, tolerance: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Collapses the edges of triangles in rounds of collapses that do not
+    touch the same triangles.
+
+    Args:
+        vertices: the (N, 3) array of vertex coordinates
+        triangles: the (M, 3) array of triangles
+        locked: an (N,) boolean array of the vertices that can not be removed
+        tolerance: the maximum distance between the original surface and the
+            decimated triangles
+
+    Returns:
+        The (M, 3) array of triangles after the collapses, an (M,) boolean
+        array of the triangles that are kept and the distance of every point
+        sampled from the original surface from the decimated triangles
+    """
+
+    n_vertices = len(vertices)
+    triangles = triangles.copy()
+    alive = np.ones(len(triangles), dtype=bool)
+
+    edges = np.sort(triangles[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1)
+    _, first, counts = np.unique(
+        edges[:, 0] * n_vertices + edges[:, 1], return_index=True, return_counts=True
+    )
+    # the vertices on open edges are on the boundary of the surface
+    fixed = locked.copy()
+    fixed[edges[first[counts != 2]].ravel()] = True
+
+    # an unweighted quadric per vertex from the planes of its triangles, so
+    # the square root of the quadric error bounds the distance to any plane
+    corners = vertices[triangles]
+    normals = _normals(corners)
+    lengths = np.linalg.norm(normals, axis=1)
+    normals = normals / np.where(lengths > 0, lengths, 1)[:, None]
+    planes = np.concatenate(
+        [normals, -np.einsum("ij,ij->i", normals, corners[:, 0])[:, None]], axis=1
+    )
+    face_quadrics = np.einsum("ij,ik->ijk", planes, planes)
+    quadrics = np.zeros((n_vertices, 4, 4))
+    for n in range(3):
+        np.add.at(quadrics, triangles[:, n], face_quadrics)
+    homogeneous = np.concatenate([vertices, np.ones((n_vertices, 1))], axis=1)
+
+    # the points sampled from the original surface are the vertices and the
+    # centroid and edge midpoints of each triangle. Each point is kept with
+    # the triangle it is nearest to and is checked again whenever that
+    # triangle changes.
+    vertex_face = np.zeros(n_vertices, dtype=np.int64)
+    vertex_face[triangles.ravel()] = np.repeat(np.arange(len(triangles)), 3)
+    samples = np.concatenate(
+        [vertices, corners.mean(axis=1), vertices[edges[first]].mean(axis=1)]
+    )
+    sample_faces = np.concatenate([vertex_face, np.arange(len(triangles)), first // 3])
+    deviations = np.zeros(len(samples))
+
+    rng = np.random.default_rng(0)
+    # the collapses that failed, tried again once their neighbourhood changes
+    rejected = np.empty(0, dtype=np.int64)
+
+    while True:
+        faces = np.flatnonzero(alive)
+        face_vertices = triangles[faces].ravel()
+        order = np.argsort(face_vertices, kind="stable")
+        vertex_faces = np.repeat(faces, 3)[order]
+        face_starts = np.searchsorted(face_vertices[order], np.arange(n_vertices + 1))
+
+        # every edge in both directions, sorted by the vertex it starts from
+        pairs = triangles[faces][:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2)
+        pair_keys = np.unique(
+            np.concatenate(
+                [
+                    pairs[:, 0] * n_vertices + pairs[:, 1],
+                    pairs[:, 1] * n_vertices + pairs[:, 0],
+                ]
+            )
+        )
+        neighbours = pair_keys % n_vertices
+        neighbour_starts = np.searchsorted(
+            pair_keys // n_vertices, np.arange(n_vertices + 1)
+        )
+
+        keys = pair_keys[~fixed[pair_keys // n_vertices]]
+        keys = keys[~np.isin(keys, rejected)]
+        u, v = keys // n_vertices, keys % n_vertices
+        errors = np.einsum("ci,cij,cj->c", homogeneous[v], quadrics[u], homogeneous[v])
+        within = errors <= tolerance**2
+        keys, u, v, errors = keys[within], u[within], v[within], errors[within]
+
+        # the cheapest collapse of each u that keeps the surface manifold and
+        # does not flip or flatten a triangle. The next cheapest collapses
+        # are only checked for the u whose cheapest collapse is not allowed.
+        order = np.lexsort((errors, u))
+        keys, u, v, errors = keys[order], u[order], v[order], errors[order]
+        firsts = np.flatnonzero(np.diff(u, prepend=-1))
+        groups = np.cumsum(np.diff(u, prepend=-1) != 0) - 1
+        ranks = np.arange(len(u)) - firsts[groups]
+        chosen = np.full(len(firsts), -1)
+        for rank in range(ranks.max(initial=-1) + 1):
+            trying = np.flatnonzero((ranks == rank) & (chosen[groups] < 0))
+            allowed = _allowed(
+                vertices,
+                triangles,
+                u[trying],
+                v[trying],
+                vertex_faces,
+                face_starts,
+                neighbours,
+                neighbour_starts,
+                pair_keys,
+            )
+            rejected = np.concatenate([rejected, keys[trying[~allowed]]])
+            chosen[groups[trying[allowed]]] = trying[allowed]
+        chosen = chosen[chosen >= 0]
+        if len(chosen) == 0:
+            break
+        u, v, errors = u[chosen], v[chosen], errors[chosen]
+
+        # a collapse is made in this round if no collapse with a lower error
+        # changes the triangles it uses, those around u and v, or uses the
+        # triangles it changes, those around u. Errors of the same order are
+        # taken in a random order, as errors vary smoothly over a surface and
+        # would otherwise leave few local minima.
+        levels = np.floor(
+            np.log2(np.maximum(errors, tolerance**2 * 2.0**-20) / tolerance**2)
+        )
+        ranks = np.empty(len(errors), dtype=np.int64)
+        ranks[np.lexsort((rng.random(len(errors)), levels))] = np.arange(len(errors))
+        positions, changing = _ranges(face_starts[u], face_starts[u + 1])
+        changed_faces = vertex_faces[positions]
+        positions, using = _ranges(face_starts[v], face_starts[v + 1])
+        used_faces = vertex_faces[positions]
+        lowest_change = np.full(len(triangles), len(errors))
+        np.minimum.at(lowest_change, changed_faces, ranks[changing])
+        lowest_use = lowest_change.copy()
+        np.minimum.at(lowest_use, used_faces, ranks[using])
+        blocked = np.concatenate(
+            [
+                changing[lowest_use[changed_faces] != ranks[changing]],
+                using[lowest_change[used_faces] < ranks[using]],
+            ]
+        )
+        selected = np.bincount(blocked, minlength=len(errors)) == 0
+        u, v = u[selected], v[selected]
+
+        # the two triangles on the edge are removed and the others around u
+        # are moved onto v
+        positions, u_face_owners = _ranges(face_starts[u], face_starts[u + 1])
+        u_faces = vertex_faces[positions]
+        on_edge = (triangles[u_faces] == v[u_face_owners, None]).any(axis=1)
+        moved_faces, moved_owners = u_faces[~on_edge], u_face_owners[~on_edge]
+        old = triangles[moved_faces]
+        new = np.where(old == u[moved_owners, None], v[moved_owners, None], old)
+
+        # the points nearest the changed triangles are checked against the
+        # triangles around v after the collapse, which cover the same area
+        positions, owners = _ranges(face_starts[v], face_starts[v + 1])
+        v_faces = vertex_faces[positions]
+        kept = ~(triangles[v_faces] == u[owners, None]).any(axis=1)
+        fan_faces = np.concatenate([v_faces[kept], moved_faces])
+        fan_owners = np.concatenate([owners[kept], moved_owners])
+        fan = np.concatenate([triangles[v_faces[kept]], new])
+        order = np.argsort(fan_owners, kind="stable")
+        fan_faces, fan = fan_faces[order], fan[order]
+        fan_starts = np.searchsorted(fan_owners[order], np.arange(len(u) + 1))
+
+        face_owners = np.full(len(triangles), -1)
+        face_owners[u_faces] = u_face_owners
+        points = np.flatnonzero(face_owners[sample_faces] >= 0)
+        point_owners = face_owners[sample_faces[points]]
+        positions, pair_points = _ranges(
+            fan_starts[point_owners], fan_starts[point_owners + 1]
+        )
+        distances = _distances(samples[points[pair_points]], vertices[fan[positions]])
+        # every collapse moves at least one triangle so no fan is empty
+        point_distances = np.minimum.reduceat(
+            distances, np.searchsorted(pair_points, np.arange(len(points)))
+        )
+        nearest = np.flatnonzero(distances == point_distances[pair_points])
+        nearest = nearest[np.searchsorted(pair_points[nearest], np.arange(len(points)))]
+        point_faces = fan_faces[positions[nearest]]
+
+        worst = np.zeros(len(u))
+        np.maximum.at(worst, point_owners, point_distances)
+        allowed = worst <= tolerance
+
+        # the allowed collapses do not share any triangles so are all made
+        triangles[moved_faces[allowed[moved_owners]]] = new[allowed[moved_owners]]
+        alive[u_faces[on_edge & allowed[u_face_owners]]] = False
+        quadrics[v[allowed]] += quadrics[u[allowed]]
+        made = allowed[point_owners]
+        sample_faces[points[made]] = point_faces[made]
+        deviations[points[made]] = point_distances[made]
+
+        # the failed collapses near the collapses made are tried again
+        positions, _ = _ranges(
+            neighbour_starts[np.concatenate([u[allowed], v[allowed]])],
+            neighbour_starts[np.concatenate([u[allowed], v[allowed]]) + 1],
+        )
+        touched = np.zeros(n_vertices, dtype=bool)
+        touched[neighbours[positions]] = True
+        rejected = rejected[
+            ~touched[rejected // n_vertices] & ~touched[rejected % n_vertices]
+        ]
+        rejected = np.concatenate([rejected, u[~allowed] * n_vertices + v[~allowed]])
+
+    return triangles, alive, deviations
+
+
+def _allowed(
+    vertices: np.ndarray,
+    triangles: np.ndarray,
+    u: np.ndarray,
+    v: np.ndarray,
+    vertex_faces: np.ndarray,
+    face_starts: np.ndarray,
+    neighbours: np.ndarray,
+    neighbour_starts: np.ndarray,
+    pair_keys: np.ndarray,
+) -> np.ndarray:
+    """Checks that collapsing each u onto v keeps the surface manifold and
+    does not flip or flatten any of the triangles that are moved.
+
+    Args:
+        vertices: the (N, 3) array of vertex coordinates
+        triangles: the (M, 3) array of triangles
+        u: the vertices to move
+        v: the vertices they are moved onto
+        vertex_faces: the triangles around every vertex, in the order of the
+            vertex
+        face_starts: the index of the first triangle around each vertex
+        neighbours: the neighbours of every vertex, in the order of the vertex
+        neighbour_starts: the index of the first neighbour of each vertex
+        pair_keys: the sorted keys of every edge in both directions
+
+    Returns:
+        A boolean array of the collapses that are allowed
+    """
+
+    allowed = _link_condition(u, v, neighbours, neighbour_starts, pair_keys)
+
+    # the two triangles on the edge are removed and the others are moved
+    positions, owners = _ranges(face_starts[u], face_starts[u + 1])
+    faces = triangles[vertex_faces[positions]]
+    on_edge = (faces == v[owners, None]).any(axis=1)
+    allowed &= np.bincount(owners[on_edge], minlength=len(u)) == 2
+    moved = ~on_edge
+    flipped = _flipped(vertices, faces[moved], u[owners[moved]], v[owners[moved]])
+    allowed &= np.bincount(owners[moved][flipped], minlength=len(u)) == 0
+
+    return allowed
+
+
+def _link_condition(
+    u: np.ndarray,
+    v: np.ndarray,
+    neighbours: np.ndarray,
+    neighbour_starts: np.ndarray,
+    pair_keys: np.ndarray,
+) -> np.ndarray:
+    """Checks that each u and v only share the two vertices opposite their
+    edge, so collapsing the edge keeps the surface manifold.
+
+    Args:
+        u: the vertices to move
+        v: the vertices they are moved onto
+        neighbours: the neighbours of every vertex, in the order of the vertex
+        neighbour_starts: the index of the first neighbour of each vertex
+        pair_keys: the sorted keys of every edge in both directions
+
+    Returns:
+        A boolean array of the collapses that keep the surface manifold
+    """
+
+    n_vertices = len(neighbour_starts) - 1
+    positions, owners = _ranges(neighbour_starts[u], neighbour_starts[u + 1])
+    keys = v[owners] * n_vertices + neighbours[positions]
+    found = pair_keys[np.minimum(np.searchsorted(pair_keys, keys), len(pair_keys) - 1)]
+    return np.bincount(owners[found == keys], minlength=len(u)) == 2
+
+
+def _flipped(
+    vertices: np.ndarray, old: np.ndarray, u: np.ndarray, v: np.ndarray
+) -> np.ndarray:
+    """Checks which triangles are flipped or made degenerate by moving their
+    vertex u onto v.
+
+    Args:
+        vertices: the (N, 3) array of vertex coordinates
+        old: the (F, 3) array of triangles before the move
+        u: the vertex of each triangle that is moved
+        v: the vertex each u is moved onto
+
+    Returns:
+        An (F,) boolean array of the triangles that are flipped or degenerate
+    """
+
+    new = np.where(old == u[:, None], v[:, None], old)
+    old_normals = _normals(vertices[old])
+    new_normals = _normals(vertices[new])
+    return (
+        np.linalg.norm(new_normals, axis=1)
+        <= 1e-12 * np.linalg.norm(old_normals, axis=1)
+    ) | (np.einsum("ij,ij->i", old_normals, new_normals) <= 0)
+
+
+def _ranges(starts: np.ndarray, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Expands ranges of indices into one array.
+
+    Args:
+        starts: the first index of each range
+        stops: the index after the last index of each range
+
+    Returns:
+        The indices in all the ranges and the range each index is from
+    """
+
+    lengths = stops - starts
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owners
+
+
+def _normals(corners: np.ndarray) -> np.ndarray:
+    """Finds the unnormalised normals of (F, 3, 3) triangle corners"""
+
+    return _cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Finds the cross products of broadcast arrays of vectors, which is
+    faster than np.cross for the small arrays of each collapse"""
+
+    return np.stack(
+        [
+            a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1],
+            a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2],
+            a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0],
+        ],
+        axis=-1,
+    )
+
+
+def _point_triangle_distances(points: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    """Finds the distance from every point to every triangle.
+
+    Args:
+        points: a (P, 3) array of points
+        corners: an (F, 3, 3) array of the corners of the triangles
+
+    Returns:
+        A (P, F) array of distances
+    """
+
+    return _distances(points[:, None], corners[None])
+
+
+def _distances(points: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    """Finds the distances from points to triangles, broadcasting the points
+    against the triangles. The closest point on each triangle is found from
+    the region of the triangle the point projects onto, following Ericson,
+    Real-Time Collision Detection, 5.1.5.
+
+    Args:
+        points: a (..., 3) array of points
+        corners: a (..., 3, 3) array of the corners of the triangles
+
+    Returns:
+        The broadcast array of distances
+    """
+
+    a, b, c = corners[..., 0, :], corners[..., 1, :], corners[..., 2, :]
+    ab, ac, ap = b - a, c - a, points - a
+    d1, d2 = _dot(ab, ap), _dot(ac, ap)
+    bp = points - b
+    d3, d4 = _dot(ab, bp), _dot(ac, bp)
+    cp = points - c
+    d5, d6 = _dot(ab, cp), _dot(ac, cp)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    # the closest point is a + s * ab + t * ac
+    with np.errstate(divide="ignore", invalid="ignore"):
+        on_ab = d1 / (d1 - d3)
+        on_ac = d2 / (d2 - d6)
+        on_bc = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        total = va + vb + vc
+        regions = [
+            (d1 <= 0) & (d2 <= 0),
+            (d3 >= 0) & (d4 <= d3),
+            (vc <= 0) & (d1 >= 0) & (d3 <= 0),
+            (d6 >= 0) & (d5 <= d6),
+            (vb <= 0) & (d2 >= 0) & (d6 <= 0),
+            (va <= 0) & (d4 >= d3) & (d5 >= d6),
+        ]
+        s = np.select(regions, [0, 1, on_ab, 0, 0, 1 - on_bc], 0)
+        t = np.select(regions, [0, 0, 0, 1, on_ac, on_bc], 0)
+        offsets = ap - s[..., None] * ab - t[..., None] * ac
+        distances = np.sqrt(_dot(offsets, offsets))
+
+        # the points over the triangles are measured to their planes
+        normals = _cross(ab, ac)
+        heights = np.abs(_dot(ap, normals)) / np.sqrt(_dot(normals, normals))
+        distances = np.where(np.any(regions, axis=0), distances, heights)
+
+    # the triangles with no area are measured to their edges instead
+    degenerate = total <= 0
+    if np.any(degenerate):
+        points, corners = np.broadcast_arrays(points[..., None, :], corners)
+        distances[degenerate] = _point_segment_distances(
+            points[degenerate],
+            corners[degenerate],
+            np.roll(corners[degenerate], -1, axis=-2),
+        ).min(axis=-1)
+
+    return distances
+
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Finds the dot products of broadcast arrays of vectors"""
+
+    return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1] + a[..., 2] * b[..., 2]
+
+
+def _point_segment_distances(
+    p: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> np.ndarray:
+    """Finds the distances from points to line segments, broadcasting the
+    (..., 3) points against the (..., 3) starts and ends"""
+
+    direction = end - start
+    length_squared = _dot(direction, direction)
+    t = _dot(p - start, direction) / np.where(length_squared > 0, length_squared, 1)
+    offsets = p - (start + np.clip(t, 0, 1)[..., None] * direction)
+    return np.sqrt(_dot(offsets, offsets))
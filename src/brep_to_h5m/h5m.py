@@ -0,0 +1,382 @@
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Tuple
+
+import numpy as np
+from pymoab import core, types
+
+if TYPE_CHECKING:
+    import trimesh
+
+    from .surface_mesh import SurfaceMesh
+
+from .instrumentation import stage
+from .surface_mesh import _signed_volume
+
+
+def write_h5m(
+    surface_mesh: "SurfaceMesh",
+    material_tags: Iterable[str],
+    h5m_filename: str = "dagmc.h5m",
+    shared_surfaces: bool = False,
+    fix_normals: str = "topology",
+    progress_callback: Callable[[dict], None] = None,
+) -> str:
+    """Writes a surface mesh to a DAGMC h5m file using PyMOAB. The vertices
+    and triangles are created with one call per array rather than one call
+    per entity so the time taken scales with the size of the arrays.
+
+    Args:
+        surface_mesh: the surface mesh to write
+        material_tags: A list of material tags to tag the DAGMC volumes with.
+            Should be in the same order as the volumes
+        h5m_filename: the filename of the DAGMC h5m file to write
+        shared_surfaces: If True each surface is written once and the
+            GEOM_SENSE_2 tag records which volume is on the forward side (the
+            side the triangle normals point out of) and which is on the
+            reverse side. If False the triangles of every volume are written
+            as a separate surface so surfaces between volumes are duplicated.
+        fix_normals: how the triangles of each volume are made to point
+            outwards when shared_surfaces is False. "topology" flips the
+            triangles of each surface in one array operation using the
+            orientation of the surface relative to the volume found by Gmsh.
+            "trimesh" uses trimesh.repair.fix_normals, which traverses the
+            face adjacency graph and is much slower on large volumes.
+        progress_callback: a function called with a dictionary event at the
+            start and end of the normal fixing and writing stages.
+
+    Returns:
+        The filename of the h5m file produced
+    """
+
+    if fix_normals not in ("topology", "trimesh"):
+        msg = f'fix_normals should be "topology" or "trimesh", not {fix_normals}'
+        raise ValueError(msg)
+
+    surface_mesh.check_material_tags(material_tags)
+
+    if shared_surfaces:
+        senses = _oriented_surface_senses(surface_mesh)
+        surfaces = [
+            (surface, triangles, *senses[surface])
+            for surface, triangles in surface_mesh.surface_triangles.items()
+        ]
+    else:
+        # the triangles of each volume are checked and fixed to point outwards
+        with stage("fix_normals", progress_callback) as counts:
+            surfaces = []
+            for vol_id in surface_mesh.volumes:
+                if fix_normals == "topology":
+                    triangles = surface_mesh.volume_triangles(vol_id, oriented=True)
+                else:
+                    triangles = _fix_normals(
+                        surface_mesh.vertices, surface_mesh.volume_triangles(vol_id)
+                    )
+                surfaces.append((vol_id, triangles, vol_id, 0))
+            counts["volumes"] = len(surfaces)
+
+    with stage("write", progress_callback) as counts:
+        _write_moab_file(
+            vertices=surface_mesh.vertices,
+            volumes=surface_mesh.volumes,
+            material_tags=material_tags,
+            surfaces=surfaces,
+            h5m_filename=h5m_filename,
+        )
+        counts["surfaces"] = len(surfaces)
+        counts["triangles"] = sum(len(triangles) for _, triangles, _, _ in surfaces)
+
+    return h5m_filename
+
+
+def _oriented_surface_senses(surface_mesh: "SurfaceMesh") -> Dict[int, Tuple[int, int]]:
+    """Finds the forward and reverse volume of each surface, swapping them for
+    the surfaces of any volume that the triangle normals point into. This is
+    the same guard as SurfaceMesh.volume_triangles(oriented=True) applies when
+    the surfaces are written separately for each volume.
+
+    Args:
+        surface_mesh: the surface mesh to be written
+
+    Returns:
+        A dictionary with the surface tags as keys and a tuple of the forward
+        and reverse volume tags as values
+    """
+
+    senses = {
+        surface: tuple(sense) for surface, sense in surface_mesh.surface_senses.items()
+    }
+    for volume, surfaces in surface_mesh.volume_surfaces.items():
+        # the signed volume is the sum of that of each surface, negated for
+        # the surfaces whose normals point into the volume
+        signed_volume = sum(
+            _signed_volume(surface_mesh.vertices, surface_mesh.surface_triangles[s])
+            * (1 if surface_mesh.surface_senses[s][0] == volume else -1)
+            for s in surfaces
+        )
+        if signed_volume < 0:
+            for surface in surfaces:
+                forward, reverse = senses[surface]
+                senses[surface] = (reverse, forward)
+
+    return senses
+
+
+def write_trimeshes_h5m(
+    meshes: Iterable["trimesh.Trimesh"],
+    material_tags: Iterable[str],
+    h5m_filename: str = "dagmc.h5m",
+) -> str:
+    """Writes a separate trimesh.Trimesh for each volume to a DAGMC h5m file.
+    Each mesh becomes a volume with a single surface.
+
+    Args:
+        meshes: the closed mesh of each volume
+        material_tags: A list of material tags to tag the DAGMC volumes with.
+            Should be in the same order as the meshes
+        h5m_filename: the filename of the DAGMC h5m file to write
+
+    Returns:
+        The filename of the h5m file produced
+    """
+
+    vertices = []
+    surfaces = []
+    offset = 0
+    for vol_id, mesh in enumerate(meshes, 1):
+        vertices.append(np.asarray(mesh.vertices, dtype=np.float64))
+        faces = np.asarray(mesh.faces, dtype=np.int64) + offset
+        surfaces.append((vol_id, faces, vol_id, 0))
+        offset += len(mesh.vertices)
+
+    _write_moab_file(
+        vertices=np.concatenate(vertices, axis=0),
+        volumes=[vol_id for vol_id, _, _, _ in surfaces],
+        material_tags=material_tags,
+        surfaces=surfaces,
+        h5m_filename=h5m_filename,
+    )
+
+    return h5m_filename
+
+
+def _write_moab_file(
+    vertices: np.ndarray,
+    volumes: Iterable[int],
+    material_tags: Iterable[str],
+    surfaces: Iterable[Tuple[int, np.ndarray, int, int]],
+    h5m_filename: str,
+):
+    """Builds the DAGMC entity sets in a MOAB Core and writes it to a file.
+
+    Args:
+        vertices: the (N, 3) array of vertex coordinates
+        volumes: the gmsh volume tags
+        material_tags: the material tag of each volume
+        surfaces: the surface id, (M, 3) array of triangles and the forward and
+            reverse volume tags of each DAGMC surface
+        h5m_filename: the filename of the DAGMC h5m file to write
+    """
+
+    writer = _MoabWriter()
+
+    for vol_id, material_tag in zip(volumes, material_tags):
+        writer.add_volume(vol_id, material_tag)
+
+    vertex_handles = writer.add_vertices(vertices)
+
+    for surface, triangles, forward, reverse in surfaces:
+        writer.add_surface(surface, vertex_handles[triangles], forward, reverse)
+
+    writer.write(h5m_filename)
+
+
+class _MoabWriter:
+    """Builds up the DAGMC entity sets in a MOAB Core one volume and surface
+    at a time so that the mesh arrays can be released after each is added."""
+
+    def __init__(self):
+        self.moab_core, self.tags = _define_moab_core_and_tags()
+        self.volume_sets = {}
+        self.surface_sets = {}
+
+    def add_volume(self, vol_id: int, material_tag: str):
+        """Adds a volume set and a material group containing it.
+
+        Args:
+            vol_id: the gmsh volume tag
+            material_tag: the material tag of the volume
+        """
+
+        moab_core, tags = self.moab_core, self.tags
+
+        volume_set = moab_core.create_meshset()
+        moab_core.tag_set_data(tags["category"], volume_set, "Volume")
+
+        if not material_tag.startswith("mat:"):
+            material_tag = f"mat:{material_tag}"
+
+        group_set = moab_core.create_meshset()
+        moab_core.tag_set_data(tags["category"], group_set, "Group")
+        moab_core.tag_set_data(tags["name"], group_set, material_tag)
+        moab_core.tag_set_data(tags["geom_dimension"], group_set, 4)
+        moab_core.add_entity(group_set, volume_set)
+
+        self.volume_sets[vol_id] = volume_set
+
+    def add_vertices(self, vertices: np.ndarray) -> np.ndarray:
+        """Creates vertices with one call.
+
+        Args:
+            vertices: the (N, 3) array of vertex coordinates
+
+        Returns:
+            The (N,) array of MOAB handles of the vertices
+        """
+
+        moab_verts = self.moab_core.create_vertices(
+            np.ascontiguousarray(vertices, dtype=np.float64).flatten()
+        )
+        return np.array(moab_verts, dtype=np.uint64)
+
+    def add_surface(
+        self, surface: int, triangles: np.ndarray, forward: int, reverse: int
+    ):
+        """Adds a surface set containing triangles and links it to the
+        volumes on either side of it.
+
+        Args:
+            surface: the id of the DAGMC surface
+            triangles: the (M, 3) array of MOAB vertex handles of the triangles
+            forward: the volume the triangle normals point out of, 0 if none
+            reverse: the volume the triangle normals point into, 0 if none
+        """
+
+        moab_core, tags = self.moab_core, self.tags
+
+        if forward == 0:
+            # DAGMC expects a surface bounding one volume to be forward so the
+            # triangles are flipped to point out of that volume
+            triangles = triangles[:, ::-1]
+            forward, reverse = reverse, forward
+
+        surface_set = moab_core.create_meshset()
+        moab_core.tag_set_data(tags["category"], surface_set, "Surface")
+
+        moab_triangles = moab_core.create_elements(
+            types.MBTRI, np.ascontiguousarray(triangles)
+        )
+        moab_core.add_entities(surface_set, np.unique(triangles))
+        moab_core.add_entities(surface_set, moab_triangles)
+
+        sense_data = []
+        for vol_id in (forward, reverse):
+            if vol_id in self.volume_sets:
+                moab_core.add_parent_child(self.volume_sets[vol_id], surface_set)
+                sense_data.append(self.volume_sets[vol_id])
+            else:
+                sense_data.append(np.uint64(0))
+        moab_core.tag_set_data(tags["surf_sense"], surface_set, sense_data)
+
+        self.surface_sets[surface] = surface_set
+
+    def write(self, h5m_filename: str):
+        """Sets the ids of the volumes and surfaces and writes the file.
+
+        Args:
+            h5m_filename: the filename of the DAGMC h5m file to write
+        """
+
+        moab_core, tags = self.moab_core, self.tags
+
+        # the integer tags of all the volume and surface sets are set at once
+        for dimension, sets in [(3, self.volume_sets), (2, self.surface_sets)]:
+            handles = np.array(list(sets.values()), dtype=np.uint64)
+            ids = np.array(list(sets.keys()), dtype=np.int32)
+            moab_core.tag_set_data(tags["global_id"], handles, ids)
+            moab_core.tag_set_data(
+                tags["geom_dimension"],
+                handles,
+                np.full(len(handles), dimension, np.int32),
+            )
+
+        all_sets = moab_core.get_entities_by_handle(0)
+
+        file_set = moab_core.create_meshset()
+
+        moab_core.add_entities(file_set, all_sets)
+
+        moab_core.write_file(str(h5m_filename))
+
+
+def _fix_normals(vertices: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Makes the winding of the triangles of a closed volume consistent and
+    outward facing using trimesh.
+
+    Args:
+        vertices: the (N, 3) array of vertex coordinates
+        triangles: an (M, 3) array of vertex indices
+
+    Returns:
+        The (M, 3) array of triangles with corrected winding
+    """
+
+    import trimesh
+
+    mesh = trimesh.Trimesh(vertices=vertices, faces=triangles, process=False)
+
+    mesh.fix_normals()
+
+    return np.asarray(mesh.faces, dtype=np.int64)
+
+
+def _define_moab_core_and_tags() -> Tuple[core.Core, dict]:
+    """Creates a MOAB Core instance which can be built up by adding sets of
+    triangles to the instance
+
+    Returns:
+        (pymoab Core): A pymoab.core.Core() instance
+        (pymoab tag_handle): A pymoab.core.tag_get_handle() instance
+    """
+
+    # create pymoab instance
+    moab_core = core.Core()
+
+    tags = dict()
+
+    sense_tag_name = "GEOM_SENSE_2"
+    sense_tag_size = 2
+    tags["surf_sense"] = moab_core.tag_get_handle(
+        sense_tag_name,
+        sense_tag_size,
+        types.MB_TYPE_HANDLE,
+        types.MB_TAG_SPARSE,
+        create_if_missing=True,
+    )
+
+    tags["category"] = moab_core.tag_get_handle(
+        types.CATEGORY_TAG_NAME,
+        types.CATEGORY_TAG_SIZE,
+        types.MB_TYPE_OPAQUE,
+        types.MB_TAG_SPARSE,
+        create_if_missing=True,
+    )
+
+    tags["name"] = moab_core.tag_get_handle(
+        types.NAME_TAG_NAME,
+        types.NAME_TAG_SIZE,
+        types.MB_TYPE_OPAQUE,
+        types.MB_TAG_SPARSE,
+        create_if_missing=True,
+    )
+
+    tags["geom_dimension"] = moab_core.tag_get_handle(
+        types.GEOM_DIMENSION_TAG_NAME,
+        1,
+        types.MB_TYPE_INTEGER,
+        types.MB_TAG_DENSE,
+        create_if_missing=True,
+    )
+
+    # Global ID is a default tag, just need the name to retrieve
+    tags["global_id"] = moab_core.tag_get_handle(types.GLOBAL_ID_TAG_NAME)
+
+    return moab_core, tags
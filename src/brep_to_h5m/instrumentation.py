@@ -0,0 +1,80 @@
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger("brep_to_h5m")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Finds the peak resident set size (memory high-water mark) of the
+    current process.
+
+    Returns:
+        The peak resident set size in MB or None if it is not available on
+        this platform
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / 1e6
+    return peak / 1e3
+
+
+@contextmanager
+def stage(name: str, progress_callback: Callable[[dict], None] = None):
+    """Reports the start and end of a stage of the conversion. Each report is
+    a dictionary event that is logged to the "brep_to_h5m" logger and passed
+    to the progress_callback. The finished event includes the time taken, the
+    peak memory and any counts added to the yielded dictionary.
+
+    Args:
+        name: the name of the stage, for example "import" or "write"
+        progress_callback: a function called with every event. If None the
+            events are only logged.
+
+    Yields:
+        A dictionary that counts, such as the number of triangles, can be
+        added to and are included in the finished event
+    """
+
+    _emit({"stage": name, "status": "started"}, progress_callback)
+
+    counts = {}
+    start = time.perf_counter()
+    yield counts
+
+    event = {
+        "stage": name,
+        "status": "finished",
+        "elapsed_s": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    event.update(counts)
+    _emit(event, progress_callback)
+
+
+def _emit(event: dict, progress_callback: Callable[[dict], None] = None):
+    """Logs an event and passes it to the progress_callback"""
+
+    if event["status"] == "finished":
+        details = ", ".join(
+            f"{key}={value:.3g}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in event.items()
+            if key not in ("stage", "status") and value is not None
+        )
+        logger.info("%s finished: %s", event["stage"], details)
+    else:
+        logger.info("%s started", event["stage"])
+
+    if progress_callback is not None:
+        progress_callback(event)
@@ -0,0 +1,221 @@
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+
+from .surface_mesh import SurfaceMesh
+
+# the number of nearest volumes considered for each part before falling
+# back to comparing the part with every unmatched volume
+_CANDIDATES = 8
+
+
+def match_material_tags(
+    parts: Dict[str, Union[dict, List[dict]]], volume_properties: Dict[str, np.ndarray]
+) -> List[str]:
+    """Works out the material tag of each volume by matching the volumes to
+    the expected properties of the parts. Each part is compared with its
+    nearest volumes, found with a KD-tree of the volume centres, and the
+    closest pairs are matched first so each volume gets one part. Uses
+    scipy.spatial.cKDTree if scipy is installed and a slower numpy search
+    if not.
+
+    Args:
+        parts: a dictionary with material tags as keys and the properties of
+            the part, or a list of the properties of several parts, with that
+            material as values. The properties are "center", the centre of
+            mass, and optionally "bounding_box", as [xmin, ymin, zmin, xmax,
+            ymax, zmax], and "volume".
+        volume_properties: the properties of the volumes, from
+            occ_volume_properties or mesh_volume_properties
+
+    Returns:
+        The material tag of each volume, in the order of the volume_properties
+    """
+
+    material_tags = []
+    part_properties = []
+    for material_tag, properties in parts.items():
+        if isinstance(properties, dict):
+            properties = [properties]
+        for part in properties:
+            material_tags.append(material_tag)
+            part_properties.append(part)
+
+    centers = volume_properties["centers"]
+    if len(part_properties) != len(centers):
+        msg = f"{len(part_properties)} parts were given for {len(centers)} volumes"
+        raise ValueError(msg)
+
+    costs = _match_cost_function(part_properties, volume_properties)
+
+    part_centers = np.array([part["center"] for part in part_properties], float)
+    k = min(_CANDIDATES, len(centers))
+    candidates = _nearest_volumes(centers, part_centers, k)
+
+    # the closest part and volume pairs are matched first
+    pairs = [
+        (cost, part, volume)
+        for part, volumes in enumerate(candidates)
+        for volume, cost in zip(volumes, costs(part, volumes))
+    ]
+    matches = _match_closest(pairs, len(centers))
+
+    # parts whose nearest volumes were all matched to other parts are
+    # compared with every volume left over
+    unmatched_parts = [part for part in range(len(centers)) if part not in matches]
+    if unmatched_parts:
+        matched_volumes = set(matches.values())
+        unmatched_volumes = np.array(
+            [volume for volume in range(len(centers)) if volume not in matched_volumes]
+        )
+        pairs = [
+            (cost, part, volume)
+            for part in unmatched_parts
+            for volume, cost in zip(unmatched_volumes, costs(part, unmatched_volumes))
+        ]
+        matches.update(_match_closest(pairs, len(centers)))
+
+    volume_material_tags = [None] * len(centers)
+    for part, volume in matches.items():
+        volume_material_tags[volume] = material_tags[part]
+
+    return volume_material_tags
+
+
+def occ_volume_properties(volume_tags: Iterable[int]) -> Dict[str, np.ndarray]:
+    """Finds the properties of volumes in the current Gmsh model from the
+    OCC geometry, without meshing or loading the Brep file again.
+
+    Args:
+        volume_tags: the tags of the gmsh volumes
+
+    Returns:
+        A dictionary with the (V, 3) array of "centers", the (V, 6) array of
+        "bounding_boxes" and the (V,) array of "volumes"
+    """
+
+    import gmsh
+
+    volume_tags = list(volume_tags)
+
+    return {
+        "centers": np.array(
+            [gmsh.model.occ.getCenterOfMass(3, tag) for tag in volume_tags], float
+        ).reshape(-1, 3),
+        "bounding_boxes": np.array(
+            [gmsh.model.occ.getBoundingBox(3, tag) for tag in volume_tags], float
+        ).reshape(-1, 6),
+        "volumes": np.array([gmsh.model.occ.getMass(3, tag) for tag in volume_tags]),
+    }
+
+
+def mesh_volume_properties(surface_mesh: SurfaceMesh) -> Dict[str, np.ndarray]:
+    """Finds the properties of the volumes of a surface mesh, which are
+    within the mesh tolerance of those of the CAD volumes.
+
+    Args:
+        surface_mesh: the surface mesh of the volumes
+
+    Returns:
+        A dictionary with the (V, 3) array of "centers", the (V, 6) array of
+        "bounding_boxes" and the (V,) array of "volumes", in the order of the
+        volumes of the surface mesh
+    """
+
+    centers, bounding_boxes, volumes = [], [], []
+    for vol_id in surface_mesh.volumes:
+        triangles = surface_mesh.volume_triangles(vol_id, oriented=True)
+        corners = surface_mesh.vertices[triangles]
+
+        # the tetrahedra between the origin and each triangle
+        tetrahedra = np.einsum(
+            "ij,ij->i", corners[:, 0], np.cross(corners[:, 1], corners[:, 2])
+        )
+        volume = tetrahedra.sum() / 6
+        centers.append(
+            np.einsum("i,ij->j", tetrahedra, corners.sum(axis=1)) / (24 * volume)
+        )
+
+        used = surface_mesh.vertices[np.unique(triangles)]
+        bounding_boxes.append(np.concatenate([used.min(axis=0), used.max(axis=0)]))
+        volumes.append(volume)
+
+    return {
+        "centers": np.array(centers, float).reshape(-1, 3),
+        "bounding_boxes": np.array(bounding_boxes, float).reshape(-1, 6),
+        "volumes": np.array(volumes, float),
+    }
+
+
+def _match_cost_function(part_properties: List[dict], volume_properties: dict):
+    """Makes a function that scores how different a part is from each of
+    an array of volumes, using every property the part has"""
+
+    centers = volume_properties["centers"]
+    bounding_boxes = volume_properties["bounding_boxes"]
+    volumes = volume_properties["volumes"]
+
+    # lengths are compared relative to the size of the whole model
+    extent = np.concatenate(
+        [bounding_boxes[:, :3].min(0), bounding_boxes[:, 3:].max(0)]
+    )
+    scale = np.linalg.norm(extent[3:] - extent[:3]) or 1.0
+
+    def costs(part: int, volume_indices: np.ndarray) -> np.ndarray:
+        properties = part_properties[part]
+        cost = (
+            np.linalg.norm(centers[volume_indices] - properties["center"], axis=1)
+            / scale
+        )
+        if properties.get("bounding_box") is not None:
+            bounding_box = np.asarray(properties["bounding_box"], float).reshape(6)
+            cost += (
+                np.abs(bounding_boxes[volume_indices] - bounding_box).max(axis=1)
+                / scale
+            )
+        if properties.get("volume") is not None:
+            cost += np.abs(volumes[volume_indices] - properties["volume"]) / max(
+                abs(properties["volume"]), 1e-12
+            )
+        return cost
+
+    return costs
+
+
+def _nearest_volumes(
+    centers: np.ndarray, part_centers: np.ndarray, k: int
+) -> np.ndarray:
+    """Finds the indices of the k volumes with centres nearest each part"""
+
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        cKDTree = None
+
+    if cKDTree is not None:
+        _, nearest = cKDTree(centers).query(part_centers, k=k)
+        return np.asarray(nearest).reshape(len(part_centers), k)
+
+    # without scipy the distances are found in blocks of parts to limit
+    # the memory used
+    nearest = np.empty((len(part_centers), k), dtype=np.int64)
+    for start in range(0, len(part_centers), 1024):
+        block = part_centers[start : start + 1024]
+        distances = np.linalg.norm(block[:, None, :] - centers[None, :, :], axis=2)
+        nearest[start : start + 1024] = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return nearest
+
+
+def _match_closest(pairs: list, n_volumes: int) -> Dict[int, int]:
+    """Matches parts to volumes one to one, taking the lowest cost pairs
+    first"""
+
+    matches = {}
+    matched_volumes = set()
+    for _, part, volume in sorted(pairs):
+        if part not in matches and volume not in matched_volumes:
+            matches[part] = int(volume)
+            matched_volumes.add(volume)
+            if len(matches) == n_volumes:
+                break
+    return matches
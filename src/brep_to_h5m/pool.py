@@ -0,0 +1,108 @@
+import atexit
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, Iterable, List
+
+
+class ConversionPool:
+    """A pool of worker processes that each keep a Gmsh session open, see
+    gmsh_session, so a long running service can convert many Brep files
+    without starting Gmsh for every one. The conversions are sent to the
+    workers through the queue of a ProcessPoolExecutor and each worker
+    runs one conversion at a time, as Gmsh can only hold one model per
+    process.
+
+    Args:
+        workers: the number of worker processes. If None the number of CPUs
+            is used.
+
+    Example:
+        with ConversionPool(workers=4) as pool:
+            future = pool.submit(brep_filename="part.brep", material_tags=["steel"])
+            h5m_filename = future.result()
+    """
+
+    def __init__(self, workers: int = None):
+        # spawn is used as gmsh holds global state that is not safe to fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_start_worker_session,
+        )
+
+    def submit(self, **kwargs) -> Future:
+        """Queues a conversion with brep_to_h5m.
+
+        Args:
+            kwargs: the arguments of brep_to_h5m
+
+        Returns:
+            A future of the filename of the h5m file produced
+        """
+
+        return self._executor.submit(_run, "brep_to_h5m", kwargs)
+
+    def submit_mesh(self, **kwargs) -> Future:
+        """Queues the meshing of a Brep file with mesh_brep.
+
+        Args:
+            kwargs: the arguments of mesh_brep
+
+        Returns:
+            A future of the SurfaceMesh of the Brep file
+        """
+
+        return self._executor.submit(_run, "mesh_brep", kwargs)
+
+    def map(self, jobs: Iterable[Dict]) -> List[str]:
+        """Converts several Brep files with brep_to_h5m and waits for them to
+        finish.
+
+        Args:
+            jobs: the arguments of brep_to_h5m for each conversion
+
+        Returns:
+            The filename of each h5m file produced, in the order of the jobs
+        """
+
+        futures = [self.submit(**job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Waits for the queued conversions to finish and stops the workers,
+        which finalizes their Gmsh sessions"""
+
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "ConversionPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _start_worker_session():
+    """Opens a Gmsh session for the lifetime of a worker process and loads
+    the OCC kernel and the writing backends before the first conversion"""
+
+    import gmsh
+
+    # h5m is imported here so the first conversion does not wait for PyMOAB
+    from . import core, h5m
+
+    # the workers do not print the Gmsh messages of every conversion
+    session = core.gmsh_session(terminal=False)
+    session.__enter__()
+    atexit.register(session.__exit__, None, None, None)
+
+    gmsh.model.occ.addBox(0, 0, 0, 1, 1, 1)
+    gmsh.model.occ.synchronize()
+    gmsh.clear()
+
+
+def _run(function_name: str, kwargs: Dict):
+    """Runs one of the functions of core in a worker"""
+
+    from . import core
+
+    return getattr(core, function_name)(**kwargs)
@@ -0,0 +1,399 @@
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import trimesh
+
+
+class SurfaceMesh:
+    """A conformal surface mesh of the volumes in a Brep file that no longer
+    depends on the Gmsh session that created it. The mesh can be written to
+    several files, for example with different material tags, without
+    meshing the Brep file again.
+
+    Args:
+        vertices: the (N, 3) array of vertex coordinates
+        surface_triangles: a dictionary with the gmsh surface tags as keys
+            and (M, 3) arrays of zero based vertex indices as values
+        volume_surfaces: a dictionary with the gmsh volume tags as keys and
+            the tags of the surfaces bounding each volume as values. The
+            order of the keys is the order of the volumes in the Brep file.
+        surface_senses: a dictionary with the gmsh surface tags as keys and
+            a tuple of the forward and reverse volume tags as values, with 0
+            where there is no volume. The triangle normals point out of the
+            forward volume. If None the first volume bounded by each surface
+            is taken as the forward volume.
+    """
+
+    def __init__(
+        self,
+        vertices: np.ndarray,
+        surface_triangles: Dict[int, np.ndarray],
+        volume_surfaces: Dict[int, Iterable[int]],
+        surface_senses: Dict[int, Tuple[int, int]] = None,
+    ):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.surface_triangles = {
+            int(surface): np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+            for surface, triangles in surface_triangles.items()
+        }
+        self.volume_surfaces = {
+            int(volume): [int(surface) for surface in surfaces]
+            for volume, surfaces in volume_surfaces.items()
+        }
+
+        if surface_senses is None:
+            surface_senses = {}
+            for volume, surfaces in self.volume_surfaces.items():
+                for surface in surfaces:
+                    forward, _ = surface_senses.get(surface, (0, 0))
+                    if forward == 0:
+                        surface_senses[surface] = (volume, 0)
+                    else:
+                        surface_senses[surface] = (forward, volume)
+        self.surface_senses = {
+            int(surface): (int(forward), int(reverse))
+            for surface, (forward, reverse) in surface_senses.items()
+        }
+
+    def __repr__(self):
+        return (
+            f"SurfaceMesh({len(self.volumes)} volumes, "
+            f"{len(self.surface_triangles)} surfaces, "
+            f"{len(self.vertices)} vertices, {self.number_of_triangles} triangles)"
+        )
+
+    @property
+    def volumes(self) -> List[int]:
+        """The gmsh volume tags in the order of the volumes in the Brep file"""
+        return list(self.volume_surfaces.keys())
+
+    @property
+    def number_of_triangles(self) -> int:
+        """The number of triangles in the mesh, counting shared surfaces once"""
+        return sum(len(t) for t in self.surface_triangles.values())
+
+    def volume_triangles(self, volume: int, oriented: bool = False) -> np.ndarray:
+        """Gets the triangles on all the surfaces of a volume.
+
+        Args:
+            volume: the gmsh volume tag
+            oriented: If True the triangles of the surfaces that the volume is
+                not the forward volume of are flipped, so the normals of all
+                the triangles point out of the volume. If False the triangles
+                keep the orientation of their surface.
+
+        Returns:
+            An (M, 3) array of zero based vertex indices
+        """
+
+        surfaces = self.volume_surfaces[volume]
+        triangles = [self.surface_triangles[surface] for surface in surfaces]
+        if len(triangles) == 0:
+            return np.empty((0, 3), dtype=np.int64)
+        triangles = np.concatenate(triangles, axis=0)
+
+        if oriented:
+            flip = np.repeat(
+                [self.surface_senses[surface][0] != volume for surface in surfaces],
+                [len(self.surface_triangles[surface]) for surface in surfaces],
+            )
+            triangles[flip] = triangles[flip][:, ::-1]
+
+            # guards against a model whose surface orientations are all
+            # reversed, which would leave every normal pointing inwards
+            if _signed_volume(self.vertices, triangles) < 0:
+                triangles = triangles[:, ::-1]
+
+        return triangles
+
+    def triangles_in_each_volume(self, oriented: bool = False) -> List[np.ndarray]:
+        """Gets the triangles of each volume in the order of the volumes.
+
+        Args:
+            oriented: If True the triangles are flipped so that their normals
+                point out of the volume, see volume_triangles
+
+        Returns:
+            A list with an (M, 3) array of zero based vertex indices for each
+            volume
+        """
+
+        return [self.volume_triangles(volume, oriented) for volume in self.volumes]
+
+    def volume_trimesh(self, volume: int, oriented: bool = False) -> "trimesh.Trimesh":
+        """Creates a trimesh.Trimesh of a volume containing only the vertices
+        used by the triangles of that volume.
+
+        Args:
+            volume: the gmsh volume tag
+            oriented: If True the triangles are flipped so that their normals
+                point out of the volume, see volume_triangles
+
+        Returns:
+            The mesh of the volume
+        """
+
+        import trimesh
+
+        used_vertices, faces = np.unique(
+            self.volume_triangles(volume, oriented), return_inverse=True
+        )
+        return trimesh.Trimesh(
+            vertices=self.vertices[used_vertices],
+            faces=faces.reshape(-1, 3),
+            process=False,
+        )
+
+    def write_h5m(
+        self,
+        material_tags: Iterable[str],
+        h5m_filename: str = "dagmc.h5m",
+        shared_surfaces: bool = False,
+        fix_normals: str = "topology",
+        progress_callback: Callable[[dict], None] = None,
+    ) -> str:
+        """Writes the mesh to a DAGMC h5m file.
+
+        Args:
+            material_tags: A list of material tags to tag the DAGMC volumes
+                with. Should be in the same order as the volumes
+            h5m_filename: the filename of the DAGMC h5m file to write
+            shared_surfaces: If True each surface is written once as a DAGMC
+                surface with sense tags for the volumes on either side of it.
+                If False the triangles of every volume are written as a
+                separate surface so surfaces between volumes are duplicated.
+            fix_normals: how the triangles of each volume are made to point
+                outwards when shared_surfaces is False. "topology" flips the
+                surfaces using the orientation found by Gmsh and "trimesh"
+                uses trimesh.repair.fix_normals, which is much slower.
+            progress_callback: a function called with a dictionary event at
+                the start and end of each stage of the writing.
+
+        Returns:
+            The filename of the h5m file produced
+        """
+
+        from .h5m import write_h5m
+
+        return write_h5m(
+            surface_mesh=self,
+            material_tags=material_tags,
+            h5m_filename=h5m_filename,
+            shared_surfaces=shared_surfaces,
+            fix_normals=fix_normals,
+            progress_callback=progress_callback,
+        )
+
+    def write_stl(self, volume: int, stl_filename: str) -> str:
+        """Writes the mesh of a single volume to a STL file, with the
+        triangles flipped to point out of the volume.
+
+        Args:
+            volume: the gmsh volume tag
+            stl_filename: the filename of the STL file to write
+
+        Returns:
+            The filename of the STL file produced
+        """
+
+        self.volume_trimesh(volume, oriented=True).export(stl_filename, file_type="stl")
+
+        return stl_filename
+
+    def save(self, filename: str):
+        """Saves the mesh arrays to a NumPy .npz file that can be loaded with
+        SurfaceMesh.load.
+
+        Args:
+            filename: the filename or file object to save to
+        """
+
+        surfaces = list(self.surface_triangles.keys())
+        triangles = [self.surface_triangles[surface] for surface in surfaces]
+        surfaces_in_volumes = list(self.volume_surfaces.values())
+        senses = [self.surface_senses[surface] for surface in surfaces]
+
+        np.savez(
+            filename,
+            vertices=self.vertices,
+            surfaces=np.array(surfaces, dtype=np.int64),
+            triangles=_concatenate(triangles, shape=(0, 3)),
+            triangles_per_surface=[len(t) for t in triangles],
+            volumes=np.array(self.volumes, dtype=np.int64),
+            volume_surfaces=_concatenate(surfaces_in_volumes, shape=(0,)),
+            surfaces_per_volume=[len(s) for s in surfaces_in_volumes],
+            surface_senses=np.array(senses, dtype=np.int64).reshape(-1, 2),
+        )
+
+    @classmethod
+    def load(cls, filename: str) -> "SurfaceMesh":
+        """Loads a mesh saved with SurfaceMesh.save.
+
+        Args:
+            filename: the filename or file object to load from
+
+        Returns:
+            The loaded mesh
+        """
+
+        with np.load(filename) as saved:
+            triangles = _split(saved["triangles"], saved["triangles_per_surface"])
+            volume_surfaces = _split(
+                saved["volume_surfaces"], saved["surfaces_per_volume"]
+            )
+            return cls(
+                vertices=saved["vertices"],
+                surface_triangles=dict(zip(saved["surfaces"].tolist(), triangles)),
+                volume_surfaces=dict(zip(saved["volumes"].tolist(), volume_surfaces)),
+                surface_senses=dict(
+                    zip(saved["surfaces"].tolist(), saved["surface_senses"].tolist())
+                ),
+            )
+
+    @classmethod
+    def merge(
+        cls, surface_meshes: Iterable["SurfaceMesh"], volumes: Iterable[int] = None
+    ) -> "SurfaceMesh":
+        """Combines meshes that do not share any surfaces into a single mesh.
+
+        Args:
+            surface_meshes: the meshes to combine
+            volumes: the order of the volumes in the combined mesh. If None
+                the volumes keep the order of the meshes.
+
+        Returns:
+            The combined mesh
+        """
+
+        vertices = []
+        surface_triangles = {}
+        volume_surfaces = {}
+        surface_senses = {}
+        offset = 0
+        for surface_mesh in surface_meshes:
+            vertices.append(surface_mesh.vertices)
+            for surface, triangles in surface_mesh.surface_triangles.items():
+                surface_triangles[surface] = triangles + offset
+            volume_surfaces.update(surface_mesh.volume_surfaces)
+            surface_senses.update(surface_mesh.surface_senses)
+            offset += len(surface_mesh.vertices)
+
+        if volumes is not None:
+            volume_surfaces = {volume: volume_surfaces[volume] for volume in volumes}
+
+        return cls(
+            vertices=_concatenate(vertices, shape=(0, 3), dtype=np.float64),
+            surface_triangles=surface_triangles,
+            volume_surfaces=volume_surfaces,
+            surface_senses=surface_senses,
+        )
+
+    def subset(self, volumes: Iterable[int]) -> "SurfaceMesh":
+        """Creates a mesh of some of the volumes containing only the surfaces
+        and vertices used by those volumes.
+
+        Args:
+            volumes: the gmsh volume tags to keep, in the order to keep them
+
+        Returns:
+            The mesh of the volumes
+        """
+
+        volume_surfaces = {volume: self.volume_surfaces[volume] for volume in volumes}
+        surfaces = list(
+            dict.fromkeys(s for surfaces in volume_surfaces.values() for s in surfaces)
+        )
+        triangles = [self.surface_triangles[surface] for surface in surfaces]
+
+        used_vertices, compacted = np.unique(
+            _concatenate(triangles, shape=(0, 3)), return_inverse=True
+        )
+        compacted = _split(compacted.reshape(-1, 3), [len(t) for t in triangles])
+
+        return SurfaceMesh(
+            vertices=self.vertices[used_vertices],
+            surface_triangles=dict(zip(surfaces, compacted)),
+            volume_surfaces=volume_surfaces,
+            surface_senses={
+                surface: tuple(
+                    vol if vol in volume_surfaces else 0
+                    for vol in self.surface_senses[surface]
+                )
+                for surface in surfaces
+            },
+        )
+
+    def renumber(
+        self, volume_map: Dict[int, int], surface_map: Dict[int, int]
+    ) -> "SurfaceMesh":
+        """Creates a copy of the mesh with new volume and surface tags.
+
+        Args:
+            volume_map: a dictionary with the current volume tags as keys and
+                the new volume tags as values
+            surface_map: a dictionary with the current surface tags as keys
+                and the new surface tags as values
+
+        Returns:
+            The renumbered mesh
+        """
+
+        # 0 marks a side of a surface with no volume
+        volume_map = {0: 0, **volume_map}
+
+        return SurfaceMesh(
+            vertices=self.vertices,
+            surface_triangles={
+                surface_map[surface]: triangles
+                for surface, triangles in self.surface_triangles.items()
+            },
+            volume_surfaces={
+                volume_map[volume]: [surface_map[s] for s in surfaces]
+                for volume, surfaces in self.volume_surfaces.items()
+            },
+            surface_senses={
+                surface_map[surface]: (volume_map[forward], volume_map[reverse])
+                for surface, (forward, reverse) in self.surface_senses.items()
+            },
+        )
+
+    def check_material_tags(self, material_tags: Iterable[str]):
+        """Checks that there is a material tag for every volume.
+
+        Args:
+            material_tags: A list of material tags to tag the DAGMC volumes
+                with.
+        """
+
+        if isinstance(material_tags, str):
+            msg = f"material_tags should be a list of strings, not a single string."
+            raise ValueError(msg)
+
+        if len(self.volumes) != len(material_tags):
+            msg = f"{len(self.volumes)} volumes found in Brep file is not equal to the number of material_tags {len(material_tags)} provided."
+            raise ValueError(msg)
+
+
+def _concatenate(arrays: List[np.ndarray], shape: tuple, dtype=np.int64) -> np.ndarray:
+    """Concatenates arrays, returning an empty array of shape if there are
+    none to concatenate"""
+
+    if len(arrays) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.concatenate(arrays, axis=0).astype(dtype, copy=False)
+
+
+def _signed_volume(vertices: np.ndarray, triangles: np.ndarray) -> float:
+    """Finds six times the signed volume enclosed by closed triangles, which
+    is negative when the normals point inwards"""
+
+    v0, v1, v2 = (vertices[triangles[:, n]] for n in range(3))
+    return float(np.einsum("ij,ij->", v0, np.cross(v1, v2)))
+
+
+def _split(array: np.ndarray, lengths: Iterable[int]) -> List[np.ndarray]:
+    """Splits an array into consecutive pieces of the given lengths"""
+
+    return np.split(array, np.cumsum(lengths)[:-1]) if len(lengths) else []
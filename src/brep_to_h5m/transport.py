@@ -0,0 +1,337 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple, Union
+
+if TYPE_CHECKING:
+    import openmc
+
+
+def transport_particles_on_h5m_geometry(
+    h5m_filename: str,
+    material_tags: list,
+    nuclides: list = None,
+    cross_sections_xml: str = None,
+    source: "openmc.Source" = None,
+    batches: int = 10,
+    particles: int = 10000,
+    threads: int = None,
+    mpi_args: List[str] = None,
+    cwd: str = ".",
+    diagnostics: bool = False,
+    max_lost_particles: int = 0,
+    min_particles_per_second: float = None,
+) -> Union[float, dict]:
+    """A function for testing the geometry file with particle transport in
+    DAGMC OpenMC. Requires openmc and either the cross_sections_xml to be
+    specified or openmc_data_downloader installed.
+
+    Args:
+        h5m_filename: The name of the DAGMC h5m file to test
+        material_tags: the material tags of the volumes in the h5m file
+        nuclides: the nuclide to fill each material with, in the order of
+            the material_tags. If None the naturally occurring nuclides are
+            used in the order of their atomic number.
+        cross_sections_xml: the cross_sections.xml file of the nuclear data.
+            If None the nuclear data is found with openmc_data_downloader,
+            which is only done once per process for the same nuclides.
+        source: the openmc source of the particles. If None a 14MeV
+            isotropic point source near the centre of the geometry is used.
+        batches: the number of batches to simulate
+        particles: the number of particles in each batch
+        threads: the number of OpenMP threads OpenMC uses. If None the
+            OpenMC default is used.
+        mpi_args: the MPI launcher arguments, for example
+            ["mpiexec", "-n", "4"]. If None OpenMC is run without MPI.
+        cwd: the folder the OpenMC input and output files are written to
+        diagnostics: If True the simulation carries on when particles are
+            lost and a dictionary describing the quality of the geometry is
+            returned instead of the flux
+        max_lost_particles: the largest number of lost particles that passes
+            in diagnostics mode
+        min_particles_per_second: if set, the slowest transport rate that
+            passes in diagnostics mode, which catches geometry that has
+            become slow to ray trace, for example because the number of
+            triangles has grown
+
+    Returns:
+        The mean of the flux tally or, in diagnostics mode, a dictionary
+        with:
+            flux: the mean of the flux tally over the whole geometry
+            material_flux: the mean flux in each material, keyed by the
+                material tag
+            lost_particles: the number of lost particles
+            lost_particle_locations: the position of each lost particle
+                from its particle restart file
+            particles_per_second: the transport rate
+            initialization_time_s: the time OpenMC took to start up,
+                including loading the DAGMC geometry
+            geometry_load_time_s: the initialization time without the time
+                spent reading the cross sections
+            transport_time_s: the time spent transporting particles
+            passed: True if the lost particles and transport rate are
+                within the limits
+            failures: the reasons the check did not pass
+    """
+
+    import openmc
+
+    materials = _make_materials(material_tags, nuclides)
+    materials.cross_sections = cross_sections_xml or _download_cross_sections(
+        tuple(material.nuclides[0].name for material in materials)
+    )
+
+    # the geometry file is found from the cwd that OpenMC runs in
+    dag_univ = openmc.DAGMCUniverse(filename=str(Path(h5m_filename).resolve()))
+    bound_dag_univ = dag_univ.bounded_universe()
+    geometry = openmc.Geometry(root=bound_dag_univ)
+
+    if source is None:
+        source = _point_source(dag_univ.bounding_box)
+
+    # specifies the simulation computational intensity
+    settings = openmc.Settings()
+    settings.batches = batches
+    settings.particles = particles
+    settings.inactive = 0
+    settings.run_mode = "fixed source"
+    settings.source = source
+    if diagnostics:
+        # lost particles are counted rather than stopping the simulation
+        settings.max_lost_particles = batches * particles
+        settings.rel_max_lost_particles = 1.0
+
+    # adds a tally to record the heat deposited in entire geometry
+    cell_tally = openmc.Tally(name="flux")
+    cell_tally.scores = ["flux"]
+
+    material_tally = openmc.Tally(name="material_flux")
+    material_tally.filters = [openmc.MaterialFilter(materials)]
+    material_tally.scores = ["flux"]
+
+    # groups the two tallies
+    tallies = openmc.Tallies([cell_tally, material_tally])
+
+    # builds the openmc model
+    my_model = openmc.Model(
+        materials=materials, geometry=geometry, settings=settings, tallies=tallies
+    )
+
+    # starts the simulation
+    start = time.time()
+    output_file = Path(my_model.run(threads=threads, mpi_args=mpi_args, cwd=cwd))
+    if not output_file.is_file():
+        output_file = Path(cwd) / output_file
+
+    # loads up the output file from the simulation
+    statepoint = openmc.StatePoint(output_file)
+
+    my_flux_cell_tally = statepoint.get_tally(name="flux")
+
+    if not diagnostics:
+        return my_flux_cell_tally.mean.flatten()[0]
+
+    report = _diagnostics(statepoint, material_tags, cwd, start)
+    report["flux"] = float(my_flux_cell_tally.mean.flatten()[0])
+
+    if report["lost_particles"] > max_lost_particles:
+        report["failures"].append(
+            f"{report['lost_particles']} particles were lost, the limit is "
+            f"{max_lost_particles}"
+        )
+    if (
+        min_particles_per_second is not None
+        and report["particles_per_second"] < min_particles_per_second
+    ):
+        report["failures"].append(
+            f"{report['particles_per_second']:.0f} particles per second is "
+            f"slower than {min_particles_per_second:.0f}"
+        )
+    report["passed"] = not report["failures"]
+
+    return report
+
+
+def transport_particles_on_h5m_geometries(
+    jobs: Iterable[Dict],
+    workers: int = None,
+    cross_sections_xml: str = None,
+) -> List[Union[float, dict]]:
+    """Runs transport_particles_on_h5m_geometry on several h5m files at once
+    in a pool of worker processes. Each job runs in its own temporary folder
+    unless it sets a cwd, so the OpenMC files of the jobs do not overwrite
+    each other. The nuclear data is found once for all the jobs before they
+    start.
+
+    Args:
+        jobs: the arguments of transport_particles_on_h5m_geometry for each
+            h5m file, each with at least an h5m_filename and material_tags
+        workers: the number of jobs to run at the same time. If None the
+            number of CPUs is used.
+        cross_sections_xml: the cross_sections.xml file of the nuclear data
+            for jobs that do not set their own. If None the nuclear data is
+            found with openmc_data_downloader.
+
+    Returns:
+        The result of transport_particles_on_h5m_geometry for each job, in
+        the order of the jobs. This is the mean of the flux tally, or the
+        diagnostics dictionary for jobs that set diagnostics to True.
+    """
+
+    jobs = [dict(job) for job in jobs]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    if cross_sections_xml is None and any(
+        job.get("cross_sections_xml") is None for job in jobs
+    ):
+        nuclides = {
+            material.nuclides[0].name
+            for job in jobs
+            for material in _make_materials(job["material_tags"], job.get("nuclides"))
+        }
+        cross_sections_xml = _download_cross_sections(tuple(sorted(nuclides)))
+
+    for job in jobs:
+        if job.get("cross_sections_xml") is None:
+            job["cross_sections_xml"] = cross_sections_xml
+        # the CPUs are shared between the jobs running at the same time
+        if job.get("threads") is None and job.get("mpi_args") is None:
+            job["threads"] = max(1, (os.cpu_count() or 1) // workers)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n, job in enumerate(jobs):
+            if "cwd" not in job:
+                job["cwd"] = str(Path(tmp_dir) / f"job_{n}")
+                Path(job["cwd"]).mkdir()
+
+        # spawned workers do not share the OpenMC state of this process
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(transport_particles_on_h5m_geometry, **job)
+                for job in jobs
+            ]
+            return [future.result() for future in futures]
+
+
+def _diagnostics(
+    statepoint: "openmc.StatePoint", material_tags: list, cwd: str, start: float
+) -> dict:
+    """Gathers the timings and per material fluxes from a statepoint and the
+    lost particles from the particle restart files written since start"""
+
+    import openmc
+
+    runtime = statepoint.runtime
+    initialization_time = float(runtime["total initialization"])
+    transport_time = float(runtime["transport"])
+    simulated = statepoint.n_particles * statepoint.n_batches
+
+    # OpenMC writes a particle restart file for each lost particle
+    restart_files = [
+        restart_file
+        for restart_file in sorted(Path(cwd).glob("particle_*.h5"))
+        if restart_file.stat().st_mtime >= start
+    ]
+    lost_particle_locations = [
+        [float(x) for x in openmc.Particle(restart_file).xyz]
+        for restart_file in restart_files
+    ]
+
+    material_flux = statepoint.get_tally(name="material_flux").mean.flatten()
+
+    return {
+        "material_flux": dict(zip(material_tags, material_flux.tolist())),
+        "lost_particles": len(restart_files),
+        "lost_particle_locations": lost_particle_locations,
+        "particles_per_second": simulated / transport_time if transport_time else 0.0,
+        "initialization_time_s": initialization_time,
+        "geometry_load_time_s": initialization_time
+        - float(runtime.get("reading cross sections", 0.0)),
+        "transport_time_s": transport_time,
+        "failures": [],
+    }
+
+
+def _make_materials(material_tags: list, nuclides: list = None) -> "openmc.Materials":
+    """Makes a simple material for each material tag containing one nuclide"""
+
+    import openmc
+    from openmc.data import NATURAL_ABUNDANCE
+
+    if nuclides is None:
+        nuclides = list(NATURAL_ABUNDANCE.keys())
+
+    materials = openmc.Materials()
+    for i, material_tag in enumerate(material_tags):
+
+        # simplified material definitions have been used to keen this example minimal
+        mat_dag_material_tag = openmc.Material(name=material_tag)
+        mat_dag_material_tag.add_nuclide(nuclides[i], 1, "ao")
+        mat_dag_material_tag.set_density("g/cm3", 0.1)
+
+        materials.append(mat_dag_material_tag)
+
+    return materials
+
+
+@lru_cache(maxsize=None)
+def _download_cross_sections(nuclides: Tuple[str, ...]) -> str:
+    """Downloads the nuclear data of the nuclides with openmc_data_downloader
+    and returns the path of the cross_sections.xml file. The result is
+    cached so later calls in the same process do not look up the nuclear
+    data again."""
+
+    import openmc
+    import openmc_data_downloader as odd
+
+    materials = openmc.Materials()
+    for nuclide in nuclides:
+        material = openmc.Material()
+        material.add_nuclide(nuclide, 1, "ao")
+        materials.append(material)
+
+    # downloads the nuclear data and sets the openmc_cross_sections environmental variable
+    cross_sections_xml = odd.just_in_time_library_generator(
+        libraries="ENDFB-7.1-NNDC", materials=materials
+    )
+
+    return str(
+        Path(cross_sections_xml or os.environ["OPENMC_CROSS_SECTIONS"]).resolve()
+    )
+
+
+def _point_source(bounding_box) -> "openmc.Source":
+    """Makes a 14MeV isotropic point source near the centre of a bounding box"""
+
+    import openmc
+
+    # initializes a new source object
+    my_source = openmc.Source()
+
+    center_of_geometry = (
+        (bounding_box[0][0] + bounding_box[1][0]) / 2,
+        (bounding_box[0][1] + bounding_box[1][1]) / 2,
+        (bounding_box[0][2] + bounding_box[1][2]) / 2,
+    )
+    # sets the location of the source which is not on a vertex
+    center_of_geometry_nudged = (
+        center_of_geometry[0] + 0.1,
+        center_of_geometry[1] + 0.1,
+        center_of_geometry[2] + 0.1,
+    )
+
+    my_source.space = openmc.stats.Point(center_of_geometry_nudged)
+    # sets the direction to isotropic
+    my_source.angle = openmc.stats.Isotropic()
+    # sets the energy distribution to 100% 14MeV neutrons
+    my_source.energy = openmc.stats.Discrete([14e6], [1])
+
+    return my_source
@@ -0,0 +1,180 @@
+from typing import Dict, List
+
+import numpy as np
+
+from .surface_mesh import SurfaceMesh
+
+
+def validate_surface_mesh(surface_mesh: SurfaceMesh, tolerance: float = 1e-9) -> dict:
+    """Checks that a surface mesh can be used as DAGMC geometry. Every volume
+    should be closed, with each edge used by exactly two of its triangles
+    that run along the edge in opposite directions once the triangles are
+    oriented to point out of the volume. The checks use sorted array
+    operations rather than loops over the triangles so they scale to very
+    large meshes.
+
+    Args:
+        surface_mesh: the surface mesh to check
+        tolerance: the distance below which vertices are duplicates and the
+            height below which triangles are degenerate
+
+    Returns:
+        A dictionary with "valid", which is True if no problems were found,
+        and the problems found:
+            duplicate_vertices: groups of vertex indices at the same position
+            degenerate_triangles: the indices of the degenerate triangles of
+                each surface, keyed by surface tag
+            open_edges: the vertex indices of the edges used by only one
+                triangle of each volume, keyed by volume tag
+            non_manifold_edges: the vertex indices of the edges used by more
+                than two triangles of each volume, keyed by volume tag
+            inconsistent_edges: the vertex indices of the edges whose two
+                triangles run along the edge in the same direction, keyed by
+                volume tag
+            inconsistent_surfaces: the tags of the surfaces with
+                inconsistent edges, which usually have the wrong sense,
+                keyed by volume tag
+    """
+
+    vertices = surface_mesh.vertices
+
+    report = {
+        "duplicate_vertices": _duplicate_vertices(vertices, tolerance),
+        "degenerate_triangles": {},
+        "open_edges": {},
+        "non_manifold_edges": {},
+        "inconsistent_edges": {},
+        "inconsistent_surfaces": {},
+    }
+
+    for surface, triangles in surface_mesh.surface_triangles.items():
+        degenerate = _degenerate_triangles(vertices, triangles, tolerance)
+        if len(degenerate):
+            report["degenerate_triangles"][surface] = degenerate.tolist()
+
+    for vol_id, surfaces in surface_mesh.volume_surfaces.items():
+        triangles = surface_mesh.volume_triangles(vol_id, oriented=True)
+        surface_of_triangle = np.repeat(
+            surfaces, [len(surface_mesh.surface_triangles[s]) for s in surfaces]
+        )
+
+        starts = triangles.ravel()
+        ends = np.roll(triangles, -1, axis=1).ravel()
+        # each undirected edge gets one integer key
+        keys = np.minimum(starts, ends) * len(vertices) + np.maximum(starts, ends)
+        directions = np.where(starts < ends, 1, -1)
+
+        edge_keys, inverse, counts = np.unique(
+            keys, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.ravel()
+        balance = np.bincount(inverse, weights=directions, minlength=len(edge_keys))
+        inconsistent = (counts == 2) & (balance != 0)
+
+        for name, problem in [
+            ("open_edges", counts == 1),
+            ("non_manifold_edges", counts > 2),
+            ("inconsistent_edges", inconsistent),
+        ]:
+            if problem.any():
+                report[name][vol_id] = np.stack(
+                    np.divmod(edge_keys[problem], len(vertices)), axis=1
+                ).tolist()
+
+        if inconsistent.any():
+            on_inconsistent_edge = inconsistent[inverse].reshape(-1, 3).any(axis=1)
+            report["inconsistent_surfaces"][vol_id] = np.unique(
+                surface_of_triangle[on_inconsistent_edge]
+            ).tolist()
+
+    report["valid"] = not any(
+        report[name]
+        for name in [
+            "duplicate_vertices",
+            "degenerate_triangles",
+            "open_edges",
+            "non_manifold_edges",
+            "inconsistent_edges",
+        ]
+    )
+
+    return report
+
+
+def summarise_report(report: dict) -> Dict[str, int]:
+    """Counts the problems in a report from validate_surface_mesh.
+
+    Args:
+        report: the report to summarise
+
+    Returns:
+        A dictionary with the number of each kind of problem
+    """
+
+    return {
+        "duplicate_vertices": sum(len(g) - 1 for g in report["duplicate_vertices"]),
+        "degenerate_triangles": sum(
+            len(t) for t in report["degenerate_triangles"].values()
+        ),
+        "open_edges": sum(len(e) for e in report["open_edges"].values()),
+        "non_manifold_edges": sum(
+            len(e) for e in report["non_manifold_edges"].values()
+        ),
+        "inconsistent_edges": sum(
+            len(e) for e in report["inconsistent_edges"].values()
+        ),
+    }
+
+
+def _duplicate_vertices(vertices: np.ndarray, tolerance: float) -> List[List[int]]:
+    """Finds the groups of vertices at the same position once rounded to
+    the tolerance"""
+
+    if len(vertices) == 0:
+        return []
+
+    rounded = np.round(vertices / tolerance).astype(np.int64)
+    # sorting the rows puts the duplicates next to each other
+    order = np.lexsort(rounded.T[::-1])
+    same_as_previous = np.all(rounded[order[1:]] == rounded[order[:-1]], axis=1)
+    if not same_as_previous.any():
+        return []
+
+    starts = np.nonzero(~np.concatenate([[False], same_as_previous]))[0]
+    group_sizes = np.diff(np.append(starts, len(order)))
+    in_group = np.repeat(group_sizes > 1, group_sizes)
+    duplicated = order[in_group]
+    group_starts = np.cumsum(group_sizes[group_sizes > 1])[:-1]
+
+    return [group.tolist() for group in np.split(duplicated, group_starts)]
+
+
+def _degenerate_triangles(
+    vertices: np.ndarray, triangles: np.ndarray, tolerance: float
+) -> np.ndarray:
+    """Finds the triangles that repeat a vertex or whose height is no more
+    than the tolerance"""
+
+    a, b, c = (vertices[triangles[:, n]] for n in range(3))
+    ab, bc, ca = b - a, c - b, a - c
+    cross = np.stack(
+        [
+            ab[:, 1] * ca[:, 2] - ab[:, 2] * ca[:, 1],
+            ab[:, 2] * ca[:, 0] - ab[:, 0] * ca[:, 2],
+            ab[:, 0] * ca[:, 1] - ab[:, 1] * ca[:, 0],
+        ],
+        axis=1,
+    )
+    twice_area = np.sqrt(np.einsum("ij,ij->i", cross, cross))
+    longest_edge = np.sqrt(
+        np.max([np.einsum("ij,ij->i", edge, edge) for edge in (ab, bc, ca)], axis=0)
+    )
+    heights = twice_area / np.where(longest_edge > 0, longest_edge, 1)
+
+    repeated = (
+        (triangles[:, 0] == triangles[:, 1])
+        | (triangles[:, 1] == triangles[:, 2])
+        | (triangles[:, 2] == triangles[:, 0])
+    )
+
+    return np.nonzero(repeated | (heights <= tolerance))[0]
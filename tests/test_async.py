@@ -0,0 +1,90 @@
+import asyncio
+
+import dagmc_h5m_file_inspector as di
+import pytest
+from brep_to_h5m import brep_to_h5m_async
+
+
+def test_async_conversion_streams_progress_events(tmp_path):
+    """Checks that conversions run in worker processes, limited by a
+    semaphore, and pass on their progress events"""
+
+    async def convert():
+        semaphore = asyncio.Semaphore(1)
+        events = []
+        h5m_filenames = await asyncio.gather(
+            *[
+                brep_to_h5m_async(
+                    brep_filename="tests/one_cube.brep",
+                    material_tags=["mat1"],
+                    h5m_filename=str(tmp_path / f"{n}.h5m"),
+                    progress_callback=events.append,
+                    semaphore=semaphore,
+                    min_mesh_size=1,
+                    max_mesh_size=5,
+                )
+                for n in range(2)
+            ]
+        )
+        return h5m_filenames, events
+
+    h5m_filenames, events = asyncio.run(convert())
+
+    assert h5m_filenames == [str(tmp_path / "0.h5m"), str(tmp_path / "1.h5m")]
+    assert all((tmp_path / f"{n}.h5m").is_file() for n in range(2))
+    finished = [event["stage"] for event in events if event["status"] == "finished"]
+    assert finished.count("write") == 2
+
+
+def test_cancelling_stops_the_worker(tmp_path):
+    """Checks that cancelling a conversion stops it before the h5m file is
+    written"""
+
+    h5m_filename = tmp_path / "cancelled.h5m"
+
+    async def convert_and_cancel():
+        started = asyncio.Event()
+        task = asyncio.ensure_future(
+            brep_to_h5m_async(
+                brep_filename="tests/test_brep_file.brep",
+                material_tags=[f"mat{n}" for n in range(1, 7)],
+                h5m_filename=str(h5m_filename),
+                progress_callback=lambda event: started.set(),
+                min_mesh_size=0.5,
+                max_mesh_size=0.5,
+            )
+        )
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(convert_and_cancel())
+
+    assert not h5m_filename.exists()
+
+
+def test_errors_in_the_worker_are_raised():
+    """Checks that an error in the worker process is raised with its type"""
+
+    with pytest.raises(RuntimeError, match="FileNotFoundError"):
+        asyncio.run(
+            brep_to_h5m_async(brep_filename="not_a_file.brep", material_tags=["mat1"])
+        )
+
+
+def test_async_conversion_with_matched_material_tags(tmp_path):
+    """Checks that a dictionary of parts is passed to the worker and matched
+    to the volumes rather than being turned into a list of its keys"""
+
+    h5m_filename = asyncio.run(
+        brep_to_h5m_async(
+            brep_filename="tests/one_cube.brep",
+            material_tags={"mat1": {"center": [0, 0, 0]}},
+            h5m_filename=str(tmp_path / "dagmc.h5m"),
+            min_mesh_size=1,
+            max_mesh_size=5,
+        )
+    )
+
+    assert di.get_volumes_and_materials_from_h5m(h5m_filename) == {1: "mat1"}
@@ -0,0 +1,136 @@
+import os
+from pathlib import Path
+
+import dagmc_h5m_file_inspector as di
+import gmsh
+import numpy as np
+from brep_to_h5m import SurfaceMesh, brep_to_h5m, mesh_brep
+from brep_to_h5m.cache import (
+    evict_cached_meshes,
+    load_cached_mesh,
+    mesh_cache_key,
+    save_cached_mesh,
+)
+
+
+def test_cached_mesh_is_reused_with_new_material_tags(tmp_path):
+    """Checks that a second conversion with different material tags reuses
+    the cached mesh and still applies the new tags"""
+
+    cache_dir = tmp_path / "cache"
+
+    for tag in ["first", "second"]:
+        material_tags = [f"{tag}_{n}" for n in range(1, 7)]
+        brep_to_h5m(
+            brep_filename="tests/test_brep_file.brep",
+            material_tags=material_tags,
+            h5m_filename=str(tmp_path / f"{tag}.h5m"),
+            min_mesh_size=30,
+            max_mesh_size=50,
+            mesh_algorithm=1,
+            cache_dir=cache_dir,
+        )
+        assert di.get_materials_from_h5m(str(tmp_path / f"{tag}.h5m")) == sorted(
+            material_tags
+        )
+
+    assert len(list(cache_dir.glob("*.npz"))) == 1
+    assert (
+        Path(tmp_path / "first.h5m").stat().st_size
+        == Path(tmp_path / "second.h5m").stat().st_size
+    )
+
+
+def test_cache_key_depends_on_mesh_parameters():
+    """Checks that changing a meshing parameter changes the cache key"""
+
+    key = mesh_cache_key("tests/one_cube.brep", 30, 50, 1)
+    assert key == mesh_cache_key("tests/one_cube.brep", 30, 50, 1)
+    assert key != mesh_cache_key("tests/one_cube.brep", 30, 40, 1)
+    assert key != mesh_cache_key("tests/one_cube.brep", 30, 50, 6)
+    assert key != mesh_cache_key("tests/test_brep_file.brep", 30, 50, 1)
+
+
+def test_save_and_load_cached_mesh(tmp_path):
+    """Checks that the mesh loaded from the cache matches the mesh saved"""
+
+    surface_mesh = SurfaceMesh(
+        vertices=np.random.rand(5, 3),
+        surface_triangles={1: [[0, 1, 2]], 2: [[1, 2, 3], [2, 3, 4]]},
+        volume_surfaces={1: [1, 2]},
+    )
+
+    save_cached_mesh(tmp_path, "key", surface_mesh)
+    loaded = load_cached_mesh(tmp_path, "key")
+
+    assert np.array_equal(surface_mesh.vertices, loaded.vertices)
+    assert loaded.volume_surfaces == {1: [1, 2]}
+    for surface, triangles in surface_mesh.surface_triangles.items():
+        assert np.array_equal(triangles, loaded.surface_triangles[surface])
+
+    assert load_cached_mesh(tmp_path, "missing_key") is None
+
+
+def test_least_recently_used_mesh_is_evicted(tmp_path):
+    """Checks that the oldest cached meshes are deleted first"""
+
+    surface_mesh = SurfaceMesh(
+        vertices=np.random.rand(1000, 3),
+        surface_triangles={1: np.zeros((1000, 3), dtype=np.int64)},
+        volume_surfaces={1: [1]},
+    )
+
+    for age, key in enumerate(["new", "middle", "old"]):
+        filename = save_cached_mesh(tmp_path, key, surface_mesh)
+        os.utime(filename, (1000 - age, 1000 - age))
+    file_size = filename.stat().st_size
+
+    evict_cached_meshes(tmp_path, max_cache_size=2 * file_size)
+
+    assert sorted(f.stem for f in tmp_path.glob("*.npz")) == ["middle", "new"]
+
+
+def _write_box_and_sphere(brep_filename, sphere_x):
+    """Writes a Brep file of a box and a separate sphere"""
+
+    gmsh.initialize()
+    gmsh.model.add("box_and_sphere")
+    gmsh.model.occ.addBox(0, 0, 0, 10, 10, 10)
+    gmsh.model.occ.addSphere(sphere_x, 5, 5, 3)
+    gmsh.model.occ.synchronize()
+    gmsh.write(str(brep_filename))
+    gmsh.finalize()
+
+
+def test_incremental_meshing_only_meshes_changed_volumes(tmp_path):
+    """Checks that moving the sphere reuses the cached mesh of the box and
+    that the mesh matches a mesh made without the cache"""
+
+    _write_box_and_sphere(tmp_path / "first.brep", sphere_x=20)
+    _write_box_and_sphere(tmp_path / "moved.brep", sphere_x=30)
+
+    for brep_filename, expected_hits in [("first.brep", 0), ("moved.brep", 1)]:
+        events = []
+        surface_mesh = mesh_brep(
+            brep_filename=str(tmp_path / brep_filename),
+            min_mesh_size=2,
+            max_mesh_size=4,
+            cache_dir=tmp_path / "cache",
+            incremental=True,
+            progress_callback=events.append,
+        )
+        cache_load = [
+            event
+            for event in events
+            if event["stage"] == "cache_load" and event["status"] == "finished"
+        ][0]
+        assert cache_load["hit"] == expected_hits
+
+    uncached_mesh = mesh_brep(
+        brep_filename=str(tmp_path / "moved.brep"), min_mesh_size=2, max_mesh_size=4
+    )
+    assert surface_mesh.volumes == uncached_mesh.volumes
+    for vol_id in surface_mesh.volumes:
+        assert len(surface_mesh.volume_triangles(vol_id)) == len(
+            uncached_mesh.volume_triangles(vol_id)
+        )
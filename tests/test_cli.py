@@ -0,0 +1,159 @@
+import json
+import os
+from pathlib import Path
+
+import dagmc_h5m_file_inspector as di
+import pytest
+from brep_to_h5m.cli import convert_batch, load_manifest, main
+
+
+def test_load_csv_manifest(tmp_path):
+    """Checks that the CSV columns are converted to brep_to_h5m arguments
+    and that empty cells are left out"""
+
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(
+        "brep_filename,material_tags,min_mesh_size,shared_surfaces\n"
+        "a.brep,steel;water,20,true\n"
+        "b.brep,air,,\n"
+    )
+
+    jobs = load_manifest(manifest)
+
+    assert jobs == [
+        {
+            "brep_filename": str(tmp_path / "a.brep"),
+            "material_tags": ["steel", "water"],
+            "min_mesh_size": 20.0,
+            "shared_surfaces": True,
+            "h5m_filename": str(tmp_path / "a.h5m"),
+        },
+        {
+            "brep_filename": str(tmp_path / "b.brep"),
+            "material_tags": ["air"],
+            "h5m_filename": str(tmp_path / "b.h5m"),
+        },
+    ]
+
+
+def test_load_json_manifest_with_unknown_field(tmp_path):
+    """Checks that a misspelt argument in a manifest raises an error"""
+
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps([{"brep_filename": "a.brep", "material_tags": ["a"], "mesh": 1}])
+    )
+
+    with pytest.raises(ValueError):
+        load_manifest(manifest)
+
+
+def test_load_json_manifest_with_matched_material_tags(tmp_path):
+    """Checks that a dictionary of parts is kept for brep_to_h5m to match to
+    the volumes rather than being turned into a list of its keys"""
+
+    parts = {
+        "steel": {"center": [0, 0, 0], "volume": 1000},
+        "water": [{"center": [20, 0, 0]}, {"center": [40, 0, 0]}],
+    }
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps([{"brep_filename": "a.brep", "material_tags": parts}])
+    )
+
+    jobs = load_manifest(manifest)
+
+    assert jobs[0]["material_tags"] == parts
+
+
+def test_batch_conversion_with_a_failing_job(tmp_path):
+    """Checks that the good jobs are converted and the missing Brep file is
+    retried and reported as failed"""
+
+    jobs = [
+        {
+            "brep_filename": "tests/test_brep_file.brep",
+            "material_tags": [f"mat{n}" for n in range(1, 7)],
+            "h5m_filename": str(tmp_path / "good.h5m"),
+            "min_mesh_size": 30,
+            "max_mesh_size": 50,
+        },
+        {
+            "brep_filename": "tests/missing_file.brep",
+            "material_tags": ["mat1"],
+            "h5m_filename": str(tmp_path / "missing.h5m"),
+        },
+    ]
+
+    results = convert_batch(
+        jobs, workers=2, retries=1, report_filename=tmp_path / "report.json"
+    )
+
+    assert [result["status"] for result in results] == ["succeeded", "failed"]
+    assert [result["attempts"] for result in results] == [1, 2]
+    assert "FileNotFoundError" in results[1]["error"]
+    assert (
+        di.get_materials_from_h5m(str(tmp_path / "good.h5m"))
+        == jobs[0]["material_tags"]
+    )
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert (report["succeeded"], report["failed"]) == (1, 1)
+
+
+def _exit_worker(event):
+    """A progress callback that exits the worker process, as a segfault in
+    Gmsh would"""
+
+    os._exit(1)
+
+
+def test_batch_conversion_with_a_crashing_job(tmp_path):
+    """Checks that a job that crashes its worker process, which breaks the
+    pool, fails on its own and the other jobs are still converted"""
+
+    jobs = [
+        {
+            "brep_filename": "tests/one_cube.brep",
+            "material_tags": ["mat1"],
+            "h5m_filename": str(tmp_path / f"{n}.h5m"),
+            "min_mesh_size": 1,
+            "max_mesh_size": 5,
+        }
+        for n in range(4)
+    ]
+    jobs[1]["progress_callback"] = _exit_worker
+
+    results = convert_batch(jobs, workers=2, retries=1)
+
+    assert [result["status"] for result in results] == [
+        "succeeded",
+        "failed",
+        "succeeded",
+        "succeeded",
+    ]
+    assert [result["attempts"] for result in results] == [1, 2, 1, 1]
+    assert "crashed" in results[1]["error"]
+    assert all((tmp_path / f"{n}.h5m").is_file() for n in [0, 2, 3])
+
+
+def test_convert_command(tmp_path):
+    """Checks that the convert command writes a h5m file"""
+
+    h5m_filename = tmp_path / "cli.h5m"
+
+    main(
+        [
+            "convert",
+            "tests/test_brep_file.brep",
+            "--material-tags",
+            *[f"mat{n}" for n in range(1, 7)],
+            "--h5m-filename",
+            str(h5m_filename),
+            "--min-mesh-size",
+            "30",
+            "--max-mesh-size",
+            "50",
+        ]
+    )
+
+    assert Path(h5m_filename).is_file()
@@ -0,0 +1,117 @@
+import numpy as np
+import trimesh
+from brep_to_h5m import SurfaceMesh, brep_to_h5m
+from brep_to_h5m.decimate import _point_triangle_distances, decimate
+
+
+def _subdivided_cube_mesh():
+    """Makes a surface mesh of a finely meshed cube with a surface per face"""
+
+    box = trimesh.creation.box(extents=(10, 10, 10))
+    for _ in range(4):
+        box = box.subdivide()
+
+    axis = np.argmax(np.abs(box.face_normals), axis=1)
+    side = box.face_normals[np.arange(len(axis)), axis] > 0
+    face_ids = axis * 2 + side
+    surface_triangles = {
+        int(face_id) + 1: box.faces[face_ids == face_id]
+        for face_id in np.unique(face_ids)
+    }
+
+    return SurfaceMesh(
+        vertices=box.vertices,
+        surface_triangles=surface_triangles,
+        volume_surfaces={1: list(surface_triangles)},
+    )
+
+
+def test_decimating_planar_surfaces():
+    """Checks that flat surfaces are reduced without any deviation and the
+    volume stays watertight"""
+
+    surface_mesh = _subdivided_cube_mesh()
+
+    decimated, report = decimate(surface_mesh, tolerance=1e-6)
+
+    assert report["triangles_before"] == surface_mesh.number_of_triangles
+    assert report["triangles_after"] == decimated.number_of_triangles
+    assert report["reduction"] > 0.5
+    # the centroids and edge midpoints are only in the plane to rounding
+    assert report["max_deviation"] < 1e-12
+
+    decimated_trimesh = decimated.volume_trimesh(1)
+    assert decimated_trimesh.is_watertight
+    assert np.isclose(decimated_trimesh.volume, 1000)
+
+
+def test_vertices_between_surfaces_are_kept():
+    """Checks that every vertex on the edges of the cube is kept so shared
+    surfaces stay conformal"""
+
+    surface_mesh = _subdivided_cube_mesh()
+    on_edges = surface_mesh.vertices[
+        np.sum(np.isclose(np.abs(surface_mesh.vertices), 5), axis=1) >= 2
+    ]
+
+    decimated, _ = decimate(surface_mesh, tolerance=1e-6)
+
+    kept = {tuple(vertex) for vertex in decimated.vertices.tolist()}
+    assert all(tuple(vertex) in kept for vertex in on_edges.tolist())
+
+
+def test_curved_surface_stays_within_tolerance():
+    """Checks that the centroids and edge midpoints of the original triangles
+    of a curved surface, not only its vertices, stay within the tolerance and
+    that the reported deviations are those of all the points"""
+
+    x, y = np.meshgrid(np.linspace(0, 100, 30), np.linspace(0, 100, 30))
+    vertices = np.stack(
+        [x.ravel(), y.ravel(), 2 * np.sin(x / 15).ravel() * np.cos(y / 20).ravel()],
+        axis=1,
+    )
+    grid = np.arange(len(vertices)).reshape(30, 30)
+    a, b = grid[:-1, :-1].ravel(), grid[:-1, 1:].ravel()
+    c, d = grid[1:, 1:].ravel(), grid[1:, :-1].ravel()
+    triangles = np.concatenate([np.stack([a, b, c], 1), np.stack([a, c, d], 1)])
+    surface_mesh = SurfaceMesh(
+        vertices=vertices, surface_triangles={1: triangles}, volume_surfaces={1: [1]}
+    )
+
+    decimated, report = decimate(surface_mesh, tolerance=0.1)
+
+    edges = np.unique(
+        np.sort(triangles[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1), axis=0
+    )
+    points = np.concatenate(
+        [vertices, vertices[triangles].mean(axis=1), vertices[edges].mean(axis=1)]
+    )
+    decimated_corners = decimated.vertices[decimated.surface_triangles[1]]
+    distances = np.concatenate(
+        [
+            _point_triangle_distances(block, decimated_corners).min(axis=1)
+            for block in np.array_split(points, 10)
+        ]
+    )
+
+    assert report["reduction"] > 0.3
+    assert distances.max() <= 0.1
+    assert distances.max() <= report["max_deviation"] + 1e-12
+    # the mean is over every point, including those that were never moved
+    assert np.isclose(report["mean_deviation"], distances.mean(), rtol=0.01)
+
+
+def test_decimation_reduces_the_h5m_file_size(tmp_path):
+    """Checks that decimating before writing gives a smaller h5m file"""
+
+    for decimate_tolerance in [None, 1]:
+        brep_to_h5m(
+            brep_filename="tests/test_brep_file.brep",
+            material_tags=[f"mat{n}" for n in range(1, 7)],
+            h5m_filename=str(tmp_path / f"{decimate_tolerance}.h5m"),
+            min_mesh_size=5,
+            max_mesh_size=10,
+            decimate_tolerance=decimate_tolerance,
+        )
+
+    assert (tmp_path / "1.h5m").stat().st_size < (tmp_path / "None.h5m").stat().st_size
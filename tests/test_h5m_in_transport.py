@@ -7,7 +7,7 @@ from brep_to_h5m import (
     mesh_brep,
     mesh_to_h5m_in_memory_method,
     mesh_to_h5m_stl_method,
-    transport_particles_on_h5m_geometry,
+    transport_particles_on_h5m_geometries,
 )
 
 """
@@ -144,7 +144,7 @@ def test_stl_vs_in_memory_1_volume():
     volumes = 1
     material_tags = [f"material_{n}" for n in range(1, volumes + 1)]
 
-    gmsh, volumes = mesh_brep(
+    surface_mesh = mesh_brep(
         brep_filename=brep_filename,
         min_mesh_size=1,
         max_mesh_size=5,
@@ -152,21 +152,50 @@ def test_stl_vs_in_memory_1_volume():
     )
 
     mesh_to_h5m_in_memory_method(
-        volumes=volumes,
+        surface_mesh=surface_mesh,
         material_tags=material_tags,
         h5m_filename="h5m_from_in_memory_method.h5m",
     )
 
-    # a new instance of gmsh is made to keep the two methods separate
-    gmsh, volumes = mesh_brep(
+    # the same surface mesh is reused for the second method
+    mesh_to_h5m_stl_method(
+        surface_mesh=surface_mesh,
+        material_tags=material_tags,
+        h5m_filename="h5m_from_in_stl_method.h5m",
+    )
+
+    in_memory_results = transport_particles_on_h5m_geometry(
+        h5m_filename="h5m_from_in_memory_method.h5m", material_tags=material_tags
+    )
+    stl_results = transport_particles_on_h5m_geometry(
+        h5m_filename="h5m_from_in_stl_method.h5m", material_tags=material_tags
+    )
+
+    assert math.isclose(in_memory_results, stl_results)
+
+
+def test_stl_vs_in_memory_2_joined_volume():
+
+    brep_filename = "tests/test_two_joined_cubes.brep"
+    volumes = 2
+    material_tags = [f"material_{n}" for n in range(1, volumes + 1)]
+
+    surface_mesh = mesh_brep(
         brep_filename=brep_filename,
         min_mesh_size=1,
         max_mesh_size=5,
         mesh_algorithm=1,
     )
 
+    mesh_to_h5m_in_memory_method(
+        surface_mesh=surface_mesh,
+        material_tags=material_tags,
+        h5m_filename="h5m_from_in_memory_method.h5m",
+    )
+
+    # the same surface mesh is reused for the second method
     mesh_to_h5m_stl_method(
-        volumes=volumes,
+        surface_mesh=surface_mesh,
         material_tags=material_tags,
         h5m_filename="h5m_from_in_stl_method.h5m",
     )
@@ -181,13 +210,13 @@ def test_stl_vs_in_memory_1_volume():
     assert math.isclose(in_memory_results, stl_results)
 
 
-def test_stl_vs_in_memory_2_joined_volume():
+def test_shared_surfaces_vs_duplicated_surfaces_2_joined_volumes():
 
     brep_filename = "tests/test_two_joined_cubes.brep"
     volumes = 2
     material_tags = [f"material_{n}" for n in range(1, volumes + 1)]
 
-    gmsh, volumes = mesh_brep(
+    surface_mesh = mesh_brep(
         brep_filename=brep_filename,
         min_mesh_size=1,
         max_mesh_size=5,
@@ -195,30 +224,138 @@ def test_stl_vs_in_memory_2_joined_volume():
     )
 
     mesh_to_h5m_in_memory_method(
-        volumes=volumes,
+        surface_mesh=surface_mesh,
         material_tags=material_tags,
-        h5m_filename="h5m_from_in_memory_method.h5m",
+        h5m_filename="h5m_with_duplicated_surfaces.h5m",
+    )
+
+    mesh_to_h5m_in_memory_method(
+        surface_mesh=surface_mesh,
+        material_tags=material_tags,
+        h5m_filename="h5m_with_shared_surfaces.h5m",
+        shared_surfaces=True,
     )
 
-    # a new instance of gmsh is made to keep the two methods separate
-    gmsh, volumes = mesh_brep(
+    duplicated_results = transport_particles_on_h5m_geometry(
+        h5m_filename="h5m_with_duplicated_surfaces.h5m", material_tags=material_tags
+    )
+    shared_results = transport_particles_on_h5m_geometry(
+        h5m_filename="h5m_with_shared_surfaces.h5m", material_tags=material_tags
+    )
+
+    assert math.isclose(duplicated_results, shared_results)
+
+
+def test_trimesh_vs_topology_fix_normals_2_joined_volumes(tmp_path):
+    """Checks that orienting the triangles from the Gmsh surface senses gives
+    the same flux as fixing the normals with trimesh"""
+
+    brep_filename = "tests/test_two_joined_cubes.brep"
+    volumes = 2
+    material_tags = [f"material_{n}" for n in range(1, volumes + 1)]
+
+    surface_mesh = mesh_brep(
         brep_filename=brep_filename,
         min_mesh_size=1,
         max_mesh_size=5,
         mesh_algorithm=1,
     )
 
-    mesh_to_h5m_stl_method(
-        volumes=volumes,
+    results = []
+    for fix_normals in ["trimesh", "topology"]:
+        h5m_filename = mesh_to_h5m_in_memory_method(
+            surface_mesh=surface_mesh,
+            material_tags=material_tags,
+            h5m_filename=str(tmp_path / f"h5m_with_{fix_normals}_normals.h5m"),
+            fix_normals=fix_normals,
+        )
+        results.append(
+            transport_particles_on_h5m_geometry(
+                h5m_filename=h5m_filename, material_tags=material_tags
+            )
+        )
+
+    assert math.isclose(results[0], results[1])
+
+
+def test_transport_on_several_h5m_files_in_parallel():
+    """Checks that running several h5m files in a process pool gives the
+    same flux as running them one at a time"""
+
+    jobs = []
+    for brep_filename, volumes in [
+        ("tests/one_cube.brep", 1),
+        ("tests/test_two_joined_cubes.brep", 2),
+        ("tests/test_two_sep_cubes.brep", 2),
+    ]:
+        material_tags = [f"material_{n}" for n in range(1, volumes + 1)]
+        h5m_filename = brep_filename.replace(".brep", "_parallel.h5m")
+        brep_to_h5m(
+            brep_filename=brep_filename,
+            material_tags=material_tags,
+            h5m_filename=h5m_filename,
+            min_mesh_size=30,
+            max_mesh_size=50,
+        )
+        jobs.append(
+            {
+                "h5m_filename": h5m_filename,
+                "material_tags": material_tags,
+                "batches": 2,
+                "particles": 1000,
+            }
+        )
+
+    parallel_results = transport_particles_on_h5m_geometries(jobs, workers=3)
+    serial_results = [
+        transport_particles_on_h5m_geometry(**job, threads=1) for job in jobs
+    ]
+
+    assert len(parallel_results) == 3
+    for parallel_result, serial_result in zip(parallel_results, serial_results):
+        assert math.isclose(parallel_result, serial_result)
+
+
+def test_transport_diagnostics():
+    """Checks that the diagnostics report a watertight geometry as passing
+    and fail it when the transport rate is below the limit"""
+
+    brep_filename = "tests/test_two_joined_cubes.brep"
+    h5m_filename = "test_two_joined_cubes_diagnostics.h5m"
+    material_tags = ["material_1", "material_2"]
+
+    brep_to_h5m(
+        brep_filename=brep_filename,
         material_tags=material_tags,
-        h5m_filename="h5m_from_in_stl_method.h5m",
+        h5m_filename=h5m_filename,
+        min_mesh_size=30,
+        max_mesh_size=50,
     )
 
-    in_memory_results = transport_particles_on_h5m_geometry(
-        h5m_filename="h5m_from_in_memory_method.h5m", material_tags=material_tags
+    report = transport_particles_on_h5m_geometry(
+        h5m_filename=h5m_filename,
+        material_tags=material_tags,
+        batches=2,
+        particles=1000,
+        diagnostics=True,
     )
-    stl_results = transport_particles_on_h5m_geometry(
-        h5m_filename="h5m_from_in_stl_method.h5m", material_tags=material_tags
+
+    assert report["passed"]
+    assert report["failures"] == []
+    assert report["lost_particles"] == 0
+    assert report["lost_particle_locations"] == []
+    assert list(report["material_flux"]) == material_tags
+    assert report["particles_per_second"] > 0
+    assert 0 < report["geometry_load_time_s"] <= report["initialization_time_s"]
+
+    report = transport_particles_on_h5m_geometry(
+        h5m_filename=h5m_filename,
+        material_tags=material_tags,
+        batches=2,
+        particles=1000,
+        diagnostics=True,
+        min_particles_per_second=1e15,
     )
 
-    assert math.isclose(in_memory_results, stl_results)
+    assert not report["passed"]
+    assert len(report["failures"]) == 1
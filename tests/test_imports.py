@@ -0,0 +1,79 @@
+import subprocess
+import sys
+
+import pytest
+
+
+def _modules_imported_by(code: str) -> set:
+    """Runs code in a new Python process and returns the names of the
+    modules imported"""
+
+    output = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return set(output.split())
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import brep_to_h5m",
+        "from brep_to_h5m import SurfaceMesh",
+        "from brep_to_h5m.cache import load_cached_mesh, mesh_cache_key",
+        "from brep_to_h5m.validate import validate_surface_mesh",
+        "import brep_to_h5m.cli",
+    ],
+)
+def test_backends_are_not_imported(code):
+    """Checks that Gmsh, trimesh, PyMOAB and setuptools_scm are only
+    imported when they are used"""
+
+    modules = _modules_imported_by(code)
+
+    for backend in ["gmsh", "trimesh", "pymoab", "setuptools_scm", "openmc"]:
+        assert backend not in modules
+
+
+def test_meshing_functions_are_imported_when_used():
+    """Checks that the lazily imported names are still available"""
+
+    import brep_to_h5m
+
+    assert callable(brep_to_h5m.brep_to_h5m)
+    assert callable(brep_to_h5m.mesh_brep)
+    assert "SurfaceMesh" in dir(brep_to_h5m)
+    with pytest.raises(AttributeError):
+        brep_to_h5m.not_a_function
+
+
+def test_core_module_is_still_available():
+    """Checks that the core module is an attribute of the package and that
+    the transport function can still be imported from it with a warning"""
+
+    import brep_to_h5m
+
+    assert callable(brep_to_h5m.core.mesh_brep)
+    assert "core" in dir(brep_to_h5m)
+    with pytest.warns(DeprecationWarning):
+        from brep_to_h5m.core import transport_particles_on_h5m_geometry
+    assert transport_particles_on_h5m_geometry is (
+        brep_to_h5m.transport_particles_on_h5m_geometry
+    )
+
+
+def test_import_time():
+    """Checks that importing brep_to_h5m without meshing is fast"""
+
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import brep_to_h5m"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    # the last line is the cumulative time of the top level package in us
+    cumulative_us = int(output.strip().splitlines()[-1].split("|")[1])
+
+    assert cumulative_us < 0.5e6
@@ -0,0 +1,51 @@
+import logging
+
+from brep_to_h5m import brep_to_h5m
+from brep_to_h5m.instrumentation import stage
+
+
+def test_progress_callback_receives_every_stage(tmp_path):
+    """Checks that each stage of a conversion is reported as started and then
+    finished with timings and element counts"""
+
+    events = []
+    brep_to_h5m(
+        brep_filename="tests/test_brep_file.brep",
+        material_tags=[f"mat{n}" for n in range(1, 7)],
+        h5m_filename=str(tmp_path / "dagmc.h5m"),
+        min_mesh_size=30,
+        max_mesh_size=50,
+        progress_callback=events.append,
+    )
+
+    finished = [event for event in events if event["status"] == "finished"]
+    assert [event["stage"] for event in finished] == [
+        "import",
+        "mesh_1d",
+        "mesh_2d",
+        "extract",
+        "fix_normals",
+        "write",
+    ]
+    assert len(events) == 2 * len(finished)
+    for event in finished:
+        assert event["elapsed_s"] >= 0
+
+    extract = finished[3]
+    assert extract["volumes"] == 6
+    assert extract["triangles"] > 0
+    assert finished[-1]["triangles"] >= extract["triangles"]
+
+
+def test_stage_events_are_logged(caplog):
+    """Checks that the stage events are logged to the brep_to_h5m logger"""
+
+    events = []
+    with caplog.at_level(logging.INFO, logger="brep_to_h5m"):
+        with stage("example", events.append) as counts:
+            counts["triangles"] = 12
+
+    assert events[0] == {"stage": "example", "status": "started"}
+    assert events[1]["triangles"] == 12
+    assert "example finished" in caplog.text
+    assert "triangles=12" in caplog.text
@@ -0,0 +1,119 @@
+import sys
+
+import dagmc_h5m_file_inspector as di
+import numpy as np
+import pytest
+import trimesh
+from brep_to_h5m import SurfaceMesh, brep_to_h5m, mesh_brep
+from brep_to_h5m.matching import match_material_tags, mesh_volume_properties
+
+
+def _grid_properties(n: int = 10):
+    """Makes the properties of an n x n x n grid of unit cubes"""
+
+    corners = np.stack(
+        np.meshgrid(*[np.arange(n, dtype=float)] * 3, indexing="ij"), axis=-1
+    ).reshape(-1, 3)
+    return {
+        "centers": corners + 0.5,
+        "bounding_boxes": np.concatenate([corners, corners + 1], axis=1),
+        "volumes": np.ones(len(corners)),
+    }
+
+
+@pytest.mark.parametrize("use_scipy", [True, False])
+def test_parts_are_matched_to_volumes(monkeypatch, use_scipy):
+    """Checks that shuffled parts with slightly different properties are each
+    matched to the right volume, with and without scipy"""
+
+    if not use_scipy:
+        monkeypatch.setitem(sys.modules, "scipy.spatial", None)
+
+    properties = _grid_properties()
+    rng = np.random.default_rng(0)
+    parts = {}
+    for volume in rng.permutation(len(properties["centers"])):
+        parts[f"mat_{volume}"] = {
+            "center": properties["centers"][volume] + rng.normal(0, 0.01, 3),
+            "bounding_box": properties["bounding_boxes"][volume],
+        }
+
+    material_tags = match_material_tags(parts, properties)
+
+    assert material_tags == [f"mat_{n}" for n in range(len(properties["centers"]))]
+
+
+def test_several_parts_with_one_material():
+    """Checks that a list of parts can share a material tag and that the
+    volume tells apart parts with the same centre"""
+
+    properties = {
+        "centers": np.zeros((2, 3)),
+        "bounding_boxes": np.array([[-1, -1, -1, 1, 1, 1], [-2, -2, -2, 2, 2, 2]]),
+        "volumes": np.array([8.0, 64.0]),
+    }
+    parts = {
+        "steel": [{"center": [0, 0, 0], "volume": 64}],
+        "water": {"center": [0, 0, 0], "volume": 8},
+    }
+
+    assert match_material_tags(parts, properties) == ["water", "steel"]
+
+    with pytest.raises(ValueError):
+        match_material_tags({"steel": parts["steel"]}, properties)
+
+
+def test_mesh_volume_properties():
+    """Checks the centre, bounding box and volume found from a mesh"""
+
+    box = trimesh.creation.box(extents=(2, 4, 6))
+    box.apply_translation((1, 2, 3))
+    surface_mesh = SurfaceMesh(
+        vertices=box.vertices,
+        surface_triangles={1: box.faces},
+        volume_surfaces={1: [1]},
+    )
+
+    properties = mesh_volume_properties(surface_mesh)
+
+    assert np.allclose(properties["centers"], [[1, 2, 3]])
+    assert np.allclose(properties["bounding_boxes"], [[0, 0, 0, 2, 4, 6]])
+    assert np.allclose(properties["volumes"], [48])
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"streaming": True}, {"processes": 2}, {"cache_dir": "cache"}],
+)
+def test_brep_to_h5m_with_matched_material_tags(tmp_path, options):
+    """Checks that volumes are tagged with the material of the part they
+    match when the parts are given in a different order to the volumes. With
+    a cache_dir the second conversion matches using the cached mesh."""
+
+    if "cache_dir" in options:
+        options = {"cache_dir": str(tmp_path / options["cache_dir"])}
+
+    properties = mesh_volume_properties(
+        mesh_brep("tests/test_brep_file.brep", min_mesh_size=5, max_mesh_size=10)
+    )
+    parts = {
+        f"mat_{vol_id}": {
+            "center": properties["centers"][vol_id - 1],
+            "bounding_box": properties["bounding_boxes"][vol_id - 1],
+        }
+        for vol_id in reversed(range(1, 7))
+    }
+
+    for _ in range(2 if "cache_dir" in options else 1):
+        brep_to_h5m(
+            brep_filename="tests/test_brep_file.brep",
+            material_tags=parts,
+            h5m_filename=str(tmp_path / "dagmc.h5m"),
+            min_mesh_size=5,
+            max_mesh_size=10,
+            **options,
+        )
+
+        assert di.get_volumes_and_materials_from_h5m(str(tmp_path / "dagmc.h5m")) == {
+            vol_id: f"mat_{vol_id}" for vol_id in range(1, 7)
+        }
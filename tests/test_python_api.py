@@ -1,8 +1,11 @@
 import os
+import tracemalloc
 from pathlib import Path
 
 import dagmc_h5m_file_inspector as di
-from brep_to_h5m import brep_to_h5m
+import numpy as np
+import pytest
+from brep_to_h5m import SurfaceMesh, brep_to_h5m, mesh_brep
 
 
 class TestApiUsage:
@@ -116,3 +119,478 @@ class TestApiUsage:
 
     # TODO add tests to check 7 or more keys results in a value error
     # because there are only 6 volumes
+
+    def test_compact_nodes_with_sparse_node_tags(self):
+        """Checks that unused nodes are removed and that non contiguous node
+        tags are renumbered into the compacted vertices"""
+
+        from brep_to_h5m.core import _compact_nodes
+
+        vertices, triangles = _compact_nodes(
+            node_tags=[10, 3, 7, 20, 5],
+            coords=np.arange(15, dtype=float),
+            triangles_in_each_surface=[
+                np.array([[10, 3, 7]]),
+                np.array([[7, 3, 20], [20, 10, 3]]),
+            ],
+        )
+
+        # node 5 is not used by any triangle
+        assert vertices.shape == (4, 3)
+        for original, compacted in zip(
+            [[[10, 3, 7]], [[7, 3, 20], [20, 10, 3]]], triangles
+        ):
+            node_coords = {10: 0, 3: 3, 7: 6, 20: 9}
+            expected = [[node_coords[tag] for tag in tri] for tri in original]
+            assert vertices[compacted][:, :, 0].tolist() == expected
+
+    def test_compact_nodes_with_surfaces_without_triangles(self):
+        """Checks that surfaces with no triangles give empty arrays"""
+
+        from brep_to_h5m.core import _compact_nodes
+
+        vertices, triangles = _compact_nodes(
+            node_tags=[1, 2],
+            coords=np.arange(6, dtype=float),
+            triangles_in_each_surface=[np.empty((0, 3), dtype=np.int64)] * 2,
+        )
+
+        assert vertices.shape == (0, 3)
+        assert [t.shape for t in triangles] == [(0, 3), (0, 3)]
+
+    def test_parallel_meshing_matches_serial_meshing(self):
+        """Checks that meshing groups of volumes in separate processes gives
+        the same number of triangles for each volume as meshing in serial"""
+
+        for brep_filename in [
+            "tests/test_brep_file.brep",
+            "tests/test_two_sep_cubes.brep",
+        ]:
+            serial_mesh = mesh_brep(
+                brep_filename=brep_filename,
+                min_mesh_size=30,
+                max_mesh_size=50,
+                mesh_algorithm=1,
+            )
+
+            parallel_mesh = mesh_brep(
+                brep_filename=brep_filename,
+                min_mesh_size=30,
+                max_mesh_size=50,
+                mesh_algorithm=1,
+                processes=2,
+            )
+
+            assert serial_mesh.volumes == parallel_mesh.volumes
+            assert [len(t) for t in serial_mesh.triangles_in_each_volume()] == [
+                len(t) for t in parallel_mesh.triangles_in_each_volume()
+            ]
+            all_triangles = np.concatenate(parallel_mesh.triangles_in_each_volume())
+            assert all_triangles.max() < len(parallel_mesh.vertices)
+
+    def test_surface_mesh_written_with_several_material_tags(self, tmp_path):
+        """Checks that one surface mesh can be written to several h5m files
+        with different material tags"""
+
+        surface_mesh = mesh_brep(
+            brep_filename="tests/test_brep_file.brep",
+            min_mesh_size=30,
+            max_mesh_size=50,
+            mesh_algorithm=1,
+        )
+
+        for tag in ["first", "second"]:
+            material_tags = [f"{tag}_{n}" for n in range(1, 7)]
+            h5m_filename = str(tmp_path / f"{tag}.h5m")
+            surface_mesh.write_h5m(
+                material_tags=material_tags, h5m_filename=h5m_filename
+            )
+            assert di.get_materials_from_h5m(h5m_filename) == material_tags
+
+    def test_surface_mesh_save_and_load(self, tmp_path):
+        """Checks that a saved surface mesh loads with the same arrays"""
+
+        surface_mesh = SurfaceMesh(
+            vertices=np.random.rand(5, 3),
+            surface_triangles={3: [[0, 1, 2]], 7: [[1, 2, 3], [2, 3, 4]]},
+            volume_surfaces={2: [3, 7], 1: [7]},
+        )
+
+        surface_mesh.save(tmp_path / "mesh.npz")
+        loaded = SurfaceMesh.load(tmp_path / "mesh.npz")
+
+        assert np.array_equal(surface_mesh.vertices, loaded.vertices)
+        assert loaded.volumes == [2, 1]
+        assert loaded.volume_surfaces == {2: [3, 7], 1: [7]}
+        for surface, triangles in surface_mesh.surface_triangles.items():
+            assert np.array_equal(triangles, loaded.surface_triangles[surface])
+        assert loaded.volume_triangles(2).tolist() == [[0, 1, 2], [1, 2, 3], [2, 3, 4]]
+
+    def test_shared_surfaces_reduce_file_size(self, tmp_path):
+        """Checks that writing shared surfaces once gives a smaller file with
+        the same volumes and materials"""
+
+        surface_mesh = mesh_brep(
+            brep_filename="tests/test_brep_file.brep",
+            min_mesh_size=30,
+            max_mesh_size=50,
+            mesh_algorithm=1,
+        )
+        material_tags = [f"mat{n}" for n in range(1, 7)]
+
+        duplicated_filename = str(tmp_path / "duplicated_surfaces.h5m")
+        shared_filename = str(tmp_path / "shared_surfaces.h5m")
+        surface_mesh.write_h5m(material_tags, duplicated_filename)
+        surface_mesh.write_h5m(material_tags, shared_filename, shared_surfaces=True)
+
+        assert di.get_volumes_and_materials_from_h5m(shared_filename) == {
+            n: f"mat{n}" for n in range(1, 7)
+        }
+        assert (
+            Path(shared_filename).stat().st_size
+            < Path(duplicated_filename).stat().st_size
+        )
+
+    def test_default_surface_senses(self):
+        """Checks that without orientation information the first volume
+        bounded by a surface is the forward volume"""
+
+        surface_mesh = SurfaceMesh(
+            vertices=np.random.rand(4, 3),
+            surface_triangles={1: [[0, 1, 2]], 2: [[0, 2, 3]], 3: [[1, 2, 3]]},
+            volume_surfaces={5: [1, 2], 6: [2, 3]},
+        )
+
+        assert surface_mesh.surface_senses == {1: (5, 0), 2: (5, 6), 3: (6, 0)}
+
+    def test_shared_surfaces_are_oriented_and_checked(self, tmp_path):
+        """Checks that writing shared surfaces swaps the senses of a volume
+        whose normals point inwards and checks the number of material tags"""
+
+        from brep_to_h5m.h5m import _oriented_surface_senses
+
+        # a tetrahedron with every triangle wound so its normal points inwards
+        surface_mesh = SurfaceMesh(
+            vertices=np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1.0]]),
+            surface_triangles={1: [[0, 1, 2], [0, 3, 1]], 2: [[0, 2, 3], [1, 3, 2]]},
+            volume_surfaces={1: [1, 2]},
+        )
+
+        assert _oriented_surface_senses(surface_mesh) == {1: (0, 1), 2: (0, 1)}
+
+        with pytest.raises(ValueError):
+            surface_mesh.write_h5m(
+                ["mat1", "mat2"], tmp_path / "dagmc.h5m", shared_surfaces=True
+            )
+
+    def test_group_connected_volumes(self):
+        """Checks that volumes sharing surfaces are grouped together"""
+
+        from brep_to_h5m.core import _group_connected_volumes
+
+        groups = _group_connected_volumes(
+            {1: [1, 2], 2: [2, 3], 3: [4, 5], 4: [3, 6], 5: [7]}
+        )
+
+        assert sorted(groups) == [([1, 2, 4], 4), ([3], 2), ([5], 1)]
+
+    def test_stl_method_writes_no_intermediate_files(self, tmp_path):
+        """Checks that the stl method writes the h5m file without writing STL
+        files"""
+
+        from brep_to_h5m import mesh_to_h5m_stl_method
+
+        surface_mesh = mesh_brep(
+            brep_filename="tests/test_brep_file.brep",
+            min_mesh_size=30,
+            max_mesh_size=50,
+            mesh_algorithm=1,
+        )
+        material_tags = [f"mat{n}" for n in range(1, 7)]
+
+        h5m_filename = mesh_to_h5m_stl_method(
+            surface_mesh=surface_mesh,
+            material_tags=material_tags,
+            h5m_filename=str(tmp_path / "stl_method.h5m"),
+        )
+
+        assert di.get_volumes_and_materials_from_h5m(h5m_filename) == {
+            n: f"mat{n}" for n in range(1, 7)
+        }
+        assert list(tmp_path.glob("*.stl")) == []
+        assert list(Path(".").glob("*_with_corrected_face_normals.stl")) == []
+
+    def test_oriented_volume_triangles_point_outwards(self):
+        """Checks that the triangles of surfaces where a volume is on the
+        reverse side are flipped to point out of the volume"""
+
+        from brep_to_h5m.surface_mesh import _signed_volume
+
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]])
+        outwards = np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]])
+
+        # surface 1 points into volume 5, as if volume 5 were on its reverse side
+        surface_mesh = SurfaceMesh(
+            vertices=vertices,
+            surface_triangles={1: outwards[:1, ::-1], 2: outwards[1:]},
+            volume_surfaces={5: [1, 2]},
+            surface_senses={1: (0, 5), 2: (5, 0)},
+        )
+
+        assert surface_mesh.volume_triangles(5, oriented=True).tolist() == (
+            outwards.tolist()
+        )
+        assert _signed_volume(vertices, outwards) > 0
+        assert _signed_volume(vertices, outwards[:, ::-1]) < 0
+
+    def test_stl_file_points_outwards(self, tmp_path):
+        """Checks that the triangles written to a STL file point out of the
+        volume when a surface has the volume on its reverse side"""
+
+        import trimesh
+
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]])
+        outwards = np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]])
+        surface_mesh = SurfaceMesh(
+            vertices=vertices,
+            surface_triangles={1: outwards[:1, ::-1], 2: outwards[1:]},
+            volume_surfaces={5: [1, 2]},
+            surface_senses={1: (0, 5), 2: (5, 0)},
+        )
+
+        stl_filename = surface_mesh.write_stl(5, str(tmp_path / "volume_5.stl"))
+
+        mesh = trimesh.load(stl_filename)
+        assert mesh.is_winding_consistent
+        assert mesh.volume > 0
+
+    def test_streaming_matches_in_memory_method(self, tmp_path):
+        """Checks that the streaming writer produces the same volumes and
+        materials as writing a SurfaceMesh"""
+
+        material_tags = [f"mat{n}" for n in range(1, 7)]
+        for shared_surfaces in [False, True]:
+            for streaming in [False, True]:
+                brep_to_h5m(
+                    brep_filename="tests/test_brep_file.brep",
+                    material_tags=material_tags,
+                    h5m_filename=str(tmp_path / f"streaming_{streaming}.h5m"),
+                    min_mesh_size=30,
+                    max_mesh_size=50,
+                    shared_surfaces=shared_surfaces,
+                    streaming=streaming,
+                )
+
+            assert di.get_volumes_and_materials_from_h5m(
+                str(tmp_path / "streaming_True.h5m")
+            ) == di.get_volumes_and_materials_from_h5m(
+                str(tmp_path / "streaming_False.h5m")
+            )
+
+    def test_streaming_peak_memory(self, tmp_path):
+        """Checks that the arrays made by the streaming writer are bounded by
+        the mesh of the largest volume and the handle of each node, not by
+        the whole mesh. The memory held by Gmsh and MOAB is not traced."""
+
+        surface_mesh = mesh_brep(
+            brep_filename="tests/test_brep_file.brep", min_mesh_size=2, max_mesh_size=5
+        )
+        largest_volume_bytes = 0
+        for volume in surface_mesh.volumes:
+            triangles = surface_mesh.volume_triangles(volume)
+            vertices = np.unique(triangles)
+            largest_volume_bytes = max(
+                largest_volume_bytes, triangles.nbytes + 3 * vertices.nbytes
+            )
+        handle_bytes = 8 * len(surface_mesh.vertices)
+
+        tracemalloc.start()
+        try:
+            brep_to_h5m(
+                brep_filename="tests/test_brep_file.brep",
+                material_tags=[f"mat{n}" for n in range(1, 7)],
+                h5m_filename=str(tmp_path / "streaming.h5m"),
+                min_mesh_size=2,
+                max_mesh_size=5,
+                streaming=True,
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert peak < 8 * largest_volume_bytes + 2 * handle_bytes + 2**20
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            {"processes": 2},
+            {"cache_dir": "cache"},
+            {"incremental": True},
+            {"decimate_tolerance": 0.1},
+            {"validate": True},
+            {"fix_normals": "trimesh"},
+        ],
+    )
+    def test_streaming_with_unsupported_options(self, options, tmp_path):
+        """Checks that options the streaming writer can not use are not
+        silently ignored"""
+
+        with pytest.raises(ValueError):
+            brep_to_h5m(
+                brep_filename="tests/one_cube.brep",
+                material_tags=["mat1"],
+                h5m_filename=str(tmp_path / "one_cube.h5m"),
+                streaming=True,
+                **options,
+            )
+
+    def test_surface_mesh_subset_and_renumber(self):
+        """Checks that a subset of the volumes keeps only their surfaces and
+        vertices and that renumbering changes the tags"""
+
+        surface_mesh = SurfaceMesh(
+            vertices=np.random.rand(6, 3),
+            surface_triangles={1: [[0, 1, 2]], 2: [[1, 2, 3]], 3: [[3, 4, 5]]},
+            volume_surfaces={5: [1, 2], 6: [2, 3]},
+        )
+
+        subset = surface_mesh.subset([6])
+
+        assert subset.volume_surfaces == {6: [2, 3]}
+        assert subset.surface_senses == {2: (0, 6), 3: (6, 0)}
+        assert np.array_equal(subset.vertices, surface_mesh.vertices[1:])
+        assert subset.volume_triangles(6).tolist() == [[0, 1, 2], [2, 3, 4]]
+
+        renumbered = subset.renumber({6: 1}, {2: 10, 3: 20})
+
+        assert renumbered.volume_surfaces == {1: [10, 20]}
+        assert renumbered.surface_senses == {10: (0, 1), 20: (1, 0)}
+
+    def test_volume_mesh_sizes_refine_only_some_volumes(self):
+        """Checks that a smaller mesh size for one volume increases the number
+        of triangles on that volume"""
+
+        default_mesh = mesh_brep(
+            brep_filename="tests/test_two_sep_cubes.brep",
+            min_mesh_size=1,
+            max_mesh_size=50,
+        )
+        refined_mesh = mesh_brep(
+            brep_filename="tests/test_two_sep_cubes.brep",
+            min_mesh_size=1,
+            max_mesh_size=50,
+            volume_mesh_sizes={1: 2},
+        )
+
+        assert len(refined_mesh.volume_triangles(1)) > len(
+            default_mesh.volume_triangles(1)
+        )
+        assert len(refined_mesh.volume_triangles(2)) == len(
+            default_mesh.volume_triangles(2)
+        )
+
+    def test_mesh_sizes_by_material_tag(self):
+        """Checks that mesh sizes keyed by material tag apply to every volume
+        with that material"""
+
+        from brep_to_h5m.core import _volume_mesh_sizes
+
+        assert _volume_mesh_sizes({"steel": 5, 3: 1}, ["steel", "water", "steel"]) == {
+            1: 5.0,
+            3: 1.0,
+        }
+        assert _volume_mesh_sizes(None, ["steel"]) is None
+
+    @pytest.mark.parametrize("processes", [None, 2])
+    def test_mesh_sizes_for_unknown_volumes(self, tmp_path, processes):
+        """Checks that mesh sizes for volume tags that are not in the Brep
+        file raise an error naming the unknown volume tags"""
+
+        with pytest.raises(ValueError, match=r"\[3, 7\]"):
+            brep_to_h5m(
+                brep_filename="tests/test_two_sep_cubes.brep",
+                material_tags=["mat1", "mat2"],
+                h5m_filename=tmp_path / "dagmc.h5m",
+                mesh_sizes={1: 5, 3: 5, 7: 5},
+                processes=processes,
+            )
+
+    def test_tolerance_limits_the_deviation_from_the_cad(self, tmp_path):
+        """Checks that meshing a sphere with a tolerance reports a deviation
+        below the tolerance and that a tighter tolerance needs more
+        triangles"""
+
+        import gmsh
+
+        gmsh.initialize()
+        gmsh.model.occ.addSphere(0, 0, 0, 10)
+        gmsh.model.occ.synchronize()
+        gmsh.write(str(tmp_path / "sphere.brep"))
+        gmsh.finalize()
+
+        triangles = []
+        for tolerance in [0.1, 0.01]:
+            events = []
+            surface_mesh = mesh_brep(
+                brep_filename=str(tmp_path / "sphere.brep"),
+                min_mesh_size=0.01,
+                max_mesh_size=100,
+                tolerance=tolerance,
+                progress_callback=events.append,
+            )
+            report = [
+                event
+                for event in events
+                if event["stage"] == "tolerance" and event["status"] == "finished"
+            ][0]
+            assert 0 < report["max_deviation"] <= tolerance
+            assert report["volume_deviations"] == {1: report["max_deviation"]}
+            triangles.append(surface_mesh.number_of_triangles)
+
+        assert triangles[0] < triangles[1]
+
+    def test_tolerance_with_the_default_mesh_sizes(self, tmp_path):
+        """Checks that the default min_mesh_size, which is larger than the
+        default max_mesh_size, does not stop the tolerance being reached"""
+
+        import gmsh
+
+        gmsh.initialize()
+        gmsh.model.occ.addSphere(0, 0, 0, 10)
+        gmsh.model.occ.synchronize()
+        gmsh.write(str(tmp_path / "sphere.brep"))
+        gmsh.finalize()
+
+        events = []
+        mesh_brep(
+            brep_filename=str(tmp_path / "sphere.brep"),
+            tolerance=0.1,
+            progress_callback=events.append,
+        )
+        report = [
+            event
+            for event in events
+            if event["stage"] == "tolerance" and event["status"] == "finished"
+        ][0]
+        assert 0 < report["max_deviation"] <= 0.1
+
+    def test_tolerance_in_parallel_reports_the_deviations(self):
+        """Checks that the deviations measured by the worker processes are
+        reported when meshing in parallel"""
+
+        events = []
+        mesh_brep(
+            brep_filename="tests/test_two_sep_cubes.brep",
+            min_mesh_size=0.01,
+            max_mesh_size=100,
+            tolerance=0.1,
+            processes=2,
+            progress_callback=events.append,
+        )
+        report = [
+            event
+            for event in events
+            if event["stage"] == "mesh_in_parallel" and event["status"] == "finished"
+        ][0]
+        assert set(report["volume_deviations"]) == {1, 2}
+        assert report["max_deviation"] <= 0.1
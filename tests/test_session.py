@@ -0,0 +1,71 @@
+import gmsh
+import numpy as np
+from brep_to_h5m import ConversionPool, gmsh_session, mesh_brep
+
+
+def test_conversions_in_a_session_match_separate_conversions():
+    """Checks that Gmsh stays initialized in a session and that the options
+    of one conversion, such as a tolerance, do not change the next"""
+
+    separate = mesh_brep(
+        brep_filename="tests/test_brep_file.brep", min_mesh_size=5, max_mesh_size=10
+    )
+    assert not gmsh.isInitialized()
+
+    with gmsh_session():
+        mesh_brep(
+            brep_filename="tests/one_cube.brep",
+            min_mesh_size=1,
+            max_mesh_size=5,
+            tolerance=0.01,
+            num_threads=1,
+        )
+        assert gmsh.isInitialized()
+        in_session = mesh_brep(
+            brep_filename="tests/test_brep_file.brep",
+            min_mesh_size=5,
+            max_mesh_size=10,
+        )
+        assert gmsh.isInitialized()
+
+    assert not gmsh.isInitialized()
+    assert in_session.volume_surfaces == separate.volume_surfaces
+    assert np.allclose(in_session.vertices, separate.vertices)
+    for surface, triangles in separate.surface_triangles.items():
+        assert np.array_equal(in_session.surface_triangles[surface], triangles)
+
+
+def test_session_without_terminal_output():
+    """Checks that the terminal setting of a session is kept for each
+    conversion rather than being switched back on"""
+
+    with gmsh_session(terminal=False):
+        mesh_brep(brep_filename="tests/one_cube.brep", min_mesh_size=1, max_mesh_size=5)
+        assert gmsh.option.getNumber("General.Terminal") == 0
+
+
+def test_conversion_pool(tmp_path):
+    """Checks that a pool of warm workers converts several Brep files"""
+
+    jobs = [
+        {
+            "brep_filename": brep_filename,
+            "material_tags": material_tags,
+            "h5m_filename": str(tmp_path / f"{n}.h5m"),
+        }
+        for n, (brep_filename, material_tags) in enumerate(
+            [
+                ("tests/one_cube.brep", ["mat1"]),
+                ("tests/test_two_joined_cubes.brep", ["mat1", "mat2"]),
+                ("tests/one_cube.brep", ["mat2"]),
+            ]
+        )
+    ]
+
+    with ConversionPool(workers=2) as pool:
+        h5m_filenames = pool.map(jobs)
+        surface_mesh = pool.submit_mesh(brep_filename="tests/one_cube.brep").result()
+
+    assert h5m_filenames == [job["h5m_filename"] for job in jobs]
+    assert all((tmp_path / f"{n}.h5m").is_file() for n in range(3))
+    assert surface_mesh.volumes == [1]
@@ -0,0 +1,83 @@
+import numpy as np
+import trimesh
+from brep_to_h5m import SurfaceMesh, mesh_brep
+from brep_to_h5m.validate import summarise_report, validate_surface_mesh
+
+
+def _sphere_mesh():
+    """Makes a surface mesh of a sphere split into two surfaces"""
+
+    sphere = trimesh.creation.icosphere(subdivisions=3)
+
+    return SurfaceMesh(
+        vertices=sphere.vertices,
+        surface_triangles={1: sphere.faces[:100], 2: sphere.faces[100:]},
+        volume_surfaces={1: [1, 2]},
+    )
+
+
+def test_closed_mesh_is_valid():
+    """Checks that no problems are found on a closed mesh"""
+
+    report = validate_surface_mesh(_sphere_mesh())
+
+    assert report["valid"]
+    assert all(count == 0 for count in summarise_report(report).values())
+
+
+def test_meshed_brep_is_valid():
+    """Checks that the mesh of a Brep file with shared surfaces is valid"""
+
+    surface_mesh = mesh_brep(
+        brep_filename="tests/test_brep_file.brep", min_mesh_size=5, max_mesh_size=10
+    )
+
+    assert validate_surface_mesh(surface_mesh)["valid"]
+
+
+def test_open_edges_and_duplicates_are_found():
+    """Checks that a hole, a duplicate vertex and a degenerate triangle are
+    reported with their ids"""
+
+    surface_mesh = _sphere_mesh()
+    vertices = np.vstack([surface_mesh.vertices, surface_mesh.vertices[:1]])
+    surface_mesh = SurfaceMesh(
+        vertices=vertices,
+        surface_triangles={
+            1: surface_mesh.surface_triangles[1][1:],
+            2: np.vstack([surface_mesh.surface_triangles[2], [[0, 0, 1]]]),
+        },
+        volume_surfaces={1: [1, 2]},
+    )
+
+    report = validate_surface_mesh(surface_mesh)
+
+    assert not report["valid"]
+    assert list(report["open_edges"]) == [1]
+    assert report["duplicate_vertices"] == [[0, len(vertices) - 1]]
+    assert report["degenerate_triangles"] == {
+        2: [len(surface_mesh.surface_triangles[2]) - 1]
+    }
+
+
+def test_wrong_surface_sense_is_found():
+    """Checks that a surface wound the wrong way relative to its neighbour
+    is reported"""
+
+    surface_mesh = _sphere_mesh()
+    surface_mesh = SurfaceMesh(
+        vertices=surface_mesh.vertices,
+        surface_triangles={
+            1: surface_mesh.surface_triangles[1][:, ::-1],
+            2: surface_mesh.surface_triangles[2],
+        },
+        volume_surfaces={1: [1, 2]},
+        surface_senses={1: (1, 0), 2: (1, 0)},
+    )
+
+    report = validate_surface_mesh(surface_mesh)
+
+    assert not report["valid"]
+    assert report["open_edges"] == {}
+    assert len(report["inconsistent_edges"][1]) > 0
+    assert report["inconsistent_surfaces"] == {1: [1, 2]}